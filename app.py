@@ -1,28 +1,52 @@
+import asyncio
+import hmac
+import logging
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+# before the rag imports: their settings (LOG_LEVEL, LOG_FORMAT, ...) are read from the
+# environment when the modules load
+load_dotenv()
+
 from fastapi import FastAPI
 from fastapi import Request
+from rag import metrics, retriever
+from rag.logs import fields, setup_logging, stop_logging
 from rag.router import router
+from rag.chatlog import chat_logger
+from rag.warmup import state as warmup_state, warm_up
 from fastapi.staticfiles import StaticFiles
-from dotenv import load_dotenv
-from fastapi.responses import JSONResponse
-
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
-from slowapi.util import get_remote_address
-from slowapi import _rate_limit_exceeded_handler
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-
-from rag.limits import limiter
+from rag.limits import RateLimitExceeded, limiter, retry_after_header
 
 import os
-print("DATABASE_URL exists:", bool(os.getenv("DATABASE_URL")), flush=True)
-
 
-load_dotenv()
+# JSON logs through a background writer (rag/logs.py); before anything below logs
+setup_logging()
+log = logging.getLogger("rag.app")
+log.info("config", extra=fields(database_url=bool(os.getenv("DATABASE_URL"))))
 
 from fastapi.middleware.cors import CORSMiddleware
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # preload index/docs and open OpenAI connections before the first /ask arrives
+    await warm_up()
+    if chat_logger.enabled:
+        chat_logger.start()
+    # pick up newly published index versions (index/CURRENT) without a restart
+    watcher = asyncio.create_task(retriever.watch_index())
+    yield
+    watcher.cancel()
+    chat_logger.stop()
+    stop_logging()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     swagger_ui_parameters={
         "tryItOutEnabled": True,
         # optional but nice:
@@ -30,9 +54,8 @@ app = FastAPI(
     }
 )
 
+# token-bucket limits shared across workers (RATE_LIMIT_STORAGE, see rag/limits.py)
 app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-app.add_middleware(SlowAPIMiddleware)
 
 # Use proxy-aware IP detection
 def real_ip(request: Request) -> str:
@@ -74,6 +97,7 @@ async def rate_limit_handler(request, exc):
     return JSONResponse(
         status_code=429,
         content={"error": "Too many requests. Please try again in a minute."},
+        headers=retry_after_header(exc),
     )
 
 
@@ -83,4 +107,46 @@ def root():
 
 @app.get("/health")
 def health():
+    # liveness: the process is up
     return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    # readiness: index loaded (see rag/warmup.py); point the platform health check here
+    body = {
+        "status": "ready" if warmup_state["ready"] else "starting",
+        "startup_ms": warmup_state["startup_ms"],
+        "index_version": retriever.index_version() if warmup_state["ready"] else None,
+    }
+    if not warmup_state["ready"]:
+        body["errors"] = warmup_state["errors"]
+    return JSONResponse(body, status_code=200 if warmup_state["ready"] else 503)
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+@app.get("/metrics")
+def metrics_endpoint(request: Request, format: str = "prometheus"):
+    # Prometheus scrape target; set METRICS_TOKEN to require "Authorization: Bearer <token>"
+    if METRICS_TOKEN:
+        auth = request.headers.get("authorization") or ""
+        if not hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}"):
+            return JSONResponse({"error": "Forbidden"}, status_code=403)
+    if format == "json":
+        # p50/p95/p99 per stage and per route path, estimated from the histogram buckets
+        return metrics.stage_summary()
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+@app.post("/admin/reload-index")
+async def reload_index(request: Request, force: bool = False):
+    # manual hot reload after publishing a new index version; disabled unless ADMIN_TOKEN is set
+    token = request.headers.get("x-admin-token") or ""
+    if not ADMIN_TOKEN or not hmac.compare_digest(token, ADMIN_TOKEN):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    try:
+        result = await asyncio.to_thread(retriever.reload_index, force)
+    except Exception as e:
+        log.error("index reload failed: %r", e)
+        return JSONResponse({"error": "Reload failed", "detail": str(e)}, status_code=500)
+    return result
@@ -0,0 +1,285 @@
+# bench/bench_ask.py
+# Retrieval quality, per-stage latency and /ask throughput, written to one JSON report.
+#
+#   python bench/bench_ask.py --mock --json report.json                  # offline: mock API + throwaway index
+#   OPENAI_API_KEY=... python bench/bench_ask.py --json report.json      # real API, index/CURRENT
+#   python bench/bench_ask.py --url http://127.0.0.1:8000 --concurrency 1 8 32   # load a running server too
+#
+# --mock starts bench/mock_openai.py on a free port and builds DATA_DIR into a temp INDEX_DIR with
+# it (mock vectors are not comparable with the committed index). It also disables the answer,
+# semantic and embedding caches so every request pays for every stage.
+#
+# retrieval  bench/questions.jsonl: recall@k (a top-k chunk comes from the expected source),
+#            MRR of the first such chunk, answer_hit@k (a top-k chunk contains an expected string)
+# stages     per question, in-process: normalize, embed, search, route, llm, format (ms)
+# load       /ask at each --concurrency level: req/s, latency percentiles, status codes;
+#            in-process through the ASGI app unless --url is given
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+QUESTIONS = Path(__file__).resolve().parent / "questions.jsonl"
+MOCK = Path(__file__).resolve().parent / "mock_openai.py"
+
+
+def load_questions() -> list:
+    qs = [json.loads(line) for line in QUESTIONS.read_text(encoding="utf-8").splitlines() if line.strip()]
+    for q in qs:
+        src = q.get("source") or []
+        q["sources"] = {src} if isinstance(src, str) else set(src)
+    return qs
+
+
+def pct(values: list, p: float) -> float | None:
+    if not values:
+        return None
+    s = sorted(values)
+    return round(s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))], 2)
+
+
+def summarize(values: list) -> dict:
+    return {
+        "n": len(values),
+        "mean": round(sum(values) / len(values), 2) if values else None,
+        "p50": pct(values, 50),
+        "p95": pct(values, 95),
+        "max": round(max(values), 2) if values else None,
+    }
+
+
+# -----------------------------
+# Offline mode
+# -----------------------------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock(latency: float, tmp: Path) -> subprocess.Popen:
+    """Mock API + a fresh index built with it; points this process's env at both."""
+    port = _free_port()
+    mock = subprocess.Popen(
+        [sys.executable, str(MOCK), "--port", str(port), "--latency", str(latency)],
+        stdout=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}/v1"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{base}/models", timeout=1).read()
+            break
+        except OSError:
+            time.sleep(0.1)
+    else:
+        mock.kill()
+        raise RuntimeError("mock API did not start")
+
+    os.environ.update({
+        "OPENAI_API_KEY": "mock",
+        "OPENAI_BASE_URL": base,
+        "INDEX_DIR": str(tmp / "index"),
+        "VECTOR_STORE_DIR": str(tmp / "vectors"),
+        "ANSWER_CACHE_SIZE": "0",
+        "SEMANTIC_CACHE_SIZE": "0",
+        "EMBED_CACHE_SIZE": "0",
+        "EMBED_CACHE_PATH": "",
+        "INDEX_WATCH_INTERVAL": "0",
+        "DATABASE_URL": "",
+        "WARMUP_CONNECT": "0",
+    })
+    # hashed bag-of-words cosines run lower than real embeddings
+    os.environ.setdefault("MIN_SIMILARITY", "0.1")
+    build = subprocess.run(
+        [sys.executable, "-m", "rag.build_index_openai"],
+        cwd=ROOT, env=os.environ.copy(), capture_output=True, text=True,
+    )
+    if build.returncode != 0:
+        mock.kill()
+        raise RuntimeError(f"index build failed:\n{build.stdout}\n{build.stderr}")
+    return mock
+
+
+# -----------------------------
+# Retrieval quality + stage latency (in-process)
+# -----------------------------
+
+def _source(hit: dict) -> str:
+    meta = hit.get("meta") or {}
+    if meta.get("source"):
+        return meta["source"]
+    text = hit.get("text", "")
+    # builder label: "[<file> | <heading or chunk n>]"
+    return text[1:text.index(" | ")] if text.startswith("[") and " | " in text else ""
+
+
+async def evaluate(questions: list, k: int, with_llm: bool) -> tuple[dict, dict]:
+    from rag import retriever
+    from rag.llm import ask_llm_async
+    from rag.router import _finish_llm_answer
+    from rag.routing.policy import (
+        route_arrival,
+        route_early,
+        route_intake,
+        route_policy_static,
+        route_requirement_or_suitability,
+    )
+
+    await asyncio.to_thread(retriever._load_resources)
+    stages: dict = {s: [] for s in ("normalize", "embed", "search", "route", "llm", "format")}
+    found, rr, answer_hits, per_question = 0, 0.0, 0, []
+
+    for item in questions:
+        q = item["q"]
+        t0 = time.perf_counter()
+        normalized = retriever._normalize_query_for_retrieval(q)
+        t1 = time.perf_counter()
+        vec = await retriever._embed_query_async(normalized)
+        t2 = time.perf_counter()
+        hits = retriever._search(vec, k, q)
+        t3 = time.perf_counter()
+        routed = (
+            route_early(q) or route_intake(q) or route_policy_static(q)
+            or route_arrival(q, hits) or route_requirement_or_suitability(q, hits)
+        )
+        t4 = time.perf_counter()
+        stages["normalize"].append((t1 - t0) * 1000)
+        stages["embed"].append((t2 - t1) * 1000)
+        stages["search"].append((t3 - t2) * 1000)
+        stages["route"].append((t4 - t3) * 1000)
+        if with_llm and not routed:
+            answer, followups, answerable = await ask_llm_async(q, hits)
+            t5 = time.perf_counter()
+            _finish_llm_answer(q, answer, followups, answerable)
+            t6 = time.perf_counter()
+            stages["llm"].append((t5 - t4) * 1000)
+            stages["format"].append((t6 - t5) * 1000)
+
+        rank = next((r for r, h in enumerate(hits, 1) if _source(h) in item["sources"]), None)
+        if rank:
+            found += 1
+            rr += 1.0 / rank
+        hit = any(e in h["text"] for h in hits for e in item.get("expect", []))
+        answer_hits += hit
+        per_question.append({
+            "q": q, "rank": rank, "answer_hit": hit,
+            "top_sources": [_source(h) for h in hits[:3]], "routed": bool(routed),
+        })
+
+    n = len(questions)
+    retrieval = {
+        "questions": n,
+        f"recall@{k}": round(found / n, 3),
+        "mrr": round(rr / n, 3),
+        f"answer_hit@{k}": round(answer_hits / n, 3),
+        "misses": [p for p in per_question if not p["rank"]],
+    }
+    return retrieval, {s: summarize(v) for s, v in stages.items()}
+
+
+# -----------------------------
+# /ask throughput
+# -----------------------------
+
+async def load_test(questions: list, concurrency: int, requests: int, url: str | None) -> dict:
+    import httpx
+
+    if url:
+        client = httpx.AsyncClient(base_url=url, timeout=60)
+    else:
+        import logging
+        from app import app
+        logging.getLogger("rag").setLevel(logging.WARNING)  # keep the report readable; errors still show
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    latencies: list = []
+    statuses: dict = {}
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        for i in counter:
+            q = questions[i % len(questions)]["q"]
+            # one client IP per request so the per-IP rate limit doesn't turn the run into 429s
+            headers = {"X-Forwarded-For": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}"}
+            t0 = time.perf_counter()
+            try:
+                r = await client.post("/ask", json={"question": q}, headers=headers)
+                status = str(r.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - t0) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    t0 = time.perf_counter()
+    async with client:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "seconds": round(elapsed, 2),
+        "rps": round(requests / elapsed, 2),
+        "latency_ms": {**summarize(latencies), "p99": pct(latencies, 99)},
+        "status": statuses,
+    }
+
+
+async def run(args, questions: list) -> dict:
+    from rag import retriever
+
+    report: dict = {"started": time.strftime("%Y-%m-%dT%H:%M:%S"), "mock": args.mock, "k": args.k}
+    if not args.skip_quality:
+        report["retrieval"], report["stages"] = await evaluate(questions, args.k, not args.no_llm)
+        report["index_version"] = retriever.index_version()
+        report["hybrid"] = retriever.HYBRID
+        print(json.dumps({"retrieval": {k: v for k, v in report["retrieval"].items() if k != "misses"}}))
+        print(json.dumps({"stages_p50_ms": {s: v["p50"] for s, v in report["stages"].items()}}))
+    report["load"] = []
+    for c in args.concurrency:
+        r = await load_test(questions, c, args.requests, args.url)
+        report["load"].append(r)
+        print(json.dumps({"load": r}))
+    return report
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("-k", type=int, default=6, help="top_k, as in /ask")
+    p.add_argument("--mock", action="store_true", help="run against bench/mock_openai.py and a temp index")
+    p.add_argument("--mock-latency", type=float, default=0.05, help="seconds per mock API request")
+    p.add_argument("--url", help="load-test this server instead of the in-process app")
+    p.add_argument("--concurrency", type=int, nargs="*", default=[1, 4, 16])
+    p.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    p.add_argument("--no-llm", action="store_true", help="skip the llm/format stages in the quality pass")
+    p.add_argument("--skip-quality", action="store_true", help="load test only")
+    p.add_argument("--json", help="write the report to this file")
+    args = p.parse_args()
+
+    questions = load_questions()
+    with contextlib.ExitStack() as stack:
+        if args.mock:
+            tmp = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="bench-ask-")))
+            mock = start_mock(args.mock_latency, tmp)
+            stack.callback(mock.kill)
+        report = asyncio.run(run(args, questions))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# bench/bench_chunking.py
+# Fixed character windows vs the structure-aware chunker (rag/chunking.py).
+#
+#   OPENAI_API_KEY=... python bench/bench_chunking.py            # real embeddings
+#   python bench/mock_openai.py & OPENAI_API_KEY=x OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python bench/bench_chunking.py
+#
+# For each chunker: chunk DATA_DIR, embed, and run bench/questions.jsonl through top-k search.
+# Reports hit@k (a top-k chunk contains an expected answer string), MRR, the prompt tokens
+# _build_user_prompt would send for those k chunks, and how many chunk edges cut a line in two.
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import faiss
+import numpy as np
+from openai import OpenAI
+
+from rag.build_index_openai import EMBED_MODEL, iter_sources
+from rag.chunking import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, chunk_document, chunk_label, fixed_chunks
+from rag.embed_pipeline import EmbedPipeline
+from rag.llm import _build_user_prompt
+from rag.retriever import _normalize_query_for_retrieval
+from rag.tokens import count_tokens
+
+QUESTIONS = Path(__file__).resolve().parent / "questions.jsonl"
+
+
+def build(client: OpenAI, chunker) -> tuple[list, list, faiss.IndexFlatIP]:
+    texts, chunks = [], []
+    for fname, text in iter_sources():
+        for i, c in enumerate(chunker(text, fname), start=1):
+            chunks.append((c, text))
+            texts.append(f"{chunk_label(c, i)}\n{c.text}")
+    vecs: list = []
+    pipeline = EmbedPipeline(client, EMBED_MODEL, lambda keys, v: vecs.append(v))
+    for i, t in enumerate(texts):
+        pipeline.add(i, t)
+    pipeline.close()
+    index = faiss.IndexFlatIP(vecs[0].shape[1])
+    index.add(np.vstack(vecs))
+    return texts, chunks, index
+
+
+def split_lines(chunks: list) -> int:
+    """Chunk edges that fall inside a line of the source text."""
+    n = 0
+    for c, text in chunks:
+        if c.start > 0 and text[c.start - 1] != "\n":
+            n += 1
+        if c.end < len(text) and text[c.end] != "\n" and text[c.end - 1] != "\n":
+            n += 1
+    return n
+
+
+def evaluate(client: OpenAI, name: str, chunker, questions: list, k: int) -> dict:
+    texts, chunks, index = build(client, chunker)
+    qs = [_normalize_query_for_retrieval(q["q"]) for q in questions]
+    resp = client.embeddings.create(model=EMBED_MODEL, input=qs)
+    qv = np.array([d.embedding for d in resp.data], dtype="float32")
+    faiss.normalize_L2(qv)
+    _, ids = index.search(qv, k)
+
+    hits, rr, prompt_tokens = 0, 0.0, []
+    for q, row in zip(questions, ids):
+        retrieved = [texts[i] for i in row if i >= 0]
+        rank = next((r for r, t in enumerate(retrieved, 1) if any(e in t for e in q["expect"])), None)
+        if rank:
+            hits += 1
+            rr += 1.0 / rank
+        prompt = _build_user_prompt(q["q"], [{"text": t} for t in retrieved]) or ""
+        prompt_tokens.append(count_tokens(prompt))
+
+    sizes = [count_tokens(t) for t in texts]
+    return {
+        "chunker": name,
+        "chunks": len(texts),
+        "avg_chunk_tokens": round(float(np.mean(sizes)), 1),
+        "split_lines": split_lines(chunks),
+        f"hit@{k}": round(hits / len(questions), 3),
+        "mrr": round(rr / len(questions), 3),
+        "prompt_tokens_avg": round(float(np.mean(prompt_tokens)), 1),
+    }
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("-k", type=int, default=6, help="top_k, as in retrieve_context")
+    p.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS)
+    p.add_argument("--json", help="write results to this file")
+    args = p.parse_args()
+
+    questions = [json.loads(line) for line in QUESTIONS.read_text(encoding="utf-8").splitlines() if line.strip()]
+    client = OpenAI()
+    chunkers = {
+        "fixed-900/150": lambda text, src: fixed_chunks(text, src, 900, 150),
+        f"structure-{args.chunk_tokens}": lambda text, src: chunk_document(
+            text, src, args.chunk_tokens, CHUNK_OVERLAP_TOKENS
+        ),
+    }
+    results = []
+    for name, chunker in chunkers.items():
+        r = evaluate(client, name, chunker, questions, args.k)
+        results.append(r)
+        print(json.dumps(r))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
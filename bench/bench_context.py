@@ -0,0 +1,80 @@
+# bench/bench_context.py
+# Prompt context packing (rag/context.py): tokens sent vs answer strings kept, per budget.
+#
+#   python bench/bench_context.py                          # INDEX_DIR/CURRENT, budgets 400..1600 + unlimited
+#   python bench/bench_context.py --budgets 600 800 --k 8  # other budgets / more retrieved chunks
+#
+# For every question in bench/questions.jsonl the top-k chunks are retrieved once (vector or
+# hybrid; BM25 only if the embeddings API is unreachable) and packed at each budget.
+#   sent       mean context tokens sent (chat tokenizer; ~4 chars/token without tiktoken)
+#   saved_pct  share of the retrieved chunks' tokens not sent (merged overlap + budget)
+#   answer_hit share of questions whose packed context still contains an expected string
+# "clip" is the packing this replaced: every chunk whole up to 800 characters.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+QUESTIONS = Path(__file__).resolve().parent / "questions.jsonl"
+CLIP_CHARS = 800
+
+
+def _hit(text: str, expect: list) -> bool:
+    return any(e in text for e in expect)
+
+
+async def retrieve(questions: list, k: int) -> list:
+    from rag import retriever
+
+    await asyncio.to_thread(retriever._load_resources)
+    out = []
+    for item in questions:
+        hits, _ = await retriever.retrieve_context_with_vector_async(item["q"], top_k=k)
+        out.append(hits or [])
+    return out
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--budgets", type=int, nargs="+", default=[400, 600, 800, 1000, 1200, 1600, 0])
+    p.add_argument("--k", type=int, default=6, help="chunks retrieved per question (the router uses 6)")
+    args = p.parse_args()
+
+    from rag.context import chunk_text, pack_context
+    from rag.tokens import count_tokens
+
+    questions = [json.loads(line) for line in QUESTIONS.read_text(encoding="utf-8").splitlines() if line.strip()]
+    retrieved = asyncio.run(retrieve(questions, args.k))
+    n = len(questions)
+
+    clip = [("\n\n".join(chunk_text(c).strip()[:CLIP_CHARS] for c in hits)) for hits in retrieved]
+    rows = {"clip": {
+        "sent": round(sum(count_tokens(t, chat=True) for t in clip) / n, 1),
+        "answer_hit": round(sum(_hit(t, q.get("expect", [])) for t, q in zip(clip, questions)) / n, 3),
+    }}
+    for budget in args.budgets:
+        sent = raw = hits_kept = overlap = dropped = 0
+        for item, hits in zip(questions, retrieved):
+            text, stats = pack_context(hits, budget=budget)
+            sent += stats["sent"]
+            raw += stats["raw"]
+            overlap += stats["overlap"]
+            dropped += stats["dropped"]
+            hits_kept += _hit(text, item.get("expect", []))
+        rows[str(budget or "unlimited")] = {
+            "sent": round(sent / n, 1),
+            "saved_pct": round(100 * (1 - sent / raw), 1) if raw else 0.0,
+            "overlap": round(overlap / n, 1),
+            "dropped": round(dropped / n, 1),
+            "answer_hit": round(hits_kept / n, 3),
+        }
+    print(json.dumps({"questions": n, "k": args.k, "budgets": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
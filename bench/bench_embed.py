@@ -0,0 +1,67 @@
+# bench/bench_embed.py
+# Embedding throughput of rag/embed_pipeline.py at different concurrency levels.
+#
+#   python bench/mock_openai.py --latency 0.3 --max-concurrent 8 &
+#   OPENAI_API_KEY=x OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python bench/bench_embed.py --concurrency 1 2 4 8 16
+#
+# Chunks come from DATA_DIR (same chunking as the builder), repeated --repeat times with a
+# salt so every pass misses any cache. Prints chunks/s, requests and retries per level.
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from openai import OpenAI
+
+from rag.build_index_openai import EMBED_MODEL, iter_chunks, iter_sources
+from rag.embed_pipeline import EMBED_BATCH_TOKENS, EmbedPipeline
+
+
+def load_chunks(repeat: int) -> list:
+    base = [c.text for fname, text in iter_sources() for c in iter_chunks(fname, text)]
+    return [f"[pass {r}] {c}" for r in range(repeat) for c in base]
+
+
+def run(client: OpenAI, chunks: list, concurrency: int, max_tokens: int) -> dict:
+    order: list = []
+    pipeline = EmbedPipeline(
+        client, EMBED_MODEL, lambda keys, vecs: order.extend(keys),
+        concurrency=concurrency, max_tokens=max_tokens,
+    )
+    t0 = time.time()
+    for i, c in enumerate(chunks):
+        pipeline.add(i, c)
+    pipeline.close()
+    elapsed = time.time() - t0
+    assert order == list(range(len(chunks))), "results were not delivered in submission order"
+    return {"concurrency": concurrency, "seconds": round(elapsed, 2),
+            "chunks_per_s": round(len(chunks) / elapsed, 1), **pipeline.stats()}
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.add_argument("--repeat", type=int, default=10)
+    p.add_argument("--batch-tokens", type=int, default=EMBED_BATCH_TOKENS)
+    p.add_argument("--json", help="write results to this file")
+    args = p.parse_args()
+
+    client = OpenAI()
+    chunks = load_chunks(args.repeat)
+    print(f"{len(chunks)} chunks, batch<={args.batch_tokens} tokens")
+    results = []
+    for n in args.concurrency:
+        r = run(client, chunks, n, args.batch_tokens)
+        results.append(r)
+        print(json.dumps(r))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
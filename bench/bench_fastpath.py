@@ -0,0 +1,143 @@
+# bench/bench_fastpath.py
+# Extractive fast path (rag/extractive.fact_answer): how many questions skip the chat model, and are they right.
+#
+#   python bench/bench_fastpath.py                                  # INDEX_DIR/CURRENT, thresholds from env
+#   python bench/bench_fastpath.py --scores 0.4 0.5 --coverages 0.6 0.75 1.0   # threshold grid
+#   python bench/bench_fastpath.py --offline                        # golden check only, no API
+#
+# golden  bench/fastpath_golden.jsonl, offline: each question gets the committed index's chunks
+#         holding the given strings, in that order, with fixed scores (0.7, 0.65, ...); the fast
+#         path must answer with an expected string, or decline where "expect" is empty; where
+#         "fallback" is given, the budget fallback (extractive_answer) must quote one of those too
+# For every question in bench/questions.jsonl the router's chunks are retrieved once and the
+# fast path is tried at each (FASTPATH_MIN_SCORE, FASTPATH_MIN_COVERAGE) pair.
+#   fired      questions answered without the chat model (all of them, not only "fact" intent)
+#   correct    fired answers containing an expected string
+#   precision  correct / fired; a wrong fast answer costs more than a model call, keep this at 1.0
+# Exits 1 on a golden mismatch, or when a fired answer at the configured thresholds misses every
+# expected string.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+ROOT = Path(__file__).resolve().parents[1]
+QUESTIONS = Path(__file__).resolve().parent / "questions.jsonl"
+GOLDEN = Path(__file__).resolve().parent / "fastpath_golden.jsonl"
+GOLDEN_SCORES = (0.7, 0.65, 0.6, 0.55)
+
+
+def golden_chunks(golden: list, index_dir: Path) -> list:
+    """Per golden question, the chunks holding its "chunks" strings (first match each) with fixed scores."""
+    from rag.index_versions import CHUNKS_NAME, current_dir
+    from rag.store import ChunkStore
+
+    docs = ChunkStore(current_dir(index_dir) / CHUNKS_NAME)
+    texts = [docs[i] for i in range(len(docs))]
+    out = []
+    for item in golden:
+        hits = []
+        for rank, needle in enumerate(item["chunks"]):
+            cid = next((i for i, t in enumerate(texts) if needle in t), None)
+            if cid is None:
+                raise SystemExit(f"golden chunk not in {index_dir}: {needle!r}")
+            hits.append({"id": cid, "text": texts[cid], "score": GOLDEN_SCORES[rank]})
+        out.append(hits)
+    return out
+
+
+def check(golden: list, retrieved: list) -> int:
+    """
+    Golden mismatches at the configured thresholds: a wrong answer, firing where it should decline,
+    or a budget fallback missing the row it should quote.
+    """
+    from rag import extractive
+
+    bad = 0
+    for item, hits in zip(golden, retrieved):
+        fact = extractive.fact_answer(item["q"], hits)
+        answer = fact[0] if fact else None
+        ok = any(e in answer for e in item["expect"]) if answer else not item["expect"]
+        if not ok:
+            bad += 1
+            print(json.dumps({"q": item["q"], "expect": item["expect"], "got": answer}, ensure_ascii=False))
+        if item.get("fallback"):
+            fallback = extractive.extractive_answer(item["q"], hits) or ""
+            if not any(e in fallback for e in item["fallback"]):
+                bad += 1
+                print(json.dumps({"q": item["q"], "fallback": item["fallback"], "got": fallback}, ensure_ascii=False))
+    return bad
+
+
+async def retrieve(questions: list, k: int) -> list:
+    from rag import retriever
+
+    await asyncio.to_thread(retriever._load_resources)
+    out = []
+    for item in questions:
+        hits, _ = await retriever.retrieve_context_with_vector_async(item["q"], top_k=k)
+        out.append(hits or [])
+    return out
+
+
+def run(questions: list, retrieved: list) -> dict:
+    from rag.routing.policy import route_fact
+
+    fired, correct, wrong = 0, 0, []
+    for item, hits in zip(questions, retrieved):
+        fact = route_fact(item["q"], hits)
+        if fact is None:
+            continue
+        fired += 1
+        if any(e in fact[0] for e in item.get("expect", [])):
+            correct += 1
+        else:
+            wrong.append({"q": item["q"], "answer": fact[0]})
+    return {
+        "fired": fired,
+        "correct": correct,
+        "precision": round(correct / fired, 3) if fired else None,
+        "wrong": wrong,
+    }
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--scores", type=float, nargs="+", default=None, help="FASTPATH_MIN_SCORE values")
+    p.add_argument("--coverages", type=float, nargs="+", default=None, help="FASTPATH_MIN_COVERAGE values")
+    p.add_argument("--k", type=int, default=6, help="chunks retrieved per question (the router uses 6)")
+    p.add_argument("--offline", action="store_true", help="only the golden check (no embedding API)")
+    p.add_argument("--index", type=Path, default=ROOT / "index", help="index directory of the golden chunks")
+    args = p.parse_args()
+
+    from rag import extractive
+
+    golden = [json.loads(line) for line in GOLDEN.read_text(encoding="utf-8").splitlines() if line.strip()]
+    bad = check(golden, golden_chunks(golden, args.index))
+    print(json.dumps({"golden": len(golden), "mismatches": bad}))
+    if args.offline:
+        sys.exit(1 if bad else 0)
+
+    questions = [json.loads(line) for line in QUESTIONS.read_text(encoding="utf-8").splitlines() if line.strip()]
+    retrieved = asyncio.run(retrieve(questions, args.k))
+    configured = (extractive.FASTPATH_MIN_SCORE, extractive.FASTPATH_MIN_COVERAGE)
+
+    rows = {}
+    for score in args.scores or [configured[0]]:
+        for coverage in args.coverages or [configured[1]]:
+            extractive.FASTPATH_MIN_SCORE, extractive.FASTPATH_MIN_COVERAGE = score, coverage
+            rows[f"score>={score} coverage>={coverage}"] = run(questions, retrieved)
+    extractive.FASTPATH_MIN_SCORE, extractive.FASTPATH_MIN_COVERAGE = configured
+    at_configured = run(questions, retrieved)
+
+    print(json.dumps({"questions": len(questions), "k": args.k, "thresholds": rows}, indent=2, ensure_ascii=False))
+    sys.exit(1 if bad or at_configured["wrong"] else 0)
+
+
+if __name__ == "__main__":
+    main()
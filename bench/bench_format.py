@@ -0,0 +1,152 @@
+# bench/bench_format.py
+# Answer formatting (rag/formatting): single-pass formatter vs the stacked regex pipeline it replaces.
+#
+#   python bench/bench_format.py               # check bench/format_corpus.jsonl, fuzz, then time it
+#   python bench/bench_format.py --write       # re-record the expected outputs from the reference pipeline
+#   python bench/bench_format.py --fuzz 50000  # more random answers
+#
+# corpus  model answers as they come back from the chat model (bullets, inline "1. **Step**" lists,
+#         hard-wrapped paragraphs, split headings, code, tables). Each line holds the raw text and
+#         the reference outputs: format_answer_text(format_markdown_safe(raw)) and
+#         format_markdown_safe(raw). Exits 1 on any difference.
+# fuzz    random answers spliced from the corpus lines and markdown fragments, compared with the
+#         reference pipeline live; also the canned fallbacks + nudges the router appends.
+# timing  us per answer for the final formatting, the markdown-only form, and a streamed answer
+#         (the whole prefix is reformatted at every word boundary, as StreamFormatter does).
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from rag.conversion import get_conversion_nudge
+from rag.formatting.answer import format_answer, format_markdown, format_static
+from rag.formatting.markdown import format_markdown_safe
+from rag.formatting.text import format_answer_text
+from rag.routing import fallbacks as F
+
+CORPUS = Path(__file__).resolve().parent / "format_corpus.jsonl"
+
+_FRAGMENTS = [
+    "", "", "• ", "- ", "* ", "1. **", "2. ", "### ", "## ", "```", "  ", "\t", "**", ":", " the ", " in",
+    " to", " 2024.", "12. **Step**", "•", "|---|", "!", "?", "é", "\xa0",
+]
+
+
+def reference(raw: str) -> str:
+    return format_answer_text(format_markdown_safe(raw))
+
+
+def check(corpus: list) -> int:
+    bad = 0
+    for i, item in enumerate(corpus):
+        for kind, got in (("answer", format_answer(item["raw"])), ("markdown", format_markdown(item["raw"]))):
+            if got != item[kind]:
+                bad += 1
+                print(json.dumps({"item": i, "kind": kind, "want": item[kind], "got": got}, ensure_ascii=False))
+    print(json.dumps({"corpus": len(corpus), "mismatches": bad}))
+    return bad
+
+
+def _mutate(rng: random.Random, lines: list) -> str:
+    out = []
+    for _ in range(rng.randint(1, 12)):
+        line = rng.choice(lines)
+        if rng.random() < 0.5:
+            at = rng.randint(0, len(line))
+            line = line[:at] + rng.choice(_FRAGMENTS) + line[at:]
+        out.append(line)
+    return rng.choice(["\n", "\n", "\n\n", "\r\n"]).join(out)
+
+
+def fuzz(corpus: list, n: int, seed: int) -> int:
+    rng = random.Random(seed)
+    lines = [line for item in corpus for line in item["raw"].splitlines()] or [""]
+    bad = 0
+    for _ in range(n):
+        raw = _mutate(rng, lines)
+        if format_answer(raw) != reference(raw) or format_markdown(raw) != format_markdown_safe(raw):
+            bad += 1
+            if bad <= 5:
+                print(json.dumps({"fuzz": raw}, ensure_ascii=False))
+
+    # canned text the router formats through the cache, alone and with a nudge appended
+    canned = [v for k, v in vars(F).items() if k.isupper() and isinstance(v, str)]
+    nudges = {get_conversion_nudge(q, ok) for q in ("apply", "project", "fees") for ok in (True, False)}
+    answers = [item["raw"] for item in corpus if item["raw"].strip()]
+    for text in canned:
+        bad += format_static(text) != reference(text)
+        bad += format_static(text, markdown_only=True) != format_markdown_safe(text)
+        for nudge in nudges:
+            bad += f"{format_static(text)}\n\n{format_static(nudge)}" != format_answer_text(f"{text}\n\n{nudge}")
+    for raw in answers:
+        for nudge in nudges:
+            bad += f"{format_answer(raw)}\n\n{format_static(nudge)}" != format_answer_text(
+                f"{format_markdown_safe(raw)}\n\n{nudge}"
+            )
+    print(json.dumps({"fuzz": n, "canned": len(canned), "nudges": len(nudges), "mismatches": bad}))
+    return bad
+
+
+def _per_answer_us(fn, texts: list, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for t in texts:
+            fn(t)
+    return round((time.perf_counter() - t0) / (rounds * len(texts)) * 1e6, 1)
+
+
+def _streamed(fn):
+    def run(raw: str):
+        # StreamFormatter reformats the received prefix at every word boundary
+        for i, ch in enumerate(raw):
+            if ch in " \n":
+                fn(raw[:i])
+    return run
+
+
+def timing(corpus: list, rounds: int) -> dict:
+    texts = [item["raw"] for item in corpus if item["raw"].strip()]
+    streamed = max(1, rounds // 20)
+    return {
+        "answers": len(texts),
+        "avg_chars": round(sum(map(len, texts)) / len(texts)),
+        "answer_us": {"reference": _per_answer_us(reference, texts, rounds),
+                      "single_pass": _per_answer_us(format_answer, texts, rounds)},
+        "markdown_us": {"reference": _per_answer_us(format_markdown_safe, texts, rounds),
+                        "single_pass": _per_answer_us(format_markdown, texts, rounds)},
+        "streamed_answer_us": {"reference": _per_answer_us(_streamed(reference), texts, streamed),
+                               "single_pass": _per_answer_us(_streamed(format_answer), texts, streamed)},
+    }
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--write", action="store_true", help="record the reference outputs for the corpus")
+    p.add_argument("--fuzz", type=int, default=20000)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--rounds", type=int, default=200)
+    args = p.parse_args()
+
+    corpus = [json.loads(line) for line in CORPUS.read_text(encoding="utf-8").splitlines() if line.strip()]
+    if args.write:
+        with CORPUS.open("w", encoding="utf-8") as f:
+            for item in corpus:
+                raw = item["raw"]
+                row = {"raw": raw, "answer": reference(raw), "markdown": format_markdown_safe(raw)}
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        print(json.dumps({"corpus": len(corpus), "written": str(CORPUS)}))
+        return
+
+    bad = check(corpus) + fuzz(corpus, args.fuzz, args.seed)
+    print(json.dumps({"timing": timing(corpus, args.rounds)}))
+    sys.exit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench/bench_limits.py
+# Rate limiter backends (rag/limits.py): cost per check, and whether a limit holds across processes.
+#
+#   python bench/bench_limits.py                               # memory + sqlite, no network
+#   python bench/bench_limits.py --redis redis://127.0.0.1:6379/0
+#
+# cost    single-process checks/s and mean us per check on a spread of client keys
+# shared  --procs worker processes hammer ONE client key for --seconds; with a shared backend
+#         the allowed total should be ~ capacity + rate * seconds no matter how many processes
+#         (the memory backend is per process, so it allows ~procs times that)
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from rag.limits import Limit, make_backend
+
+
+def cost(url: str, n: int) -> dict:
+    backend = make_backend(url)
+    limit = Limit.parse("10/minute")
+
+    async def run() -> float:
+        t0 = time.perf_counter()
+        for i in range(n):
+            await backend.acquire(f"/ask:10.0.{i % 256}.{i // 256 % 256}", limit)
+        return time.perf_counter() - t0
+
+    elapsed = asyncio.run(run())
+    return {"backend": url.split(":")[0], "checks": n, "checks_per_s": round(n / elapsed), "us_per_check": round(elapsed / n * 1e6, 1)}
+
+
+def _worker(url: str, limit_text: str, seconds: float, start: float, out) -> None:
+    backend = make_backend(url)
+    limit = Limit.parse(limit_text)
+
+    async def run() -> int:
+        while time.time() < start:
+            await asyncio.sleep(0.001)
+        allowed = 0
+        while time.time() < start + seconds:
+            ok, _ = await backend.acquire("/ask:203.0.113.7", limit)
+            allowed += ok
+            await asyncio.sleep(0.001)
+        return allowed
+
+    out.put(asyncio.run(run()))
+
+
+def shared(url: str, procs: int, limit_text: str, seconds: float) -> dict:
+    limit = Limit.parse(limit_text)
+    out: mp.Queue = mp.Queue()
+    start = time.time() + 1.0
+    ps = [mp.Process(target=_worker, args=(url, limit_text, seconds, start, out)) for _ in range(procs)]
+    for p in ps:
+        p.start()
+    allowed = sum(out.get() for _ in ps)
+    for p in ps:
+        p.join()
+    return {
+        "backend": url.split(":")[0],
+        "procs": procs,
+        "limit": limit_text,
+        "seconds": seconds,
+        "allowed": allowed,
+        "expected": round(limit.capacity + limit.rate * seconds, 1),
+    }
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--procs", type=int, default=4)
+    p.add_argument("--seconds", type=float, default=5.0)
+    p.add_argument("--limit", default="20/10second")
+    p.add_argument("--checks", type=int, default=20000)
+    p.add_argument("--redis", help="also run against this Redis URL")
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-limits-") as tmp:
+        urls = ["memory://", f"sqlite:///{tmp}/cost.db"]
+        if args.redis:
+            urls.append(args.redis)
+        for url in urls:
+            print(json.dumps(cost(url, args.checks)))
+        urls[1] = f"sqlite:///{tmp}/shared.db"
+        for url in urls:
+            print(json.dumps(shared(url, args.procs, args.limit, args.seconds)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# bench/bench_routing.py
+# Question routing (rag/routing): golden decisions and the cost of classifying a question.
+#
+#   python bench/bench_routing.py            # check bench/routing_golden.jsonl, then time it
+#   python bench/bench_routing.py --write    # re-record the golden file from the current code
+#
+# golden  every route function's decision for each question (canned answers by fallback name),
+#         with and without retrieved context. Exits 1 on any difference, so a routing refactor
+#         can be checked against the recorded behaviour.
+# timing  us per question for the whole route chain the way /ask runs it (one intent pass,
+#         then every route), and for classify() alone next to searching every pattern in turn.
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from rag.routing import fallbacks as F
+from rag.routing.policy import (
+    is_suitability_question,
+    pick_rag_fallback,
+    route_arrival,
+    route_early,
+    route_intake,
+    route_policy_static,
+    route_requirement_or_suitability,
+)
+
+GOLDEN = Path(__file__).resolve().parent / "routing_golden.jsonl"
+
+# stand-ins for retrieved chunks: one with a hard requirement statement, one that only positions
+HARD = [{"text": "[msc_admissions.txt | Admission Requirements] Applicants must have a bachelor's degree."}]
+SOFT = [{"text": "[msc_overview.txt | Overview] The programme is open to applicants from varied backgrounds."}]
+
+_NAMES = {v: k for k, v in vars(F).items() if k.isupper() and isinstance(v, str)}
+
+
+def _label(r):
+    if r is None:
+        return None
+    if isinstance(r, tuple):
+        return [_label(x) for x in r]
+    return _NAMES.get(r, r)
+
+
+def decisions(q: str) -> dict:
+    return {
+        "early": _label(route_early(q)),
+        "intake": _label(route_intake(q)),
+        "policy_static": _label(route_policy_static(q)),
+        "arrival": [_label(route_arrival(q, HARD)), _label(route_arrival(q, []))],
+        "requirement": [
+            _label(route_requirement_or_suitability(q, HARD)),
+            _label(route_requirement_or_suitability(q, SOFT)),
+            _label(route_requirement_or_suitability(q, [])),
+        ],
+        "suitability_question": is_suitability_question(q),
+        "fallback": _label(pick_rag_fallback(q)),
+    }
+
+
+def check(golden: list) -> int:
+    bad = 0
+    for item in golden:
+        got = decisions(item["q"])
+        for route, want in item["expect"].items():
+            if got[route] != want:
+                bad += 1
+                print(json.dumps({"q": item["q"], "route": route, "want": want, "got": got[route]}))
+    print(json.dumps({"golden": len(golden), "mismatches": bad}))
+    return bad
+
+
+def _per_question_us(fn, questions: list, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for q in questions:
+            fn(q)
+    return round((time.perf_counter() - t0) / (rounds * len(questions)) * 1e6, 2)
+
+
+def timing(questions: list, rounds: int) -> dict:
+    from rag.routing.intents import INTENTS, classify
+
+    def search_all(q: str):
+        return frozenset(i.name for i in INTENTS if i.pattern.search(q))
+
+    def chain(q: str):
+        # /ask order up to the chat model, every route reading one intent set
+        intents = classify(q)
+        return (
+            route_early(q, intents) or route_intake(q, intents) or route_policy_static(q, intents)
+            or route_arrival(q, HARD, intents) or route_requirement_or_suitability(q, HARD, intents)
+            or is_suitability_question(q, intents)
+        )
+
+    diff = [q for q in questions if classify(q) != search_all(q)]
+    for q in diff:
+        print(json.dumps({"q": q, "classify": sorted(classify(q)), "search_all": sorted(search_all(q))}))
+    return {
+        "questions": len(questions),
+        "route_chain_us": _per_question_us(chain, questions, rounds),
+        "classify_us": _per_question_us(classify, questions, rounds),
+        "search_every_pattern_us": _per_question_us(search_all, questions, rounds),
+        "classify_mismatches": len(diff),
+    }
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--write", action="store_true", help="record the current decisions as the golden set")
+    p.add_argument("--rounds", type=int, default=200)
+    args = p.parse_args()
+
+    golden = [json.loads(line) for line in GOLDEN.read_text(encoding="utf-8").splitlines() if line.strip()]
+    if args.write:
+        with GOLDEN.open("w", encoding="utf-8") as f:
+            for item in golden:
+                f.write(json.dumps({"q": item["q"], "expect": decisions(item["q"])}, ensure_ascii=False) + "\n")
+        print(json.dumps({"golden": len(golden), "written": str(GOLDEN)}))
+        return
+
+    bad = check(golden)
+    t = timing([item["q"] for item in golden], args.rounds)
+    print(json.dumps({"timing": t}))
+    sys.exit(1 if bad or t["classify_mismatches"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# bench/mock_openai.py
+# Local stand-in for the OpenAI API (embeddings + chat completions) for builds and benchmarks.
+#
+#   python bench/mock_openai.py --port 8765 --latency 0.2 --max-concurrent 8 --error-rate 0.02
+#   OPENAI_API_KEY=x OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python -m rag.build_index_openai
+#
+# Embeddings are deterministic hashed bag-of-words vectors (same text -> same vector, shared
+# words -> higher cosine), so retrieval over them behaves sensibly. Requests above
+# --max-concurrent or --rpm get a 429 with Retry-After; --error-rate injects 500s.
+# GET /stats returns request counters.
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+DIM = 1536
+_WORD_RE = re.compile(r"\w+")
+
+args = None
+stats = {"embeddings": 0, "chat": 0, "inputs": 0, "rate_limited": 0, "errors": 0}
+_lock = threading.Lock()
+_active = 0
+_recent: deque = deque()  # request timestamps within the last minute
+
+
+def embed(text: str) -> list:
+    v = np.zeros(DIM, dtype="float32")
+    for w in _WORD_RE.findall(text.lower()):
+        v[int(hashlib.md5(w.encode()).hexdigest(), 16) % DIM] += 1.0
+    n = float(np.linalg.norm(v)) or 1.0
+    return (v / n).tolist()
+
+
+def _admit() -> bool:
+    global _active
+    now = time.monotonic()
+    with _lock:
+        while _recent and now - _recent[0] > 60:
+            _recent.popleft()
+        if (args.max_concurrent and _active >= args.max_concurrent) or (args.rpm and len(_recent) >= args.rpm):
+            stats["rate_limited"] += 1
+            return False
+        _active += 1
+        _recent.append(now)
+        return True
+
+
+def _release() -> None:
+    global _active
+    with _lock:
+        _active -= 1
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *a) -> None:
+        pass
+
+    def _json(self, status: int, body: dict, headers: dict | None = None) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path.endswith("/models"):
+            self._json(200, {"object": "list", "data": []})
+        else:
+            with _lock:
+                self._json(200, dict(stats))
+
+    def do_POST(self) -> None:
+        n = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(n) or b"{}")
+        if not _admit():
+            self._json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"Retry-After": "0.5"})
+            return
+        try:
+            time.sleep(args.latency)
+            if random.random() < args.error_rate:
+                with _lock:
+                    stats["errors"] += 1
+                self._json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+            elif self.path.endswith("/embeddings"):
+                self._embeddings(body)
+            else:
+                self._chat(body)
+        finally:
+            _release()
+
+    def _embeddings(self, body: dict) -> None:
+        inputs = body["input"]
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        time.sleep(args.latency_per_input * len(inputs))
+        with _lock:
+            stats["embeddings"] += 1
+            stats["inputs"] += len(inputs)
+        tokens = sum(max(1, len(t) // 4) for t in inputs)
+        self._json(200, {
+            "object": "list",
+            "model": body.get("model"),
+            "data": [{"object": "embedding", "index": i, "embedding": embed(t)} for i, t in enumerate(inputs)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _chat(self, body: dict) -> None:
+        with _lock:
+            stats["chat"] += 1
+        text = args.answer
+        usage = {"prompt_tokens": 100, "completion_tokens": max(1, len(text) // 4)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if not body.get("stream"):
+            self._json(200, {
+                "id": "mock", "object": "chat.completion", "created": 0, "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(event: dict | str) -> None:
+            line = f"data: {event if isinstance(event, str) else json.dumps(event)}\n\n".encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+
+        for i in range(0, len(text), 8):
+            send({"id": "mock", "object": "chat.completion.chunk", "created": 0, "model": body.get("model"),
+                  "choices": [{"index": 0, "delta": {"content": text[i:i + 8]}, "finish_reason": None}]})
+        send({"id": "mock", "object": "chat.completion.chunk", "created": 0, "model": body.get("model"),
+              "choices": [], "usage": usage})
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def main() -> None:
+    global args
+    p = argparse.ArgumentParser(description="Mock OpenAI API for local builds and benchmarks")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--latency", type=float, default=0.2, help="seconds per request")
+    p.add_argument("--latency-per-input", type=float, default=0.0, help="extra seconds per embedding input")
+    p.add_argument("--max-concurrent", type=int, default=0, help="429 above this many in-flight requests (0 = off)")
+    p.add_argument("--rpm", type=int, default=0, help="429 above this many requests per minute (0 = off)")
+    p.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    p.add_argument("--answer", default="The MSc EDI programme fee is listed on the fees page. • Tuition • Miscellaneous fees")
+    args = p.parse_args()
+    print(f"mock OpenAI on http://127.0.0.1:{args.port}/v1", flush=True)
+    ThreadingHTTPServer(("127.0.0.1", args.port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,12 @@
     window.EDI_CHAT_API_URL ||
     "https://msc-edi-ai-agent.onrender.com/ask";
 
+  // Streaming endpoint (Server-Sent Events). Set window.EDI_CHAT_STREAM = false to disable.
+  const STREAM_URL =
+    window.EDI_CHAT_STREAM === false
+      ? null
+      : window.EDI_CHAT_STREAM_URL || API_URL.replace(/\/ask\/?$/, "/ask/stream");
+
   const CHAT_TITLE =
     window.EDI_CHAT_TITLE ||
     "MSc EDI Programme Assistant";
@@ -322,14 +328,102 @@
   /* ============================
      Ask logic
      ============================ */
+  const RATE_LIMIT_MSG = "You’re sending questions too quickly. Please wait ~1 minute and try again.";
+
+  const addCopyTool = (row, getText) => {
+    const tools = document.createElement("div");
+    tools.className = "edi-tools";
+    const copyBtn = document.createElement("button");
+    copyBtn.textContent = "Copy";
+    copyBtn.onclick = () => navigator.clipboard.writeText(getText());
+    tools.appendChild(copyBtn);
+    row.appendChild(tools);
+  };
+
+  // Parses an SSE body ("event: x\ndata: {...}\n\n") and calls onEvent(name, data)
+  const readSSE = async (res, onEvent) => {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buf = "";
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buf += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buf.indexOf("\n\n")) !== -1) {
+        const raw = buf.slice(0, sep);
+        buf = buf.slice(sep + 2);
+        let event = "message";
+        let data = "";
+        raw.split("\n").forEach((line) => {
+          if (line.startsWith("event:")) event = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        });
+        let parsed = {};
+        try { parsed = data ? JSON.parse(data) : {}; } catch (_) {}
+        onEvent(event, parsed);
+      }
+    }
+  };
+
+  // Returns true if the question was handled via streaming, false to fall back to POST /ask
+  const askStream = async (question, typing) => {
+    const res = await fetch(STREAM_URL, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        question,
+        session_id: SESSION_ID}),
+    });
+
+    if (res.status === 429) {
+      if (typing.parentNode) body.removeChild(typing);
+      addMsg("bot", RATE_LIMIT_MSG);
+      return true;
+    }
+    // older backend without /ask/stream, or a proxy that cannot stream
+    if (!res.ok || !res.body) return false;
+
+    const bubble = typing.querySelector(".edi-bubble");
+    let text = "";
+    let finished = false;
+
+    await readSSE(res, (event, data) => {
+      if (event === "delta" && data.text) {
+        text += data.text;
+        bubble.textContent = text;
+        body.scrollTop = body.scrollHeight;
+      } else if (event === "done") {
+        finished = true;
+        // the final answer is authoritative (fully formatted, includes the nudge)
+        text = data.answer || text;
+        bubble.textContent = text;
+        addCopyTool(typing, () => text);
+        renderFollowups(data.followups, typing);
+      } else if (event === "error") {
+        finished = true;
+        bubble.textContent = data.error || "Request failed.";
+      }
+    });
+
+    if (!finished) {
+      bubble.textContent = text || "Network error. Please try again.";
+    }
+    return true;
+  };
+
   const ask = async (question) => {
     send.disabled = true;
     addMsg("user", question);
 
     const typing = addMsg("bot", "Typing…");
-    meta.textContent = `Calling: ${API_URL}`;
+    meta.textContent = `Calling: ${STREAM_URL || API_URL}`;
 
     try {
+      if (STREAM_URL && window.ReadableStream && (await askStream(question, typing))) {
+        return;
+      }
+
       const res = await fetch(API_URL, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
@@ -341,7 +435,7 @@
       // ✅ Handle 429 first, no matter what the body looks like
       if (res.status === 429) {
           if (typing.parentNode) body.removeChild(typing);
-          addMsg("bot", "You’re sending questions too quickly. Please wait ~1 minute and try again.");
+          addMsg("bot", RATE_LIMIT_MSG);
           return;
       }
 
@@ -351,7 +445,7 @@
 
       if (!res.ok) {
          if (res.status === 429) {
-            addMsg("bot", "You’re sending questions too quickly. Please wait ~1 minute and try again.");
+            addMsg("bot", RATE_LIMIT_MSG);
          } else {
            addMsg("bot", data?.error || `Request failed (HTTP ${res.status}).`);
          }
@@ -4,13 +4,15 @@ import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from rag.chunking import chunk_document
+
 DATA_FOLDER = "data"  # folder containing .txt files
 DOCS_PKL = "docs.pkl"
 FAISS_INDEX = "faiss.index"
 
 # ----- SETTINGS -----
-CHUNK_SIZE = 400
-CHUNK_OVERLAP = 50
+CHUNK_TOKENS = 100  # ~400 characters; chunks follow headings/paragraphs/lines (rag/chunking.py)
+CHUNK_OVERLAP_TOKENS = 12
 
 
 def load_text_files(folder):
@@ -33,16 +35,8 @@ def load_text_files(folder):
     return docs
 
 
-def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    chunks = []
-    start = 0
-
-    while start < len(text):
-        end = start + size
-        chunks.append(text[start:end])
-        start = end - overlap
-
-    return chunks
+def chunk_text(text, size=CHUNK_TOKENS, overlap=CHUNK_OVERLAP_TOKENS):
+    return [c.text for c in chunk_document(text, max_tokens=size, overlap_tokens=overlap)]
 
 
 def build_dataset(docs):
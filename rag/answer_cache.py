@@ -0,0 +1,119 @@
+# rag/answer_cache.py
+# whole-answer cache for /ask: canonical question + index version + prompt version -> final payload
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from rag.followups import _canon
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))  # 0 disables the cache
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # seconds
+
+
+@dataclass(frozen=True)
+class CachedAnswer:
+    answer: str
+    followups: Optional[List[str]]
+    path: str  # route that produced the answer (llm, requirement_direct, ...)
+    created: float
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of final /ask responses.
+
+    Keys combine the canonical question (followups._canon), the index version
+    (content hash of faiss.index/docs.pkl) and the prompt version, so a rebuilt
+    index or an edited prompt never serves an old answer. When a lookup sees a
+    new index version, every entry from the previous version is dropped.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str, str], CachedAnswer]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._index_version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(question: str, index_version: str, prompt_version: str) -> Tuple[str, str, str]:
+        return (_canon(question), index_version, prompt_version)
+
+    def _check_version(self, index_version: str) -> None:
+        if self._index_version != index_version:
+            if self._index_version is not None and self._entries:
+                self._entries.clear()
+                self.invalidations += 1
+            self._index_version = index_version
+
+    def get(self, question: str, index_version: str, prompt_version: str) -> Optional[CachedAnswer]:
+        if self.max_entries <= 0:
+            return None
+        k = self.key(question, index_version, prompt_version)
+        now = time.time()
+        with self._lock:
+            self._check_version(index_version)
+            hit = self._entries.get(k)
+            if hit is None:
+                self.misses += 1
+                return None
+            if now - hit.created > self.ttl:
+                del self._entries[k]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(k)
+            self.hits += 1
+            return hit
+
+    def put(
+        self,
+        question: str,
+        index_version: str,
+        prompt_version: str,
+        *,
+        answer: str,
+        followups: Optional[List[str]],
+        path: str,
+    ) -> None:
+        if self.max_entries <= 0 or not _canon(question):
+            return
+        k = self.key(question, index_version, prompt_version)
+        entry = CachedAnswer(
+            answer=answer,
+            followups=list(followups) if followups else None,
+            path=path,
+            created=time.time(),
+        )
+        with self._lock:
+            self._check_version(index_version)
+            self._entries[k] = entry
+            self._entries.move_to_end(k)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "invalidations": self.invalidations,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,249 @@
+# rag/budget.py
+# chat-model token / cost budgets: daily global, per session_id and per ip_hash quotas
+#
+#   BUDGET_DAILY_TOKENS=2000000  BUDGET_DAILY_USD=5  BUDGET_SESSION_TOKENS=20000  BUDGET_IP_TOKENS=50000
+#   BUDGET_STORAGE=memory:// (this worker) | sqlite:///var/data/budget.db (all workers on the box)
+#
+# Usage comes from the chat completion's `usage` (rag/llm.py adds it to the per-request
+# accumulator below), is charged after the answer, and checked before the next chat call.
+# A request is only refused once a quota is already spent, so one answer can overshoot it.
+# Over quota, the router answers extractively from the retrieved chunks (rag/extractive.py).
+# Windows are UTC days; a session quota is per session per day.
+# The router checks and charges through exhausted_async / charge_async: a shared SQLite store
+# can wait on another worker's write lock, and that wait runs in a worker thread.
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from rag.metrics import registry
+
+log = logging.getLogger("rag.budget")
+
+BUDGET_STORAGE = os.getenv("BUDGET_STORAGE", "memory://")
+BUDGET_DAILY_TOKENS = int(os.getenv("BUDGET_DAILY_TOKENS", "0"))  # all users together; 0 = no quota
+BUDGET_DAILY_USD = float(os.getenv("BUDGET_DAILY_USD", "0"))  # same, as estimated cost
+BUDGET_SESSION_TOKENS = int(os.getenv("BUDGET_SESSION_TOKENS", "0"))  # per session_id
+BUDGET_IP_TOKENS = int(os.getenv("BUDGET_IP_TOKENS", "0"))  # per ip_hash
+# USD per 1M tokens (gpt-4o-mini list prices); only used for the cost estimate
+CHAT_PRICE_INPUT = float(os.getenv("CHAT_PRICE_INPUT", "0.15"))
+CHAT_PRICE_OUTPUT = float(os.getenv("CHAT_PRICE_OUTPUT", "0.60"))
+
+COST_USD = registry.counter("rag_llm_cost_usd_total", "Estimated chat-model spend in USD.", ())
+DEGRADED = registry.counter(
+    "rag_budget_degraded_total", "Requests answered extractively because a quota was spent.", ("scope",),
+)
+
+_usage: ContextVar[Optional[Dict[str, int]]] = ContextVar("llm_usage", default=None)
+
+
+def start_request() -> Dict[str, int]:
+    """Fresh token accumulator for this request; rag/llm.py adds every chat `usage` to it."""
+    usage = {"prompt": 0, "completion": 0}
+    _usage.set(usage)
+    return usage
+
+
+def add_usage(usage) -> None:
+    acc = _usage.get()
+    if acc is None or usage is None:
+        return
+    # mutate (not set): the chat call runs in a child task with a copy of this context
+    acc["prompt"] += getattr(usage, "prompt_tokens", 0) or 0
+    acc["completion"] += getattr(usage, "completion_tokens", 0) or 0
+
+
+def cost_usd(prompt: int, completion: int) -> float:
+    return (prompt * CHAT_PRICE_INPUT + completion * CHAT_PRICE_OUTPUT) / 1_000_000
+
+
+def _day(now: Optional[float] = None) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(now if now is not None else time.time()))
+
+
+# -----------------------------
+# Storage: (day, scope, key) -> (tokens, usd)
+# -----------------------------
+
+class MemoryStore:
+    def __init__(self) -> None:
+        self._rows: Dict[Tuple[str, str, str], Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._day = ""
+
+    def add(self, day: str, items: Dict[Tuple[str, str], Tuple[int, float]]) -> None:
+        with self._lock:
+            if day != self._day:
+                # a new day started: yesterday's counters are no longer read
+                self._rows = {k: v for k, v in self._rows.items() if k[0] == day}
+                self._day = day
+            for (scope, key), (tokens, usd) in items.items():
+                t, u = self._rows.get((day, scope, key), (0, 0.0))
+                self._rows[(day, scope, key)] = (t + tokens, u + usd)
+
+    def get(self, day: str, keys) -> Dict[Tuple[str, str], Tuple[int, float]]:
+        with self._lock:
+            return {k: self._rows.get((day, *k), (0, 0.0)) for k in keys}
+
+
+class SQLiteStore:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=1.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS budget_usage ("
+            " day TEXT NOT NULL, scope TEXT NOT NULL, key TEXT NOT NULL,"
+            " tokens INTEGER NOT NULL, usd REAL NOT NULL, PRIMARY KEY (day, scope, key))"
+        )
+        self._lock = threading.Lock()
+        self._last_day = ""
+
+    def add(self, day: str, items: Dict[Tuple[str, str], Tuple[int, float]]) -> None:
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "INSERT INTO budget_usage (day, scope, key, tokens, usd) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(day, scope, key) DO UPDATE SET "
+                    " tokens = tokens + excluded.tokens, usd = usd + excluded.usd",
+                    [(day, s, k, t, u) for (s, k), (t, u) in items.items()],
+                )
+                if day != self._last_day:
+                    self._db.execute("DELETE FROM budget_usage WHERE day < date(?, '-7 days')", (day,))
+                    self._last_day = day
+
+    def get(self, day: str, keys) -> Dict[Tuple[str, str], Tuple[int, float]]:
+        out = {k: (0, 0.0) for k in keys}
+        if not out:
+            return out
+        # every scope in one primary-key lookup per term
+        where = " OR ".join(["(scope = ? AND key = ?)"] * len(out))
+        params = [day] + [v for k in out for v in k]
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT scope, key, tokens, usd FROM budget_usage WHERE day = ? AND ({where})", params
+            ).fetchall()
+        for scope, key, tokens, usd in rows:
+            out[(scope, key)] = (tokens, usd)
+        return out
+
+
+def make_store(url: str):
+    if url.startswith("memory://"):
+        return MemoryStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteStore(url[len("sqlite:///"):])
+    raise ValueError(f"unsupported BUDGET_STORAGE {url!r}")
+
+
+class Budget:
+    def __init__(
+        self,
+        storage: str = BUDGET_STORAGE,
+        daily_tokens: int = BUDGET_DAILY_TOKENS,
+        daily_usd: float = BUDGET_DAILY_USD,
+        session_tokens: int = BUDGET_SESSION_TOKENS,
+        ip_tokens: int = BUDGET_IP_TOKENS,
+    ):
+        self.storage = storage
+        self.daily_tokens = daily_tokens
+        self.daily_usd = daily_usd
+        self.session_tokens = session_tokens
+        self.ip_tokens = ip_tokens
+        self._store = None
+        self._store_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.daily_tokens or self.daily_usd or self.session_tokens or self.ip_tokens)
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    self._store = make_store(self.storage)
+        return self._store
+
+    def _keys(self, session_id: Optional[str], ip_hash: Optional[str]):
+        keys = [("global", "")]
+        if session_id and self.session_tokens:
+            keys.append(("session", session_id))
+        if ip_hash and self.ip_tokens:
+            keys.append(("ip", ip_hash))
+        return keys
+
+    def exhausted(self, session_id: Optional[str], ip_hash: Optional[str]) -> Optional[str]:
+        """The first spent quota ("global" / "session" / "ip"), or None. Never raises."""
+        if not self.enabled:
+            return None
+        try:
+            spent = self.store.get(_day(), self._keys(session_id, ip_hash))
+        except Exception as e:
+            log.warning("budget store failed, not enforcing: %r", e)
+            return None
+        tokens, usd = spent[("global", "")]
+        if (self.daily_tokens and tokens >= self.daily_tokens) or (self.daily_usd and usd >= self.daily_usd):
+            return "global"
+        if ("session", session_id) in spent and spent[("session", session_id)][0] >= self.session_tokens:
+            return "session"
+        if ("ip", ip_hash) in spent and spent[("ip", ip_hash)][0] >= self.ip_tokens:
+            return "ip"
+        return None
+
+    async def exhausted_async(self, session_id: Optional[str], ip_hash: Optional[str]) -> Optional[str]:
+        """exhausted() from the event loop: the store is read in a worker thread."""
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self.exhausted, session_id, ip_hash)
+
+    async def charge_async(self, session_id: Optional[str], ip_hash: Optional[str], usage: Dict[str, int]) -> float:
+        """charge() from the event loop: the store is written in a worker thread."""
+        if not self.enabled:
+            return self.charge(session_id, ip_hash, usage)  # cost metric only, no store
+        return await asyncio.to_thread(self.charge, session_id, ip_hash, usage)
+
+    def charge(self, session_id: Optional[str], ip_hash: Optional[str], usage: Dict[str, int]) -> float:
+        """Adds one request's chat tokens to every scope it counts against. Returns its cost estimate."""
+        tokens = usage.get("prompt", 0) + usage.get("completion", 0)
+        if not tokens:
+            return 0.0
+        usd = cost_usd(usage.get("prompt", 0), usage.get("completion", 0))
+        COST_USD.inc(usd)
+        if not self.enabled:
+            return usd
+        try:
+            self.store.add(_day(), {k: (tokens, usd) for k in self._keys(session_id, ip_hash)})
+        except Exception as e:
+            log.warning("budget store failed, usage not recorded: %r", e)
+        return usd
+
+    def today(self) -> Tuple[int, float]:
+        return self.store.get(_day(), [("global", "")])[("global", "")]
+
+
+budget = Budget()
+
+
+@registry.collector
+def _budget_metrics():
+    if not budget.enabled:
+        return
+    tokens, usd = budget.today()
+    yield ("rag_budget_spent_today", "gauge", "Chat-model spend counted against the global daily quota.", [
+        ({"unit": "tokens"}, tokens),
+        ({"unit": "usd"}, round(usd, 6)),
+    ])
+    yield ("rag_budget_quota", "gauge", "Configured daily quotas (0 = none).", [
+        ({"scope": "global", "unit": "tokens"}, budget.daily_tokens),
+        ({"scope": "global", "unit": "usd"}, budget.daily_usd),
+        ({"scope": "session", "unit": "tokens"}, budget.session_tokens),
+        ({"scope": "ip", "unit": "tokens"}, budget.ip_tokens),
+    ])
@@ -1,20 +1,37 @@
 # rag/build_index_openai.py
 from __future__ import annotations
 
+import hashlib
+import json
 import os
-import pickle
+import shutil
+import socket
+import sys
 import time
 from pathlib import Path
 from typing import Iterator, List, Tuple
 
+if __package__ in (None, ""):
+    # allow `python rag/build_index_openai.py` as well as `python -m rag.build_index_openai`
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
 import faiss
 import numpy as np
 from openai import OpenAI
 
+from rag import index_versions
+from rag.chunking import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, Chunk, chunk_document, chunk_label, fixed_chunks
+from rag.lexical import LEXICAL_NAME, LexicalIndex
+from rag.routing.helpers import signals_fingerprint, text_signals
+from rag.embed_pipeline import EMBED_BATCH_TOKENS, EMBED_CONCURRENCY, EmbedPipeline
+from rag.store import ChunkStore, ChunkStoreWriter, offsets_path_for
+from rag.vector_store import BLOCK_ROWS, VectorStore, chunk_id, file_sha256
+
 # ---- Config (override via env vars) ----
 EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
-BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
-CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "900"))
+BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "512"))  # max inputs per request; batches are sized by EMBED_BATCH_TOKENS
+CHUNKER = os.getenv("CHUNKER", "structure")  # "structure" (rag/chunking.py) or "fixed" character windows
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "900"))  # fixed chunker only (characters)
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "150"))
 MAX_CHUNKS = int(os.getenv("MAX_CHUNKS", "0"))  # 0 = no limit
 OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))  # seconds
@@ -23,33 +40,27 @@ BASE = Path(__file__).resolve().parent
 ROOT = BASE.parent
 # DATA_DIR = ROOT / "data"
 DATA_DIR = Path(os.getenv("DATA_DIR", str(ROOT / "data")))
-DOCS_PATH = ROOT / "docs.pkl"
-FAISS_PATH = ROOT / "faiss.index"
+# each build goes into INDEX_DIR/<version>/ and is published by flipping INDEX_DIR/CURRENT
+# (see rag/index_versions.py); running servers hot-reload it
+INDEX_DIR = Path(os.getenv("INDEX_DIR", str(ROOT / "index")))
+INDEX_KEEP = int(os.getenv("INDEX_KEEP", "3"))  # versions kept on disk (for rollback)
+# chunk-id -> vector store reused across builds (see rag/vector_store.py); local build cache, not committed
+VECTOR_STORE_DIR = Path(os.getenv("VECTOR_STORE_DIR", str(INDEX_DIR / "vectors")))
+FULL_REBUILD = os.getenv("FULL_REBUILD", "0") == "1"  # ignore the store and re-embed everything
 
 client = OpenAI()
 
 
-def chunk_text(text: str, chunk_size: int, overlap: int) -> Iterator[str]:
-    """Yield overlapping character chunks from text (memory-safe)."""
-    text = text.replace("\r\n", "\n").strip()
-    n = len(text)
-    if n == 0:
-        return
-    
-    if overlap >= chunk_size:
-        raise ValueError("CHUNK_OVERLAP must be < CHUNK_SIZE")
-
-    start = 0
-    while start < n:
-        end = min(n, start + chunk_size)
-        c = text[start:end].strip()
-        if c:
-            yield c
-
-        # ✅ critical: if we reached the end, stop (prevents infinite tail repeats)
-        if end >= n:
-            break
-        start = end - overlap
+def iter_chunks(fname: str, text: str) -> List[Chunk]:
+    if CHUNKER == "fixed":
+        return fixed_chunks(text, fname, CHUNK_SIZE, CHUNK_OVERLAP)
+    return chunk_document(text, fname, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+
+def chunk_settings() -> Tuple[int, int]:
+    """(size, overlap) of the active chunker: characters for "fixed", tokens for "structure"."""
+    if CHUNKER == "fixed":
+        return CHUNK_SIZE, CHUNK_OVERLAP
+    return CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
 
 def iter_sources() -> Iterator[Tuple[str, str]]:
     if not DATA_DIR.exists():
@@ -61,78 +72,233 @@ def iter_sources() -> Iterator[Tuple[str, str]]:
         yield fp.name, fp.read_text(encoding="utf-8", errors="ignore")
 
 
-def embed_batch(texts: List[str]) -> np.ndarray:
-    """Embed a batch and return normalized float32 vectors."""
-    print(f"Embedding batch of {len(texts)}...")
-    t0 = time.time()
-    resp = client.embeddings.create(
-        model=EMBED_MODEL,
-        input=texts,
-        timeout=OPENAI_TIMEOUT,
-    )
-    vecs = np.array([d.embedding for d in resp.data], dtype="float32")
-    faiss.normalize_L2(vecs)  # cosine-like similarity with IndexFlatIP
-    print(f"Batch done in {time.time() - t0:.1f}s")
-    return vecs
+def seed_from_current(store: VectorStore) -> int:
+    """
+    First incremental run on a box without a store: reuse the vectors of the live version
+    (chunk i of chunks.bin <-> row i of faiss.index) instead of re-embedding them.
+    The index is memory-mapped and copied BLOCK_ROWS vectors at a time.
+    """
+    current = index_versions.current_dir(INDEX_DIR)
+    if current is None:
+        return 0
+    manifest = current / index_versions.MANIFEST_NAME
+    if manifest.exists() and json.loads(manifest.read_text(encoding="utf-8")).get("embed_model") != EMBED_MODEL:
+        return 0
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    index = faiss.read_index(str(current / index_versions.FAISS_NAME), flag)
+    docs = ChunkStore(current / index_versions.CHUNKS_NAME)
+    try:
+        ids, rows, seen = [], [], set()
+        for i, text in enumerate(docs):
+            cid = chunk_id(EMBED_MODEL, text)
+            if cid not in store and cid not in seen:
+                seen.add(cid)
+                ids.append(cid)
+                rows.append(i)
+        for start in range(0, len(ids), BLOCK_ROWS):
+            block = np.asarray(rows[start:start + BLOCK_ROWS], dtype="int64")
+            store.add(ids[start:start + BLOCK_ROWS], index.reconstruct_batch(block))
+        store.checkpoint()
+        return len(ids)
+    finally:
+        docs.close()
+
+
+STAGING_PREFIX = ".building-"
+
+
+def staging_name() -> str:
+    """index/.building-<host>-<pid>: the host keeps builds in other containers sharing the volume apart."""
+    return f"{STAGING_PREFIX}{socket.gethostname()}-{os.getpid()}"
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        return True  # os.kill(pid, 0) terminates the process on Windows; leave the directory
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # running under another user
+    return True
+
+
+def remove_stale_staging() -> List[Path]:
+    """
+    Deletes staging directories left behind by interrupted builds on this host: those whose pid is
+    no longer running. A parallel build's directory, or one from another host, is left alone.
+    """
+    removed = []
+    host = socket.gethostname()
+    for path in INDEX_DIR.glob(f"{STAGING_PREFIX}*"):
+        owner, _, pid = path.name[len(STAGING_PREFIX):].rpartition("-")
+        if owner not in ("", host) or not pid.isdigit():
+            continue  # "" is the .building-<pid> name of earlier builds
+        if not _pid_alive(int(pid)):
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+    return removed
 
 
 def main() -> None:
-    docs: List[str] = []
-    vec_batches: List[np.ndarray] = []
+    doc_ids: List[int] = []
+    files: dict = {}
+    chunk_size, chunk_overlap = chunk_settings()
+    content = hashlib.sha256()
+    # new vectors (another model) or another chunking => new version, even when the texts match
+    content.update(f"{EMBED_MODEL}\n{CHUNKER}\n{chunk_size}\n{chunk_overlap}".encode("utf-8") + b"\x00")
+    # chunk meta carries routing signals (rag/routing/helpers.py): new patterns => new version
+    content.update(signals_fingerprint().encode("utf-8") + b"\x00")
 
     chunk_count = 0
-    pending: List[str] = []
+    queued: set = set()
 
     print(f"Reading sources from: {DATA_DIR}")
     print(
-        f"Embedding model: {EMBED_MODEL} | batch={BATCH_SIZE} | chunk={CHUNK_SIZE} | "
-        f"overlap={CHUNK_OVERLAP} | max_chunks={MAX_CHUNKS or 'none'}"
+        f"Embedding model: {EMBED_MODEL} | concurrency={EMBED_CONCURRENCY} | "
+        f"batch<={EMBED_BATCH_TOKENS} tokens/{BATCH_SIZE} inputs | chunker={CHUNKER} "
+        f"chunk={chunk_size} overlap={chunk_overlap} {'chars' if CHUNKER == 'fixed' else 'tokens'}"
+        + f" | max_chunks={MAX_CHUNKS or 'none'}"
     )
 
-    for fname, text in iter_sources():
-        print(f"FILE {fname}: chars={len(text)}")
-        for i, c in enumerate(chunk_text(text, CHUNK_SIZE, CHUNK_OVERLAP), start=1):
-            docs.append(f"[{fname} | chunk {i}]\n{c}")
-            pending.append(docs[-1])
-            chunk_count += 1
+    # a full rebuild ignores the saved vectors; they are replaced only when the new store is saved,
+    # and its own progress is journaled like any build, so an interrupted full rebuild resumes
+    store = VectorStore.load(VECTOR_STORE_DIR, EMBED_MODEL, reuse=not FULL_REBUILD)
+    if store.replayed:
+        print(f"Resuming: {store.replayed} vectors recovered from an interrupted build")
+    if not FULL_REBUILD and len(store) == 0:
+        seeded = seed_from_current(store)
+        if seeded:
+            print(f"Seeded vector store with {seeded} vectors from the live version")
+    previous_files = dict(store.files)
+    previous_ids = store.ids()
+    print(f"Vector store: {VECTOR_STORE_DIR} ({len(store)} vectors{', full rebuild' if FULL_REBUILD else ''})")
 
-            if chunk_count % 500 == 0:
-                print(f"Chunks processed: {chunk_count}")
+    # every finished batch is journaled + fsynced, so a crash costs at most the batches in flight
+    def on_batch(ids: List[int], vecs: np.ndarray) -> None:
+        store.add(ids, vecs)
+        store.checkpoint()
 
-            if MAX_CHUNKS and chunk_count >= MAX_CHUNKS:
-                break
+    # chunk texts go straight to disk; the version name (content hash) is only known at the end
+    for stale in remove_stale_staging():
+        print(f"Removed {stale.name} (left behind by an interrupted build)")
+    staging = INDEX_DIR / staging_name()
+    staging.mkdir(parents=True)
+    chunks_path = staging / index_versions.CHUNKS_NAME
+
+    t0 = time.time()
+    pipeline = EmbedPipeline(
+        client, EMBED_MODEL, on_batch, max_inputs=BATCH_SIZE, timeout=OPENAI_TIMEOUT
+    )
+    with ChunkStoreWriter(chunks_path) as writer:
+        for fname, text in iter_sources():
+            sha = file_sha256(text)
+            status = "unchanged" if previous_files.get(fname, {}).get("sha256") == sha else (
+                "changed" if fname in previous_files else "new"
+            )
+            print(f"FILE {fname}: chars={len(text)} ({status})")
+            file_chunks = 0
+            for i, c in enumerate(iter_chunks(fname, text), start=1):
+                doc = f"{chunk_label(c, i)}\n{c.text}"
+                meta = c.meta()
+                meta["signals"] = text_signals(doc)
+                writer.append(doc, meta)
+                content.update(doc.encode("utf-8") + b"\x00")
+                cid = chunk_id(EMBED_MODEL, doc)
+                doc_ids.append(cid)
+                file_chunks += 1
+                chunk_count += 1
 
-            if len(pending) >= BATCH_SIZE:
-                vec_batches.append(embed_batch(pending))
-                pending.clear()
+                # only chunks the store has never seen cost an API call
+                if cid not in store and cid not in queued:
+                    pipeline.add(cid, doc)
+                    queued.add(cid)
 
-          
-        if MAX_CHUNKS and chunk_count >= MAX_CHUNKS:
-            break
+                if chunk_count % 500 == 0:
+                    print(f"Chunks processed: {chunk_count}")
 
-    if pending:
-        vec_batches.append(embed_batch(pending))
-        pending.clear()
+                if MAX_CHUNKS and chunk_count >= MAX_CHUNKS:
+                    break
 
-    if not docs:
+            files[fname] = {"sha256": sha, "chunks": file_chunks}
+            if MAX_CHUNKS and chunk_count >= MAX_CHUNKS:
+                break
+
+        pipeline.close()
+    stats = pipeline.stats()
+    if stats["requests"]:
+        print(
+            f"Embedded {stats['embedded']} chunks (~{stats['tokens']} tokens) in {stats['requests']} requests "
+            f"({stats['retries']} retries) in {time.time() - t0:.1f}s"
+        )
+
+    if not doc_ids:
+        shutil.rmtree(staging, ignore_errors=True)
         raise RuntimeError("No chunks produced. Check your data/*.txt files.")
 
-    print(f"Total chunks collected: {len(docs)}")
+    live = set(doc_ids)
+    added = len(queued)
+    dropped = store.remove(previous_ids - live)
+    kept = len(live) - added
+    store.files = files
+    store.save()
+
+    removed_files = sorted(set(previous_files) - set(files))
+    print(f"Total chunks collected: {len(doc_ids)}")
+    print(f"Chunks: added={added} kept={kept} dropped={dropped} (embedded {added} of {len(live)} unique)")
+    if removed_files:
+        print("Removed files:", ", ".join(removed_files))
 
-    vecs = np.vstack(vec_batches)
-    print(f"Embeddings shape: {vecs.shape}")
+    content_hash = content.hexdigest()[:8]
+    live_version = index_versions.read_current(INDEX_DIR)
+    if not FULL_REBUILD and live_version and live_version.endswith(f"-{content_hash}"):
+        shutil.rmtree(staging, ignore_errors=True)
+        print(f"No content changes since {live_version}; nothing to publish.")
+        return
 
-    dim = vecs.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(vecs)
+    version = index_versions.new_version_name(content_hash)
+    version_dir = INDEX_DIR / version
+    print(f"Writing version {version}...")
+    # serving index: plain IndexFlatIP, row i <-> chunk i of the chunk store, streamed from the store
+    dim = store.write_flat_index(doc_ids, staging / index_versions.FAISS_NAME)
+    print(f"Embeddings shape: ({len(doc_ids)}, {dim})")
 
-    print("Writing docs.pkl and faiss.index...")
-    with open(DOCS_PATH, "wb") as f:
-        pickle.dump(docs, f)
+    # BM25 postings for hybrid retrieval, read back from the chunk store just written
+    docs = ChunkStore(chunks_path)
+    try:
+        lexical = LexicalIndex.build(docs)
+    finally:
+        docs.close()
+    lexical.save(staging / LEXICAL_NAME)
+    print(f"Lexical index: {len(lexical.terms)} terms over {len(lexical)} chunks")
+    index_versions.write_manifest(staging, {
+        "version": version,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "embed_model": EMBED_MODEL,
+        "chunker": CHUNKER,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "chunks": len(doc_ids),
+        "signals": signals_fingerprint(),
+        "dim": dim,
+        "files": files,
+        "added": added,
+        "kept": kept,
+        "dropped": dropped,
+    })
+    # a version dir is either complete or absent
+    os.replace(staging, version_dir)
 
-    faiss.write_index(index, str(FAISS_PATH))
+    index_versions.publish(INDEX_DIR, version)
+    removed = index_versions.prune(INDEX_DIR, keep=INDEX_KEEP)
 
-    print("Wrote:", DOCS_PATH, FAISS_PATH)
+    print("Wrote:", version_dir / index_versions.CHUNKS_NAME,
+          offsets_path_for(version_dir / index_versions.CHUNKS_NAME),
+          version_dir / index_versions.FAISS_NAME)
+    print(f"Published {version} ({INDEX_DIR / index_versions.POINTER_NAME})")
+    if removed:
+        print("Pruned old versions:", ", ".join(removed))
     print("Done.")
 
 
@@ -0,0 +1,220 @@
+# rag/chatlog.py
+# non-blocking chat logging: bounded in-process queue -> background writer -> batched multi-row INSERTs
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger("rag.chatlog")
+
+DATABASE_URL = os.getenv("DATABASE_URL")  # postgres://... or sqlite:///path/to/chat_logs.db
+CHATLOG_QUEUE_SIZE = int(os.getenv("CHATLOG_QUEUE_SIZE", "5000"))
+CHATLOG_BATCH_SIZE = int(os.getenv("CHATLOG_BATCH_SIZE", "100"))  # flush every N rows ...
+CHATLOG_FLUSH_MS = int(os.getenv("CHATLOG_FLUSH_MS", "1000"))  # ... or every T ms, whichever comes first
+CHATLOG_POOL_SIZE = int(os.getenv("CHATLOG_POOL_SIZE", "2"))
+
+COLUMNS = ("origin", "session_id", "ip_hash", "user_agent", "question", "status", "latency_ms")
+Row = Tuple
+
+
+class PostgresSink:
+    """Pooled psycopg2 connections; one multi-row INSERT per batch."""
+
+    def __init__(self, dsn: str, pool_size: int = CHATLOG_POOL_SIZE):
+        from psycopg2.pool import ThreadedConnectionPool
+
+        self._pool = ThreadedConnectionPool(1, max(1, pool_size), dsn)
+
+    def write_many(self, rows: List[Row]) -> None:
+        from psycopg2.extras import execute_values
+
+        conn = self._pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    execute_values(
+                        cur,
+                        f"INSERT INTO chat_logs ({', '.join(COLUMNS)}) VALUES %s",
+                        rows,
+                        page_size=len(rows),
+                    )
+        except Exception:
+            # drop a possibly broken connection instead of returning it to the pool
+            self._pool.putconn(conn, close=True)
+            raise
+        else:
+            self._pool.putconn(conn)
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+
+class SQLiteSink:
+    """Local stand-in with the same chat_logs schema (dev/tests, DATABASE_URL=sqlite:///path)."""
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chat_logs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " origin TEXT, session_id TEXT, ip_hash TEXT, user_agent TEXT,"
+            " question TEXT, status INTEGER, latency_ms INTEGER,"
+            " created_at TEXT DEFAULT CURRENT_TIMESTAMP)"
+        )
+        self._db.commit()
+
+    def write_many(self, rows: List[Row]) -> None:
+        placeholders = ",".join("?" for _ in COLUMNS)
+        with self._db:
+            self._db.executemany(
+                f"INSERT INTO chat_logs ({', '.join(COLUMNS)}) VALUES ({placeholders})", rows
+            )
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def make_sink(url: Optional[str]):
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteSink(url[len("sqlite:///"):])
+    return PostgresSink(url)
+
+
+class ChatLogger:
+    """
+    log() only enqueues (O(1), never touches the database), so the response is not
+    held up by Postgres. A daemon thread drains the queue and flushes batches.
+    When the queue is full (database slow/down) new records are dropped and counted.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = DATABASE_URL,
+        *,
+        queue_size: int = CHATLOG_QUEUE_SIZE,
+        batch_size: int = CHATLOG_BATCH_SIZE,
+        flush_ms: int = CHATLOG_FLUSH_MS,
+        sink=None,
+    ):
+        self.url = url
+        self.batch_size = max(1, batch_size)
+        self.flush_s = max(1, flush_ms) / 1000.0
+        self._sink = sink
+        self._queue: "queue.Queue[Optional[Row]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.url) or self._sink is not None
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="chatlog-writer", daemon=True)
+            self._thread.start()
+
+    def log(
+        self,
+        *,
+        origin: Optional[str],
+        session_id: Optional[str],
+        ip_hash: str,
+        user_agent: Optional[str],
+        question: str,
+        status: int,
+        latency_ms: int,
+    ) -> bool:
+        """Queues one chat_logs row. Returns False if logging is off or the row was dropped."""
+        if not self.enabled:
+            return False
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(
+                (origin, session_id, ip_hash, user_agent, question, status, latency_ms)
+            )
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def _run(self) -> None:
+        batch: List[Row] = []
+        deadline = time.monotonic() + self.flush_s
+        stopping = False
+        while not stopping:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+            except queue.Empty:
+                pass
+
+            if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_s
+
+    def _flush(self, batch: List[Row]) -> None:
+        try:
+            if self._sink is None:
+                # connect lazily on the writer thread; a down database never blocks a request
+                self._sink = make_sink(self.url)
+            self._sink.write_many(batch)
+            self.written += len(batch)
+            self.flushes += 1
+        except Exception as e:
+            self.failed += len(batch)
+            log.error("chat_logs write failed, dropped %d rows: %s", len(batch), e)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Flushes whatever is queued and stops the writer thread."""
+        thread = self._thread
+        if thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        thread.join(timeout)
+        self._thread = None
+        if self._sink is not None:
+            try:
+                self._sink.close()
+            except Exception:
+                pass
+            self._sink = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+        }
+
+
+chat_logger = ChatLogger()
+atexit.register(chat_logger.stop)
@@ -0,0 +1,216 @@
+# rag/chunking.py
+# structure-aware chunker: packs headings / paragraphs / list lines / sentences into token-budgeted chunks
+#
+# The source pages are scraped text: headings are short standalone lines, FAQ questions are
+# lines ending in "?", tables are tab-separated lines and lists are one item per line.
+# A line is never split unless it alone exceeds the budget (then: sentences, then words),
+# and a new chunk starts at every heading, so a fee table row or a module list stays whole.
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, List, Optional
+
+from rag.tokens import count_tokens
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "160"))  # target size of one chunk
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "24"))  # repeated across a split inside a section
+
+_MD_HEADING_RE = re.compile(r"^\s{0,3}(#{1,6})\s+(.+?)\s*#*\s*$")
+_LIST_RE = re.compile(r"^\s*(?:[-*•▪●]|\d+[.)])\s+")
+_CODE_LINE_RE = re.compile(r"^[A-Z]{2,4}\d{4}[A-Z]?\b")  # "CDE5301 Interdisciplinary Design Project"
+_SENTENCE_RE = re.compile(r"[^.!?]+(?:[.!?]+[\"')\]]*|$)\s*")
+_HEADING_MAX_CHARS = 80
+_QUESTION_MAX_CHARS = 200
+
+
+@dataclass
+class Chunk:
+    text: str
+    source: str
+    section: str  # "Heading" or "Heading > Question"; "" before the first heading
+    start: int  # character offsets into the (CRLF-normalized) source text
+    end: int
+    tokens: int
+
+    def meta(self) -> Dict:
+        d = asdict(self)
+        d.pop("text")
+        return d
+
+
+@dataclass
+class _Unit:
+    start: int
+    end: int
+    kind: str  # "heading" | "question" | "line"
+    tokens: int
+    para_start: bool  # first line after a blank line
+
+
+def _heading_kind(line: str, after_break: bool, next_line: Optional[str]) -> Optional[str]:
+    s = line.strip()
+    if not s or "\t" in s or _LIST_RE.match(s) or _CODE_LINE_RE.match(s):
+        return None
+    if _MD_HEADING_RE.match(s):
+        return "heading"
+    if next_line is None or not next_line.strip():
+        return None  # a heading introduces something
+    if s.endswith("?") and len(s) <= _QUESTION_MAX_CHARS:
+        return "question"
+    if len(s) <= _HEADING_MAX_CHARS and after_break and not s.endswith((".", ",", ";", ":", "!")) and s[0].isupper():
+        return "heading"
+    return None
+
+
+def _split_long(text: str, base: int, max_tokens: int) -> Iterator[tuple[int, int]]:
+    """(start, end) pieces of one over-long line: sentence boundaries first, then word boundaries."""
+    pieces = [(base + m.start(), base + m.end()) for m in _SENTENCE_RE.finditer(text) if m.group().strip()]
+    for start, end in pieces or [(base, base + len(text))]:
+        piece = text[start - base:end - base]
+        if count_tokens(piece) <= max_tokens:
+            yield start, end
+            continue
+        # a single sentence over budget: cut at whitespace
+        words = list(re.finditer(r"\S+\s*", piece))
+        cur = start
+        acc = ""
+        for w in words:
+            if acc and count_tokens(acc + w.group()) > max_tokens:
+                yield cur, start + w.start()
+                cur, acc = start + w.start(), ""
+            acc += w.group()
+        if acc:
+            yield cur, end
+
+
+def _units(text: str, max_tokens: int) -> List[_Unit]:
+    units: List[_Unit] = []
+    lines = text.split("\n")
+    pos = 0
+    prev_blank = True
+    for i, line in enumerate(lines):
+        start, end = pos, pos + len(line)
+        pos = end + 1
+        if not line.strip():
+            prev_blank = True
+            continue
+        next_line = lines[i + 1] if i + 1 < len(lines) else None
+        # a heading follows a blank line or another heading ("FAQ" / "Admission requirements")
+        after_break = prev_blank or bool(units) and units[-1].kind == "heading" and units[-1].end == start - 1
+        kind = _heading_kind(line, after_break, next_line) or "line"
+        tokens = count_tokens(line)
+        if kind == "line" and tokens > max_tokens:
+            for k, (s, e) in enumerate(_split_long(line, start, max_tokens)):
+                units.append(_Unit(s, e, "line", count_tokens(text[s:e]), prev_blank and k == 0))
+        else:
+            units.append(_Unit(start, end, kind, tokens, prev_blank))
+        prev_blank = False
+    return units
+
+
+def _clean(text: str) -> str:
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def chunk_document(
+    text: str,
+    source: str = "",
+    max_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> List[Chunk]:
+    """
+    Greedy packing of structural units into chunks of <= max_tokens:
+    - every heading / FAQ question starts a new chunk (once the current one has body text)
+    - when the budget is hit, the chunk is cut at its last paragraph break if that keeps at
+      least half the budget, otherwise at the last line
+    - a cut inside a section carries up to overlap_tokens of trailing lines into the next chunk
+    """
+    text = text.replace("\r\n", "\n")
+    units = _units(text, max_tokens)
+    chunks: List[Chunk] = []
+    heading = question = ""
+    cur: List[_Unit] = []
+    cur_section = ""
+
+    def section() -> str:
+        return f"{heading} > {question}" if heading and question else (question or heading)
+
+    def emit(us: List[_Unit]) -> None:
+        if not us or all(u.kind != "line" for u in us):
+            return
+        body = _clean(text[us[0].start:us[-1].end])
+        chunks.append(Chunk(body, source, cur_section, us[0].start, us[-1].end, count_tokens(body)))
+
+    for u in units:
+        if u.kind in ("heading", "question"):
+            if any(x.kind == "line" for x in cur):
+                emit(cur)
+                cur = []
+            if u.kind == "heading":
+                m = _MD_HEADING_RE.match(text[u.start:u.end])
+                heading = (m.group(2) if m else text[u.start:u.end]).strip()
+                question = ""
+            else:
+                question = text[u.start:u.end].strip()
+            if not cur:
+                cur_section = section()
+            cur.append(u)
+            continue
+
+        if cur and sum(x.tokens for x in cur) + u.tokens > max_tokens:
+            # prefer a paragraph break in the back half of the chunk
+            cut = len(cur)
+            budget_half = max_tokens // 2
+            running = 0
+            for k, x in enumerate(cur):
+                if k and x.para_start and running >= budget_half:
+                    cut = k
+                running += x.tokens
+            head, rest = cur[:cut], cur[cut:]
+            emit(head)
+
+            carry: List[_Unit] = []
+            carried = 0
+            for x in reversed(head):
+                if x.kind != "line" or carried + x.tokens > overlap_tokens:
+                    break
+                carry.insert(0, x)
+                carried += x.tokens
+            cur = carry + rest
+            # drop the carry again if it alone would overflow the next chunk
+            while cur and sum(x.tokens for x in cur) + u.tokens > max_tokens and carry:
+                cur.pop(0)
+                carry.pop(0)
+            cur_section = section()
+        if not cur:
+            cur_section = section()
+        cur.append(u)
+
+    emit(cur)
+    return chunks
+
+
+def fixed_chunks(text: str, source: str = "", chunk_size: int = 900, overlap: int = 150) -> List[Chunk]:
+    """The original character-window chunker (CHUNKER=fixed; baseline in bench/bench_chunking.py)."""
+    if overlap >= chunk_size:
+        raise ValueError("CHUNK_OVERLAP must be < CHUNK_SIZE")
+    text = text.replace("\r\n", "\n").strip()
+    out: List[Chunk] = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + chunk_size)
+        c = text[start:end].strip()
+        if c:
+            out.append(Chunk(c, source, "", start, end, count_tokens(c)))
+        if end >= len(text):
+            break
+        start = end - overlap
+    return out
+
+
+def chunk_label(chunk: Chunk, n: int) -> str:
+    """Header line prepended to each chunk text (what the model sees as the chunk's source)."""
+    heading = chunk.section.split(" > ")[0]  # an FAQ question is already the chunk's first line
+    return f"[{chunk.source} | {heading}]" if heading else f"[{chunk.source} | chunk {n}]"
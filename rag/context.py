@@ -0,0 +1,230 @@
+# rag/context.py
+# packs the retrieved chunks into the prompt's context block under a token budget
+#
+#   CONTEXT_TOKENS=800         budget for the context block, in chat-model tokens (rag/tokens.py)
+#   CONTEXT_MIN_CUT_TOKENS=60  a passage that does not fit is cut to the remaining budget only if at
+#                              least this much is left; otherwise smaller passages further down get it
+#
+# Retrieved chunks from the same source file whose character spans (chunk meta start/end) overlap
+# or touch become one passage: the lines two chunks share (the chunker's overlap) and the
+# "[source | heading]" label are sent once. Passages go in retrieval order (best score first) and
+# are added whole while they fit; the first that does not fit is cut at a line boundary, and what
+# remains after the budget is dropped. Chunks without span meta (older index builds) are passages
+# on their own.
+#
+# Per request the packer records what it saved (see start_request); the router logs it with the
+# request record as "context":
+#   raw      tokens of the retrieved chunks as retrieved (each whole, with its label)
+#   sent     tokens of the packed context block
+#   overlap  tokens removed by merging (repeated lines and labels)
+#   dropped  tokens left out for the budget (whole passages and cut tails)
+from __future__ import annotations
+
+import json
+import os
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from rag.metrics import registry
+from rag.tokens import count_tokens
+
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "800"))
+CONTEXT_MIN_CUT_TOKENS = int(os.getenv("CONTEXT_MIN_CUT_TOKENS", "60"))
+
+PACKED = registry.counter(
+    "rag_context_tokens_total",
+    "Context tokens per packing outcome: sent to the chat model, merged away as overlap, dropped for the budget.",
+    ("kind",),
+)
+
+_SEPARATOR = "\n\n"
+_TOUCH_CHARS = 2  # chunk spans this close are adjacent (the gap is the line break between them)
+_stats: ContextVar[Optional[Dict[str, int]]] = ContextVar("context_pack", default=None)
+
+
+def start_request() -> Dict[str, int]:
+    """Fresh packing stats for this request; pack_context() fills them in when the prompt is built."""
+    stats: Dict[str, int] = {}
+    _stats.set(stats)
+    return stats
+
+
+def chunk_text(chunk: Dict[str, Any]) -> str:
+    """
+    Keep compatibility with multiple chunk shapes.
+    chunk['text'] is a str for current index builds, a dict for some older ones.
+    """
+    v = chunk.get("text", "")
+    if isinstance(v, str):
+        return v
+    if isinstance(v, dict):
+        for k in ("text", "content", "chunk", "page_content"):
+            vv = v.get(k)
+            if isinstance(vv, str):
+                return vv
+        return json.dumps(v, ensure_ascii=False)
+    return str(v)
+
+
+@dataclass
+class _Passage:
+    rank: int  # retrieval rank of its best chunk
+    source: str
+    label: str
+    body: str
+    start: int = -1  # source span covered so far; -1 = no span meta
+    end: int = -1
+    chunks: int = 1
+    tokens: int = 0
+    labels: List[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return f"{self.label}\n{self.body}" if self.label else self.body
+
+
+def _split_label(text: str) -> Tuple[str, str]:
+    """'[source | heading]\\nbody' -> (label, body); the index builder writes that first line."""
+    if text.startswith("["):
+        first, sep, rest = text.partition("\n")
+        if sep and first.endswith("]"):
+            return first, rest.strip()
+    return "", text
+
+
+def _span(chunk: Dict[str, Any]) -> Optional[Tuple[str, int, int]]:
+    meta = chunk.get("meta") or {}
+    source, start, end = meta.get("source"), meta.get("start"), meta.get("end")
+    if source and isinstance(start, int) and isinstance(end, int) and start < end:
+        return source, start, end
+    return None
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of a that is also a prefix of b (the lines both chunks repeat)."""
+    head = b[:16]
+    if not head:
+        return 0
+    pos = a.find(head)
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(head, pos + 1)
+    return 0
+
+
+def _merge(p: _Passage, label: str, body: str, start: int, end: int) -> None:
+    """Appends a chunk that starts inside or right after p's span (same source)."""
+    if start < p.end:
+        body = body[_overlap(p.body, body):].lstrip()
+    if body:
+        # a chunk under another heading keeps its label: it says where its lines come from
+        if label and label not in p.labels and " | chunk " not in label:
+            body = f"{label}\n{body}"
+            p.labels.append(label)
+        p.body = f"{p.body}\n{body}" if p.body else body
+    p.end = max(p.end, end)
+    p.chunks += 1
+
+
+def _passages(chunks: List[Dict[str, Any]]) -> List[_Passage]:
+    spans: List[Tuple[int, str, str, Optional[Tuple[str, int, int]]]] = []
+    seen = set()
+    for rank, c in enumerate(chunks or []):
+        text = chunk_text(c).strip()
+        if not text or text in seen:
+            continue
+        seen.add(text)
+        label, body = _split_label(text)
+        spans.append((rank, label, body, _span(c)))
+
+    out: List[_Passage] = []
+    # source order within a file, so overlapping / touching chunks meet
+    by_source: Dict[str, List[Tuple[int, str, str, int, int]]] = {}
+    for rank, label, body, span in spans:
+        if span is None:
+            out.append(_Passage(rank, "", label, body, labels=[label]))
+        else:
+            by_source.setdefault(span[0], []).append((span[1], span[2], rank, label, body))
+    for source, items in by_source.items():
+        items.sort()
+        cur: Optional[_Passage] = None
+        for start, end, rank, label, body in items:
+            if cur is not None and start <= cur.end + _TOUCH_CHARS:
+                _merge(cur, label, body, start, end)
+                cur.rank = min(cur.rank, rank)
+                continue
+            cur = _Passage(rank, source, label, body, start, end, labels=[label])
+            out.append(cur)
+    out.sort(key=lambda p: p.rank)
+    return out
+
+
+def _cut(p: _Passage, budget: int) -> Tuple[str, int]:
+    """Longest prefix of whole lines of p that fits budget tokens (label included)."""
+    lines = p.text.split("\n")
+    kept: List[str] = []
+    used = 0
+    for line in lines:
+        t = count_tokens(line + "\n", chat=True)
+        if used + t > budget:
+            break
+        kept.append(line)
+        used += t
+    if len(kept) <= (1 if p.label else 0):
+        return "", 0  # nothing past the label fits
+    text = "\n".join(kept)
+    return text, count_tokens(text, chat=True)
+
+
+def pack_context(
+    chunks: List[Dict[str, Any]], budget: int = CONTEXT_TOKENS
+) -> Tuple[str, Dict[str, int]]:
+    """
+    The context block for the prompt and its packing stats (chunks, passages, raw, sent, overlap,
+    dropped, cut). budget <= 0 packs everything (merging only).
+    """
+    texts = [chunk_text(c).strip() for c in chunks or []]
+    raw = sum(count_tokens(t, chat=True) for t in texts if t)
+    passages = _passages(chunks)
+
+    parts: List[str] = []
+    merged = 0  # tokens of the passages before the budget, i.e. after merging
+    used = 0
+    cut = 0
+    sep = count_tokens(_SEPARATOR, chat=True)
+    for p in passages:
+        p.tokens = count_tokens(p.text, chat=True)
+        merged += p.tokens
+        room = budget - used - (sep if parts else 0)
+        if budget <= 0 or p.tokens <= room:
+            parts.append(p.text)
+            used += p.tokens + (sep if len(parts) > 1 else 0)
+        elif room >= CONTEXT_MIN_CUT_TOKENS or not parts:
+            text, t = _cut(p, room)
+            if text:
+                parts.append(text)
+                used += t + (sep if len(parts) > 1 else 0)
+                cut += 1
+
+    context_text = _SEPARATOR.join(parts)
+    sent = count_tokens(context_text, chat=True)
+    stats = dict(
+        chunks=sum(1 for t in texts if t),
+        passages=len(parts),
+        raw=raw,
+        sent=sent,
+        overlap=max(0, raw - merged),
+        dropped=max(0, merged - sent),
+        cut=cut,
+    )
+    PACKED.inc(stats["sent"], kind="sent")
+    PACKED.inc(stats["overlap"], kind="overlap")
+    PACKED.inc(stats["dropped"], kind="dropped")
+    acc = _stats.get()
+    if acc is not None:
+        # mutate (not set): the prompt is built in a child task with a copy of this context
+        acc.clear()
+        acc.update(stats)
+    return context_text, stats
@@ -0,0 +1,197 @@
+# rag/embed_cache.py
+# query -> embedding cache for the retriever (bounded LRU + optional SQLite persistence)
+#
+#   EMBED_CACHE_SIZE=2048           vectors kept in memory per worker
+#   EMBED_CACHE_PATH=               SQLite file shared by the workers (empty: memory only)
+#   EMBED_CACHE_DISK_ROWS=100000    rows kept in that file; the least recently used are swept
+#
+# The retriever goes through get_async / put_async: memory hits stay on the event loop, SQLite
+# reads and writes (which can wait on another worker's write lock) run in a worker thread.
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))  # 0 disables the cache
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "")  # e.g. /var/data/embed_cache.sqlite; empty = memory only
+EMBED_CACHE_DISK_ROWS = int(os.getenv("EMBED_CACHE_DISK_ROWS", "100000"))  # 0 = unbounded
+_SWEEP_EVERY = 256  # puts between two sweeps of the SQLite table
+
+
+class EmbeddingCache:
+    """
+    Maps (embedding model, normalized query) -> float32 query vector.
+
+    - In-memory LRU bounded to `max_entries` vectors.
+    - Optional SQLite file so hot queries survive restarts / redeploys.
+      Memory misses fall through to SQLite before the caller pays for an API call.
+      Rows carry a last-used time; beyond `disk_rows` the least recently used are deleted.
+    - Hit/miss counters are exposed via stats().
+    """
+
+    def __init__(
+        self,
+        max_entries: int = EMBED_CACHE_SIZE,
+        path: str | Path | None = None,
+        disk_rows: int = EMBED_CACHE_DISK_ROWS,
+    ):
+        self.max_entries = max_entries
+        self.disk_rows = disk_rows
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()  # the LRU and counters; never held across SQLite calls
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.swept = 0
+        self._puts = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = self._open_db(Path(path))
+            self._sweep()
+
+    @staticmethod
+    def _open_db(path: Path) -> sqlite3.Connection:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, vec BLOB NOT NULL,"
+            " last_used INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in db.execute("PRAGMA table_info(query_embeddings)")}
+        if "last_used" not in columns:  # files written before the sweep existed
+            db.execute("ALTER TABLE query_embeddings ADD COLUMN last_used INTEGER NOT NULL DEFAULT 0")
+        db.execute("CREATE INDEX IF NOT EXISTS query_embeddings_last_used ON query_embeddings (last_used)")
+        return db
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        if self.max_entries <= 0:
+            return None
+        k = self.key(model, text)
+        vec = self._get_memory(k)
+        if vec is None and self._db is not None:
+            vec = self._get_disk(k)
+        if vec is None:
+            with self._lock:
+                self.misses += 1
+        return vec
+
+    async def get_async(self, model: str, text: str) -> Optional[np.ndarray]:
+        """get() from the event loop: a memory miss is looked up in SQLite in a worker thread."""
+        if self.max_entries <= 0:
+            return None
+        k = self.key(model, text)
+        vec = self._get_memory(k)
+        if vec is None and self._db is not None:
+            vec = await asyncio.to_thread(self._get_disk, k)
+        if vec is None:
+            with self._lock:
+                self.misses += 1
+        return vec
+
+    def _get_memory(self, k: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vec = self._lru.get(k)
+            if vec is not None:
+                self._lru.move_to_end(k)
+                self.hits += 1
+            return vec
+
+    def _get_disk(self, k: str) -> Optional[np.ndarray]:
+        with self._db_lock:
+            row = self._db.execute("SELECT vec FROM query_embeddings WHERE key = ?", (k,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE query_embeddings SET last_used = ? WHERE key = ?", (int(time.time()), k))
+        vec = np.frombuffer(row[0], dtype="float32")
+        with self._lock:
+            self._remember(k, vec)
+            self.disk_hits += 1
+        return vec
+
+    def put(self, model: str, text: str, vec: np.ndarray) -> np.ndarray:
+        """Stores `vec` (as a read-only float32 array) and returns the stored array."""
+        vec, k = self._put_memory(model, text, vec)
+        if k is not None and self._db is not None:
+            self._put_disk(k, model, vec)
+        return vec
+
+    async def put_async(self, model: str, text: str, vec: np.ndarray) -> np.ndarray:
+        """put() from the event loop: the SQLite write runs in a worker thread."""
+        vec, k = self._put_memory(model, text, vec)
+        if k is not None and self._db is not None:
+            await asyncio.to_thread(self._put_disk, k, model, vec)
+        return vec
+
+    def _put_memory(self, model: str, text: str, vec: np.ndarray) -> Tuple[np.ndarray, Optional[str]]:
+        vec = np.array(vec, dtype="float32").ravel()
+        vec.setflags(write=False)
+        if self.max_entries <= 0:
+            return vec, None
+        k = self.key(model, text)
+        with self._lock:
+            self._remember(k, vec)
+        return vec, k
+
+    def _put_disk(self, k: str, model: str, vec: np.ndarray) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, model, dim, vec, last_used) VALUES (?,?,?,?,?)",
+                (k, model, int(vec.shape[0]), vec.tobytes(), int(time.time())),
+            )
+            self._puts += 1
+            due = self._puts % _SWEEP_EVERY == 0
+        if due:
+            self._sweep()
+
+    def _sweep(self) -> None:
+        """Deletes the least recently used rows beyond disk_rows."""
+        if self._db is None or self.disk_rows <= 0:
+            return
+        with self._db_lock:
+            cur = self._db.execute(
+                "DELETE FROM query_embeddings WHERE key IN ("
+                " SELECT key FROM query_embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.disk_rows,),
+            )
+        with self._lock:
+            self.swept += max(cur.rowcount, 0)
+
+    def _remember(self, k: str, vec: np.ndarray) -> None:
+        self._lru[k] = vec
+        self._lru.move_to_end(k)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._lru),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "swept": self.swept,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM query_embeddings")
@@ -0,0 +1,166 @@
+# rag/embed_pipeline.py
+# pipelined, rate-limit-aware embedding for the index builder
+#
+#   producer (chunking) --add()--> token-sized batches --> bounded window of N worker threads
+#                                                      --> results handed back in submission order
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+import openai
+
+from rag.tokens import count_tokens
+
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))  # parallel embedding requests
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "20000"))  # per request (API limit is 300k)
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBED_BACKOFF_BASE = float(os.getenv("EMBED_BACKOFF_BASE", "1.0"))  # seconds, doubled per attempt
+EMBED_BACKOFF_MAX = float(os.getenv("EMBED_BACKOFF_MAX", "60"))
+
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(e, openai.APIStatusError) and e.status_code >= 500
+
+
+def _retry_after(e: Exception) -> Optional[float]:
+    response = getattr(e, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class EmbedPipeline:
+    """
+    Batches (key, text) items by token count and embeds them on `concurrency` threads.
+
+    - add() blocks once `2 * concurrency` batches are in flight (backpressure on the producer).
+    - Batches complete in any order but `on_batch(keys, vecs)` is always called in submission
+      order, on the producer's thread, so whatever it writes is deterministic.
+    - 429 / 5xx / connection errors are retried with jittered exponential backoff
+      (honouring Retry-After); a 429 pauses *all* workers, not just the one that hit it.
+    """
+
+    def __init__(
+        self,
+        client: openai.OpenAI,
+        model: str,
+        on_batch: Callable[[List, np.ndarray], None],
+        *,
+        concurrency: int = EMBED_CONCURRENCY,
+        max_tokens: int = EMBED_BATCH_TOKENS,
+        max_inputs: int = 2048,
+        timeout: float = 60.0,
+        max_retries: int = EMBED_MAX_RETRIES,
+    ):
+        # retries are scheduled here, not inside the SDK
+        self.client = client.with_options(max_retries=0)
+        self.model = model
+        self.on_batch = on_batch
+        self.concurrency = max(1, concurrency)
+        self.max_tokens = max_tokens
+        self.max_inputs = max(1, max_inputs)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._pool = ThreadPoolExecutor(self.concurrency, thread_name_prefix="embed")
+        self._inflight: Deque[Tuple[List, Future]] = deque()
+        self._keys: List = []
+        self._texts: List[str] = []
+        self._tokens = 0
+        self._pause_until = 0.0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.embedded = 0
+        self.tokens = 0
+
+    def add(self, key, text: str) -> None:
+        n = count_tokens(text)
+        if self._texts and (self._tokens + n > self.max_tokens or len(self._texts) >= self.max_inputs):
+            self._submit()
+        self._keys.append(key)
+        self._texts.append(text)
+        self._tokens += n
+
+    def close(self) -> None:
+        """Flushes the last partial batch and waits for everything in flight."""
+        try:
+            if self._texts:
+                self._submit()
+            while self._inflight:
+                self._drain_one()
+        finally:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "EmbedPipeline":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def _submit(self) -> None:
+        keys, texts, tokens = self._keys, self._texts, self._tokens
+        self._keys, self._texts, self._tokens = [], [], 0
+        self.tokens += tokens
+        while len(self._inflight) >= 2 * self.concurrency:
+            self._drain_one()
+        self._inflight.append((keys, self._pool.submit(self._embed, texts)))
+
+    def _drain_one(self) -> None:
+        keys, fut = self._inflight.popleft()
+        vecs = fut.result()
+        self.embedded += len(keys)
+        self.on_batch(keys, vecs)
+
+    def _wait_for_pause(self) -> None:
+        with self._lock:
+            delay = self._pause_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _embed(self, texts: Sequence[str]) -> np.ndarray:
+        attempt = 0
+        while True:
+            self._wait_for_pause()
+            try:
+                with self._lock:
+                    self.requests += 1
+                resp = self.client.embeddings.create(model=self.model, input=list(texts), timeout=self.timeout)
+                vecs = np.array([d.embedding for d in sorted(resp.data, key=lambda d: d.index)], dtype="float32")
+                faiss.normalize_L2(vecs)  # cosine-like similarity with IndexFlatIP
+                return vecs
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                attempt += 1
+                delay = _retry_after(e) or min(EMBED_BACKOFF_MAX, EMBED_BACKOFF_BASE * 2 ** (attempt - 1))
+                delay *= random.uniform(0.5, 1.5)  # jitter so workers don't retry in lockstep
+                with self._lock:
+                    self.retries += 1
+                    if isinstance(e, openai.RateLimitError):
+                        self._pause_until = max(self._pause_until, time.monotonic() + delay)
+                print(f"Embedding batch of {len(texts)} failed ({type(e).__name__}), retry {attempt} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "embedded": self.embedded,
+            "tokens": self.tokens,
+            "concurrency": self.concurrency,
+        }
@@ -0,0 +1,202 @@
+# rag/extractive.py
+# answers built from the retrieved chunks alone (no chat model): the best-matching sentences + where they came from
+#
+# Fast path (fact_answer, routing/policy.route_fact): a question after a short literal fact (fee,
+# date, score, duration) is answered with the one sentence or table row stating it, when
+#   FASTPATH_MIN_SCORE=0.5      the chunk holding it was retrieved with at least this cosine score,
+#   FASTPATH_CHUNKS=2           among the top this many chunks,
+#   FASTPATH_MIN_COVERAGE=0.75  and this share of the question's terms appears in the sentence or
+#                               its chunk's section heading,
+# and the sentence holds the kind of literal the question asks for (an amount for "how much" / fee
+# questions, a date for "when" / deadline, a score for IELTS / TOEFL, ...): "40% tuition fee rebate"
+# never answers "what is the tuition fee". Among equally covering sentences the most specific one
+# (fewest terms beside the question's) wins. Anything less goes to the chat model as before.
+from __future__ import annotations
+
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from rag.lexical import tokenize
+from rag.metrics import registry
+
+EXTRACTIVE_INTRO = "Here is what the official MSc EDI information says:"
+
+FASTPATH_MIN_SCORE = float(os.getenv("FASTPATH_MIN_SCORE", "0.5"))
+FASTPATH_MIN_COVERAGE = float(os.getenv("FASTPATH_MIN_COVERAGE", "0.75"))
+FASTPATH_CHUNKS = int(os.getenv("FASTPATH_CHUNKS", "2"))
+
+FASTPATH = registry.counter(
+    "rag_fastpath_total",
+    "Fact questions (fees, dates, scores) by extractive fast-path outcome: fired, or declined to the chat model.",
+    ("outcome",),
+)
+
+_LABEL_RE = re.compile(r"^\[([^\]|]+?)(?:\s*\|\s*([^\]]*))?\]\s*")
+_SENTENCE_RE = re.compile(r"(?:[^.!?\n]|\.(?=\d))+(?:[.!?]+|$)")  # "IELTS 6.5" is one sentence
+_MIN_SENTENCE_CHARS = 25
+_MIN_FACT_CHARS = 12  # table rows are short: "Application fee: S$50"
+_MAX_FACT_CHARS = 300
+_LITERAL_BONUS = 1.0  # best_sentences: a sentence holding the literal a fact question asks for
+
+_MONTH = r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)"
+_MONEY_RE = re.compile(r"(?:\b(?:SGD|USD)|S?\$)\s?\d", re.IGNORECASE)
+_PERCENT_RE = re.compile(r"\d\s?%")
+_DATE_RE = re.compile(rf"\b\d{{1,2}}\s+{_MONTH}\b|\b{_MONTH}\s+\d{{1,4}}\b|\b\d{{1,2}}/\d{{1,2}}/\d{{2,4}}\b", re.IGNORECASE)
+_SCORE_RE = re.compile(r"(?<![\d,.])\d{1,3}(?:\.\d)?(?![\d,])")
+_DURATION_RE = re.compile(
+    r"\b(?:\d+|one|two|three|four|six|twelve|eighteen)[\s-]+(?:years?|months?|semesters?|weeks?|days?)\b", re.IGNORECASE
+)
+_COUNT_RE = re.compile(r"\b\d+\b")
+# (question wording, literal a sentence answering it must contain); the "how much / when / how
+# long / how many" wordings decide alone, else any of the matching nouns will do
+_CUE_LITERALS = (
+    (re.compile(r"\bhow much\b", re.IGNORECASE), _MONEY_RE),
+    (re.compile(r"\bwhen\b", re.IGNORECASE), _DATE_RE),
+    (re.compile(r"\bhow long\b", re.IGNORECASE), _DURATION_RE),
+    (re.compile(r"\bhow many\b", re.IGNORECASE), _COUNT_RE),
+)
+_NOUN_LITERALS = (
+    (re.compile(r"\b(?:fees?|costs?|tuition|price)\b", re.IGNORECASE), _MONEY_RE),
+    (re.compile(r"\b(?:rebates?|discounts?|percent(?:age)?)\b", re.IGNORECASE), _PERCENT_RE),
+    (re.compile(r"\b(?:deadline|closing date|application window|dates?|intake)\b", re.IGNORECASE), _DATE_RE),
+    (re.compile(r"\b(?:ielts|toefl|score)\b", re.IGNORECASE), _SCORE_RE),
+    (re.compile(r"\bduration\b", re.IGNORECASE), _DURATION_RE),
+    (re.compile(r"\b(?:credits?|units)\b", re.IGNORECASE), _COUNT_RE),
+)
+# question wording the literal itself answers ("how MUCH is ..." -> "SGD 109"), not counted in coverage
+_CUE_TERMS = frozenset(("much", "many", "long", "need"))
+
+
+def split_label(text: str) -> Tuple[str, str, str]:
+    """'[source | heading] body' -> (source, heading, body); the builder prepends that label."""
+    m = _LABEL_RE.match(text or "")
+    if not m:
+        return "", "", (text or "").strip()
+    return m.group(1).strip(), (m.group(2) or "").strip(), text[m.end():].strip()
+
+
+def source_title(chunk: Dict[str, Any]) -> str:
+    """Human-readable origin of a chunk: "<page> – <section>" from chunk meta or the text label."""
+    meta = chunk.get("meta") or {}
+    source, heading, _ = split_label(chunk.get("text", ""))
+    source = meta.get("source") or source
+    section = (meta.get("section") or heading).split(" > ")[0]
+    if section.startswith("chunk "):
+        section = ""
+    page = source.rsplit(".", 1)[0] if source.endswith(".txt") else source
+    page = page.replace("cde.nus.edu.sg_edic_msc_", "").strip("_").replace("-", " ").replace("_", " ")
+    page = page or "programme page"
+    return f"{page} – {section}" if section else page
+
+
+def split_sentences(body: str) -> List[str]:
+    """
+    Sentences of a chunk body, whitespace-normalised. Each line is split on its own, so table rows
+    ("Application fee\tSGD 109") and headings without closing punctuation are candidates too.
+    """
+    out = []
+    for line in body.splitlines():
+        for m in _SENTENCE_RE.finditer(line):
+            s = " ".join(m.group().split())
+            if s:
+                out.append(s)
+    return out
+
+
+def fact_literals(question: str) -> List[re.Pattern]:
+    """Literal patterns a sentence must match (any of) to state the fact the question asks for; [] if none."""
+    cued = [lit for q_re, lit in _CUE_LITERALS if q_re.search(question)]
+    return cued or [lit for q_re, lit in _NOUN_LITERALS if q_re.search(question)]
+
+
+def best_sentences(
+    question: str, chunks: List[Dict[str, Any]], max_sentences: int = 3
+) -> List[Tuple[float, int, str]]:
+    """
+    (score, chunk rank, sentence) for the sentences sharing the most (rarer) terms with the question;
+    for a fact question ("how much is ...") sentences holding the literal it asks for come first.
+    """
+    q_terms = set(tokenize(question))
+    if not q_terms or not chunks:
+        return []
+    literals = fact_literals(question)
+    sentences: List[Tuple[int, str, set, bool]] = []
+    df: Dict[str, int] = {}
+    for rank, c in enumerate(chunks):
+        _, _, body = split_label(c.get("text", ""))
+        for s in split_sentences(body):
+            literal = any(lit.search(s) for lit in literals)
+            # table rows are short: "Application fee: S$50"
+            if len(s) < (_MIN_FACT_CHARS if literal else _MIN_SENTENCE_CHARS) or s.endswith("?"):
+                continue  # fragments, and FAQ questions (the answer is the next sentence)
+            terms = set(tokenize(s))
+            sentences.append((rank, s, terms, literal))
+            for t in terms & q_terms:
+                df[t] = df.get(t, 0) + 1
+    n = len(sentences)
+    scored = []
+    seen = set()
+    for rank, s, terms, literal in sentences:
+        if s in seen:
+            continue  # overlapping chunks repeat sentences
+        seen.add(s)
+        shared = terms & q_terms
+        if not shared:
+            continue
+        # rarer shared terms count more; earlier (better retrieved) chunks break ties
+        score = sum(math.log(1 + n / df[t]) for t in shared) - 0.05 * rank + (_LITERAL_BONUS if literal else 0.0)
+        scored.append((score, rank, s))
+    scored.sort(key=lambda x: -x[0])
+    return scored[:max_sentences]
+
+
+def extractive_answer(question: str, chunks: List[Dict[str, Any]], max_sentences: int = 3) -> Optional[str]:
+    """A short bullet answer quoting the context, or None when no sentence matches the question."""
+    picked = best_sentences(question, chunks, max_sentences)
+    if not picked:
+        return None
+    top_rank = picked[0][1]
+    bullets = "\n".join(f"• {s}" for _, _, s in picked)
+    return f"{EXTRACTIVE_INTRO}\n\n{bullets}\n\nSource: {source_title(chunks[top_rank])}"
+
+
+def fact_sentence(question: str, chunks: List[Dict[str, Any]]) -> Optional[Tuple[float, int, str]]:
+    """(coverage, chunk rank, sentence) stating the fact the question asks for, or None below the thresholds."""
+    literals = fact_literals(question)
+    q_terms = set(tokenize(question)) - _CUE_TERMS
+    if not q_terms or not literals:
+        return None
+    best: Optional[Tuple[float, int, str]] = None
+    best_key: Tuple[float, float] = (0.0, 0.0)
+    for rank, c in enumerate(chunks[:FASTPATH_CHUNKS]):
+        score = c.get("score")
+        if not isinstance(score, (int, float)) or score < FASTPATH_MIN_SCORE:
+            continue
+        _, heading, body = split_label(c.get("text", ""))
+        # "what is the deadline" under "Application > Deadlines": the heading names the fact
+        heading_terms = set(tokenize((c.get("meta") or {}).get("section") or heading))
+        for s in split_sentences(body):
+            if not _MIN_FACT_CHARS <= len(s) <= _MAX_FACT_CHARS or s.endswith("?"):
+                continue
+            if not any(lit.search(s) for lit in literals):
+                continue
+            terms = set(tokenize(s))
+            coverage = len(q_terms & (terms | heading_terms)) / len(q_terms)
+            if coverage < FASTPATH_MIN_COVERAGE:
+                continue
+            # specificity: share of the sentence's terms that are the question's; ties keep the earlier one
+            key = (coverage, len(q_terms & terms) / max(len(terms), 1))
+            if best is None or key > best_key:
+                best, best_key = (coverage, rank, s), key
+    return best
+
+
+def fact_answer(question: str, chunks: List[Dict[str, Any]]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """(answer, chunk): the sentence stating the fact + its source, or None when not confident enough."""
+    hit = fact_sentence(question, chunks)
+    if hit is None:
+        return None
+    _, rank, sentence = hit
+    return f"{sentence}\n\nSource: {source_title(chunks[rank])}", chunks[rank]
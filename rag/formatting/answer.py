@@ -0,0 +1,343 @@
+# rag/formatting/answer.py
+# single-pass answer formatter: same output as format_answer_text(format_markdown_safe(text))
+#
+# markdown.py / text.py rewrite the whole answer a dozen times (split/join per step, then
+# regex substitutions over the full text). Here every step is a small state machine over lines
+# with at most one line of lookahead, chained as generators: each input line goes through all
+# of them once, and the answer is joined once at the end. The stages mirror the reference
+# steps one to one (same order, same conditions), so the two can be compared line by line;
+# bench/bench_format.py checks the equivalence on bench/format_corpus.jsonl and random answers.
+#
+# Inputs the line model does not cover are handed to the reference pipeline unchanged:
+# non-ASCII digits (the reference's "\n\n<digits> words\n\n" rule only fires for those), a "•"
+# at the end of a line or right after another, and a bold line right after a line ending in
+# "<digits>." (all rewrite across a line break). They do not occur in normal answers.
+from __future__ import annotations
+
+import functools
+import re
+from typing import Iterable, Iterator, List
+
+from rag.formatting.markdown import _BULLET_RE, _CODE_FENCE_RE, _HEADING_RE, _INLINE_H3_RE, format_markdown_safe
+from rag.formatting.text import format_answer_text
+from rag.routing import fallbacks
+
+_JOIN_WORD_RE = re.compile(r"\b(in|to|of|be|is|are|was|were)$", re.IGNORECASE)
+_NON_ASCII_DIGIT_RE = re.compile(r"[^\D0-9]")
+_BLANK_RUN_RE = re.compile(r"\n{3,}")
+
+# format_answer_text rules, applied to one line at a time
+_NUMBERED_AFTER_COLON_RE = re.compile(r":\s*(\d+\.)\s+\*\*")
+_NUMBERED_INLINE_RE = re.compile(r"(?<!\n)\s+(\d+\.)\s+\*\*")
+_NUMBERED_START_RE = re.compile(r"(\d+\.)\s+\*\*")
+_NUMBERED_END_RE = re.compile(r"\d+\.$")
+_BULLET_AFTER_TEXT_RE = re.compile(r"([^\n])\s*(•\s+)")
+_BULLET_AFTER_SPACE_RE = re.compile(r"\s+(•\s+)")
+_BULLET_AFTER_NEWLINE_RE = re.compile(r"\n(•\s+)")
+_BULLET_START_RE = re.compile(r"\s*(•\s+)")
+
+_LOWER_OR_DIGIT = frozenset("abcdefghijklmnopqrstuvwxyz0123456789")
+_BULLET_FIRST = frozenset("-*0123456789")
+
+
+class _Unsupported(Exception):
+    """Raised inside the pipeline when the input needs the reference implementation."""
+
+
+def _is_heading(s: str) -> bool:
+    return s[:1] == "#" and _HEADING_RE.match(s) is not None
+
+
+def _is_bullet(s: str) -> bool:
+    return bool(s) and s[0] in _BULLET_FIRST and _BULLET_RE.match(s) is not None
+
+
+# -----------------------------
+# format_markdown_safe, one generator per step
+# -----------------------------
+
+def _lines(text: str) -> Iterator[str]:
+    for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        yield line.rstrip()
+
+
+def _continues_heading(s: str) -> bool:
+    return (
+        len(s.split()) <= 7
+        and not s.startswith(("#", "-", "*"))
+        and not _BULLET_RE.match(s)
+        and not s.endswith((".", "!"))
+    )
+
+
+def _rejoin_split_headings(lines: Iterable[str]) -> Iterator[str]:
+    """'### Why the EDI' + 'programme?' (blank lines between allowed) -> one heading line."""
+    held = None
+    blanks = 0
+    for line in lines:
+        if held is not None:
+            s = line.strip()
+            if not s:
+                blanks += 1
+                continue
+            if _continues_heading(s):
+                yield f"{held.strip()} {s}"
+                held = None
+                continue
+            yield held
+            yield from [""] * blanks
+            held = None
+        if line.strip().startswith("###"):
+            held, blanks = line, 0
+        else:
+            yield line
+    if held is not None:
+        yield held
+        yield from [""] * blanks
+
+
+def _split_inline_h3_headings(lines: Iterable[str]) -> Iterator[str]:
+    """'### Programme overview The MSc ...' -> heading, blank line, paragraph."""
+    for line in lines:
+        s = line.strip()
+        m = _INLINE_H3_RE.match(s) if s.startswith("###") else None
+        if not m:
+            yield line
+            continue
+        prefix, rest = m.group(1), m.group(2).strip()
+        if len(rest.split()) <= 5:
+            yield f"{prefix}{rest}"
+            continue
+        the_idx = rest.lower().find(" the ")
+        if the_idx != -1:
+            title, cont = rest[:the_idx].strip(), rest[the_idx + 1:].strip()
+            if title and cont:
+                yield f"{prefix}{title}"
+                yield ""
+                yield cont
+                continue
+        words = rest.split()
+        yield f"{prefix}{' '.join(words[:3])}"
+        yield ""
+        yield " ".join(words[3:]).strip()
+
+
+def _reflow_paragraphs(lines: Iterable[str]) -> Iterator[str]:
+    """Joins hard-wrapped paragraph lines; headings, list items, blank lines and code pass through."""
+    buf: List[str] = []
+    in_code = False
+    for line in lines:
+        if "```" in line and _CODE_FENCE_RE.match(line):
+            if buf:
+                yield " ".join(buf)
+                buf = []
+            yield line
+            in_code = not in_code
+            continue
+        if in_code:
+            yield line
+            continue
+        s = line.strip()
+        if not s:
+            if buf:
+                yield " ".join(buf)
+                buf = []
+            yield ""
+        elif _is_heading(s) or _is_bullet(s):
+            if buf:
+                yield " ".join(buf)
+                buf = []
+            yield line
+        else:
+            buf.append(s)
+    if buf:
+        yield " ".join(buf)
+
+
+def _join_across_blank_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    A blank line followed by a lowercase/digit start, or one after a dangling "in/to/of/is..."
+    followed by a word, was an accidental break: the lines on both sides are joined.
+    """
+    held: List[str] = []
+    for line in lines:
+        if len(held) >= 2 and held[-1] == "" and line and (
+            line[0] in _LOWER_OR_DIGIT
+            or ((line[0].isalnum() or line[0] == "_") and _JOIN_WORD_RE.search(held[-2]))
+        ):
+            held.pop()
+            held[-1] = f"{held[-1]} {line}"
+            continue
+        held.append(line)
+        if len(held) > 2:
+            yield held.pop(0)
+    yield from held
+
+
+def _tighten_bullets(lines: Iterable[str]) -> Iterator[str]:
+    """Drops a blank line between two list items."""
+    prev_bullet = False
+    held_blank = False
+    for line in lines:
+        s = line.strip()
+        bullet = _is_bullet(s)
+        if held_blank:
+            held_blank = False
+            if not bullet:
+                yield ""
+        if not s and prev_bullet:
+            held_blank = True
+        else:
+            yield line
+        prev_bullet = bullet
+    if held_blank:
+        yield ""
+
+
+def _blank_line_after_headings(lines: Iterable[str]) -> Iterator[str]:
+    prev_heading = False
+    for line in lines:
+        s = line.strip()
+        if prev_heading and s:
+            yield ""
+        yield line
+        prev_heading = _is_heading(s)
+
+
+def _blank_lines_around_lists(lines: Iterable[str]) -> Iterator[str]:
+    prev, prev_s, prev_bullet = "", "", False
+    cur = None
+    for nxt in lines:
+        nxt_s = nxt.strip()
+        nxt_bullet = _is_bullet(nxt_s)
+        if cur is not None:
+            yield from _around_list(prev_s, prev_bullet, cur, cur_s, cur_bullet, nxt_s, nxt_bullet)
+            prev_s, prev_bullet = cur_s, cur_bullet
+        cur, cur_s, cur_bullet = nxt, nxt_s, nxt_bullet
+    if cur is not None:
+        yield from _around_list(prev_s, prev_bullet, cur, cur_s, cur_bullet, "", False)
+
+
+def _around_list(prev_s, prev_bullet, cur, cur_s, cur_bullet, nxt_s, nxt_bullet) -> Iterator[str]:
+    if cur_bullet and prev_s and not prev_bullet and not _is_heading(prev_s):
+        yield ""
+    yield cur
+    if cur_bullet and nxt_s and not nxt_bullet:
+        yield ""
+
+
+def _markdown_lines(text: str) -> Iterator[str]:
+    lines = _lines(text)
+    lines = _rejoin_split_headings(lines)
+    lines = _split_inline_h3_headings(lines)
+    lines = _reflow_paragraphs(lines)
+    lines = _join_across_blank_lines(lines)
+    lines = _tighten_bullets(lines)
+    lines = _blank_line_after_headings(lines)
+    return _blank_lines_around_lists(lines)
+
+
+# -----------------------------
+# format_answer_text on top of those lines
+# -----------------------------
+
+def _numbered(s: str) -> str:
+    if "**" in s:
+        s = _NUMBERED_AFTER_COLON_RE.sub(r":\n\n\1 **", s)
+        s = _NUMBERED_INLINE_RE.sub(r"\n\n\1 **", s)
+    return s
+
+
+def _bullets(s: str) -> str:
+    if "•" in s:
+        s = _BULLET_AFTER_TEXT_RE.sub(r"\1\n\2", s)
+        s = _BULLET_AFTER_SPACE_RE.sub(r"\n\1", s)
+        s = _BULLET_AFTER_NEWLINE_RE.sub(r"\n\n\1", s)
+    return s
+
+
+def _answer_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Numbered bold items ("2. **Step**") and "•" bullets start their own line after one blank
+    line; other lines keep their place, with blank runs collapsed to one.
+    """
+    first = True
+    blank = False
+    prev = ""
+    for line in lines:
+        if not line:
+            blank = not first
+            continue
+        if line.endswith("•") or "••" in line or (line.lstrip().startswith("**") and _NUMBERED_END_RE.search(prev)):
+            raise _Unsupported
+        if first:
+            line = line.lstrip()
+            out = _bullets(_numbered(line))
+        else:
+            s = line.lstrip()
+            m = _NUMBERED_START_RE.match(s) if s[:1].isdigit() else None
+            if m:
+                blank = True
+                line = f"{m.group(1)} **{_numbered(s[m.end():])}"
+            else:
+                line = _numbered(line)
+            m = _BULLET_START_RE.match(line) if "•" in line else None
+            if m:
+                blank = True
+                out = m.group(1) + _bullets(line[m.end():])
+            else:
+                out = _bullets(line)
+            if blank:
+                yield ""
+        yield out
+        first = blank = False
+        prev = line
+
+
+def format_markdown(text: str) -> str:
+    """format_markdown_safe in one pass."""
+    if not isinstance(text, str) or not text.strip():
+        return text
+    if _NON_ASCII_DIGIT_RE.search(text):
+        return format_markdown_safe(text)
+    out: List[str] = []
+    blanks = 0
+    for line in _markdown_lines(text):
+        if line:
+            blanks = 0
+        else:
+            blanks += 1
+            if blanks > 2:
+                continue
+        out.append(line)
+    return "\n".join(out).strip() + "\n"
+
+
+def format_answer(text: str) -> str:
+    """format_answer_text(format_markdown_safe(text)) in one pass: the final form of an answer."""
+    if not isinstance(text, str):
+        return text
+    if not text.strip():
+        return "" if text else text
+    if _NON_ASCII_DIGIT_RE.search(text):
+        return format_answer_text(format_markdown_safe(text))
+    try:
+        out = "\n".join(_answer_lines(_markdown_lines(text))).strip()
+    except _Unsupported:
+        return format_answer_text(format_markdown_safe(text))
+    return _BLANK_RUN_RE.sub("\n\n", out) if "\n\n\n" in out else out
+
+
+@functools.lru_cache(maxsize=256)
+def format_static(text: str, markdown_only: bool = False) -> str:
+    """
+    Formatted form of a canned answer (fallbacks, route replies, nudges), computed once.
+    markdown_only=True gives format_markdown_safe's form, which the routes have always returned.
+    """
+    return format_markdown(text) if markdown_only else format_answer(text)
+
+
+for _name, _value in vars(fallbacks).items():
+    if _name.isupper() and isinstance(_value, str):
+        format_static(_value)
+        format_static(_value, markdown_only=True)
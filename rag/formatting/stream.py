@@ -0,0 +1,68 @@
+# rag/formatting/stream.py
+# incremental answer formatting for streamed (SSE) completions
+from __future__ import annotations
+
+import re
+
+from rag.formatting.answer import format_answer
+
+# A trailing token that only makes sense once the next token arrives:
+# bullet / numbered-list markers and bare heading hashes.
+_DANGLING_MARKER_RE = re.compile(r"(?:^|\s)(?:[•*\-]|\d+\.|#{1,6})\s*$")
+
+
+def format_partial(text: str) -> str:
+    """Same formatting the router applies to a complete answer (rag/formatting/answer.py)."""
+    return format_answer(text)
+
+
+class StreamFormatter:
+    """
+    Incremental view of format_answer(answer).
+
+    feed(delta) appends raw model output and returns the newly *stable* formatted text:
+    - only the prefix up to the last whitespace is formatted (a half-received word is held back)
+    - a dangling list marker ("•", "-", "1.") or an unfinished heading line is held back,
+      because bullet/heading normalization depends on what follows it
+    - text is only emitted when the formatted prefix extends what was already sent;
+      if a later token rewrites earlier layout, emission pauses and the caller's final
+      (fully formatted) answer is authoritative
+    """
+
+    def __init__(self) -> None:
+        self._raw = ""
+        self._cut = 0
+        self.emitted = ""
+
+    def _stable_cut(self) -> int:
+        raw = self._raw
+        ws = max(raw.rfind(" "), raw.rfind("\n"), raw.rfind("\t"))
+        if ws <= 0:
+            return 0
+        prefix = raw[:ws]
+
+        # hold back an unfinished heading line
+        line_start = prefix.rfind("\n") + 1
+        if raw[line_start:].lstrip().startswith("#") and "\n" not in raw[line_start:]:
+            return line_start
+
+        m = _DANGLING_MARKER_RE.search(prefix)
+        if m:
+            return m.start()
+        return ws
+
+    def feed(self, delta: str) -> str:
+        if not delta:
+            return ""
+        self._raw += delta
+        cut = self._stable_cut()
+        if cut <= self._cut:
+            return ""
+        self._cut = cut
+
+        formatted = format_partial(self._raw[:cut])
+        if not formatted or not formatted.startswith(self.emitted) or len(formatted) == len(self.emitted):
+            return ""
+        out = formatted[len(self.emitted):]
+        self.emitted = formatted
+        return out
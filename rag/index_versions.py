@@ -0,0 +1,90 @@
+# rag/index_versions.py
+# versioned index directory with an atomic "CURRENT" pointer
+#
+#   index/
+#     CURRENT                         -> one line: name of the live version directory
+#     v20260303-101500-4f10035d/
+#       faiss.index
+#       chunks.bin, chunks.offsets.npy, chunks.meta.jsonl
+#       lexical.npz                   BM25 postings (rag/lexical.py)
+#       manifest.json
+#
+# The builder writes a complete new version directory first and only then flips CURRENT
+# (write temp file + os.replace), so a reader never sees a half-written version.
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+POINTER_NAME = "CURRENT"
+FAISS_NAME = "faiss.index"
+CHUNKS_NAME = "chunks.bin"
+MANIFEST_NAME = "manifest.json"
+
+
+def read_current(index_dir: Path) -> Optional[str]:
+    """Name of the live version, or None if the directory has no pointer yet."""
+    pointer = Path(index_dir) / POINTER_NAME
+    try:
+        name = pointer.read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return name or None
+
+
+def current_dir(index_dir: Path) -> Optional[Path]:
+    name = read_current(index_dir)
+    if not name:
+        return None
+    path = Path(index_dir) / name
+    if not (path / FAISS_NAME).exists():
+        raise FileNotFoundError(f"{POINTER_NAME} points at an incomplete version: {path}")
+    return path
+
+
+def new_version_name(tag: str = "") -> str:
+    name = time.strftime("v%Y%m%d-%H%M%S", time.gmtime())
+    return f"{name}-{tag}" if tag else name
+
+
+def publish(index_dir: Path, name: str) -> None:
+    """Atomically makes `name` the live version."""
+    index_dir = Path(index_dir)
+    if not (index_dir / name / FAISS_NAME).exists():
+        raise FileNotFoundError(f"Refusing to publish incomplete version: {index_dir / name}")
+    tmp = index_dir / f".{POINTER_NAME}.{os.getpid()}.tmp"
+    tmp.write_text(name + "\n", encoding="utf-8")
+    os.replace(tmp, index_dir / POINTER_NAME)
+
+
+def write_manifest(version_dir: Path, info: Dict[str, Any]) -> None:
+    (Path(version_dir) / MANIFEST_NAME).write_text(
+        json.dumps(info, indent=2, ensure_ascii=False), encoding="utf-8"
+    )
+
+
+def list_versions(index_dir: Path) -> List[str]:
+    index_dir = Path(index_dir)
+    if not index_dir.exists():
+        return []
+    return sorted(
+        p.name for p in index_dir.iterdir()
+        if p.is_dir() and not p.name.startswith(".") and (p / FAISS_NAME).exists()
+    )
+
+
+def prune(index_dir: Path, keep: int = 3) -> List[str]:
+    """Deletes all but the newest `keep` versions (never the live one). Returns removed names."""
+    live = read_current(index_dir)
+    versions = list_versions(index_dir)
+    removed = []
+    for name in versions[: max(0, len(versions) - keep)]:
+        if name == live:
+            continue
+        shutil.rmtree(Path(index_dir) / name, ignore_errors=True)
+        removed.append(name)
+    return removed
@@ -0,0 +1,128 @@
+# rag/lexical.py
+# BM25 inverted index over the chunk texts + reciprocal rank fusion with the vector ranking
+#
+# Stored next to faiss.index as lexical.npz (CSR postings, no pickle):
+#   terms     str[V]       sorted vocabulary
+#   indptr    int64[V + 1] postings of terms[t] are docs[indptr[t]:indptr[t + 1]]
+#   docs      int32[P]     chunk ids
+#   tfs       float32[P]   term frequency in that chunk
+#   doc_len   float32[N]   tokens per chunk
+from __future__ import annotations
+
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+LEXICAL_NAME = "lexical.npz"
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# module codes ("CDE5301", "EDI5001"), amounts ("53,000" -> "53000"), words
+_TOKEN_RE = re.compile(r"[a-z]+\d+[a-z]?|\d+(?:[.,]\d+)*|[a-z]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it its me my of on or "
+    "the this to what when where which who will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    out = []
+    for t in _TOKEN_RE.findall((text or "").lower()):
+        if t in _STOPWORDS:
+            continue
+        out.append(t.replace(",", ""))
+    return out
+
+
+class LexicalIndex:
+    """Okapi BM25 over chunk ids 0..N-1 (same ids as the FAISS rows)."""
+
+    def __init__(self, terms: Sequence[str], indptr: np.ndarray, docs: np.ndarray, tfs: np.ndarray, doc_len: np.ndarray):
+        self.terms = list(terms)
+        self._term_ids: Dict[str, int] = {t: i for i, t in enumerate(self.terms)}
+        self.indptr = indptr
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_len = doc_len
+        n = len(doc_len)
+        self.n_docs = n
+        avgdl = float(doc_len.mean()) if n else 1.0
+        df = np.diff(indptr).astype("float32")
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype("float32")
+        # per-posting length normalisation, precomputed once
+        self._norm = (BM25_K1 * (1 - BM25_B + BM25_B * doc_len / max(avgdl, 1e-9))).astype("float32")
+
+    @classmethod
+    def build(cls, texts: Iterable[str]) -> "LexicalIndex":
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_len: List[int] = []
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((i, tf))
+        terms = sorted(postings)
+        indptr = np.zeros(len(terms) + 1, dtype="int64")
+        for k, t in enumerate(terms):
+            indptr[k + 1] = indptr[k] + len(postings[t])
+        docs = np.empty(int(indptr[-1]), dtype="int32")
+        tfs = np.empty(int(indptr[-1]), dtype="float32")
+        for k, t in enumerate(terms):
+            pl = postings[t]
+            docs[indptr[k]:indptr[k + 1]] = [d for d, _ in pl]
+            tfs[indptr[k]:indptr[k + 1]] = [f for _, f in pl]
+        return cls(terms, indptr, docs, tfs, np.asarray(doc_len, dtype="float32"))
+
+    def save(self, path: Path) -> None:
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                terms=np.asarray(self.terms, dtype=str),
+                indptr=self.indptr,
+                docs=self.docs,
+                tfs=self.tfs,
+                doc_len=self.doc_len,
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "LexicalIndex":
+        with np.load(path, allow_pickle=False) as z:
+            return cls(z["terms"].tolist(), z["indptr"], z["docs"], z["tfs"], z["doc_len"])
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """(chunk id, bm25 score) best first; only chunks sharing at least one term."""
+        scores = np.zeros(self.n_docs, dtype="float32")
+        hit = False
+        for term in set(tokenize(query)):
+            t = self._term_ids.get(term)
+            if t is None:
+                continue
+            hit = True
+            lo, hi = self.indptr[t], self.indptr[t + 1]
+            docs, tf = self.docs[lo:hi], self.tfs[lo:hi]
+            scores[docs] += self.idf[t] * tf * (BM25_K1 + 1) / (tf + self._norm[docs])
+        if not hit or top_k <= 0:
+            return []
+        k = min(top_k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+def rrf(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Reciprocal rank fusion: sum over rankings of 1 / (k + rank). Best first; ties keep first-seen order."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            fused[doc] = fused.get(doc, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda kv: -kv[1])
@@ -1,6 +1,52 @@
 # rag/limits.py
+# per-client rate limiting (token bucket) with a storage backend shared by every worker / instance
+#
+#   RATE_LIMIT_STORAGE=memory://                     this process only (dev; N workers => N x the limit)
+#   RATE_LIMIT_STORAGE=sqlite:////var/data/rl.db     all workers on one box (one UPSERT per check)
+#   RATE_LIMIT_STORAGE=redis://host:6379/0           all instances (one Lua EVALSHA per check)
+#
+# A limit "10/minute" is a bucket of 10 tokens refilled at 10 per minute: a burst of 10, then one
+# request every 6 s. Each check reads and writes a single key, so the cost is O(1) whatever the
+# traffic. The backend is reached on the request path (SQLite from a worker thread, so a busy
+# database never blocks the event loop); if it fails, the request is let through (an outage of
+# the limiter store must not take /ask down with it).
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
 from fastapi import Request
-from slowapi import Limiter
+
+from rag.metrics import registry
+
+log = logging.getLogger("rag.limits")
+
+RATE_LIMIT_STORAGE = os.getenv("RATE_LIMIT_STORAGE", "memory://")
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# per-route / per-origin overrides of the decorator limits, comma separated:
+#   "/ask=10/minute,/ask/stream=5/minute,/ask@https://cde.nus.edu.sg=30/minute"
+# An origin override applies to requests whose Origin header matches. Origin is only a hint
+# (non-browser clients can set any value), so keep origin limits modest.
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))  # memory backend bound
+
+RATE_LIMITED = registry.counter("rag_rate_limited_total", "Requests rejected by the rate limiter.", ("route",))
+RATE_LIMIT_ERRORS = registry.counter("rag_rate_limit_errors_total", "Limiter backend failures (request allowed).", ())
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_LIMIT_RE = re.compile(r"^\s*(\d+)\s*(?:/|per)\s*(\d*)\s*(second|minute|hour|day)s?\s*$")
+
 
 def real_ip(request: Request) -> str:
     # Render/proxies
@@ -9,4 +55,249 @@ def real_ip(request: Request) -> str:
         return xff.split(",")[0].strip()
     return request.client.host if request.client else "unknown"
 
-limiter = Limiter(key_func=real_ip)
+
+@dataclass(frozen=True)
+class Limit:
+    """`capacity` tokens, refilled at `rate` tokens per second."""
+    capacity: int
+    rate: float
+    text: str
+
+    @classmethod
+    def parse(cls, text: str) -> "Limit":
+        m = _LIMIT_RE.match(text)
+        if not m:
+            raise ValueError(f"bad rate limit {text!r} (expected e.g. '10/minute')")
+        count, n, unit = int(m.group(1)), int(m.group(2) or 1), m.group(3)
+        if count <= 0:
+            raise ValueError(f"bad rate limit {text!r}")
+        return cls(count, count / (n * _PERIODS[unit]), text.strip())
+
+
+def parse_overrides(spec: str) -> Dict[Tuple[str, str], Limit]:
+    """ "/ask=10/minute,/ask@https://x=30/minute" -> {("/ask", ""): ..., ("/ask", "https://x"): ...}"""
+    out: Dict[Tuple[str, str], Limit] = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        target, _, limit = item.rpartition("=")
+        route, _, origin = target.partition("@")
+        out[(route.strip(), origin.strip().rstrip("/"))] = Limit.parse(limit)
+    return out
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, limit: Limit, retry_after: float):
+        super().__init__(f"rate limit {limit.text} exceeded")
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+# -----------------------------
+# Backends: acquire(key, limit) -> (allowed, retry_after seconds)
+# -----------------------------
+
+def _refill(tokens: float, ts: float, now: float, limit: Limit) -> float:
+    return min(limit.capacity, tokens + max(0.0, now - ts) * limit.rate)
+
+
+class MemoryBackend:
+    """Per-process buckets (LRU-bounded). Exact within one worker; nothing shared."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def acquire(self, key: str, limit: Limit) -> Tuple[bool, float]:
+        return self.acquire_sync(key, limit)
+
+    def acquire_sync(self, key: str, limit: Limit, now: Optional[float] = None) -> Tuple[bool, float]:
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, ts = self._buckets.pop(key, (float(limit.capacity), now))
+            tokens = _refill(tokens, ts, now, limit)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)  # least recently seen client: a full bucket anyway
+        return allowed, 0.0 if allowed else (1 - tokens) / limit.rate
+
+
+class SQLiteBackend:
+    """
+    Buckets in one SQLite table shared by every process on the host. Each check is a single
+    INSERT .. ON CONFLICT DO UPDATE .. RETURNING, so refill + take is atomic without a read
+    transaction (SET expressions all see the row's old values). Checks run in a worker thread:
+    while another process holds the write lock sqlite3 waits (up to its 1 s timeout), and that
+    wait must not stall the event loop.
+    """
+
+    _SQL = (
+        "INSERT INTO rate_buckets (key, tokens, ts, ok) VALUES (:key, :cap - 1, :now, 1) "
+        "ON CONFLICT(key) DO UPDATE SET "
+        " ok = (MIN(:cap, tokens + MAX(0, :now - ts) * :rate) >= 1),"
+        " tokens = MIN(:cap, tokens + MAX(0, :now - ts) * :rate)"
+        "          - (MIN(:cap, tokens + MAX(0, :now - ts) * :rate) >= 1),"
+        " ts = :now "
+        "RETURNING ok, tokens"
+    )
+
+    def __init__(self, path: str, sweep_every: int = 10000):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=1.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=OFF")  # losing buckets in a crash only resets limits
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            " key TEXT PRIMARY KEY, tokens REAL NOT NULL, ts REAL NOT NULL, ok INTEGER NOT NULL)"
+        )
+        self._lock = threading.Lock()
+        self._sweep_every = sweep_every
+        self._checks = 0
+
+    async def acquire(self, key: str, limit: Limit) -> Tuple[bool, float]:
+        return await asyncio.to_thread(self.acquire_sync, key, limit)
+
+    def acquire_sync(self, key: str, limit: Limit, now: Optional[float] = None) -> Tuple[bool, float]:
+        now = time.time() if now is None else now
+        with self._lock:
+            ok, tokens = self._db.execute(
+                self._SQL, {"key": key, "cap": limit.capacity, "rate": limit.rate, "now": now}
+            ).fetchone()
+            self._checks += 1
+            if self._checks % self._sweep_every == 0:
+                # buckets idle long enough to be full again carry no state
+                self._db.execute("DELETE FROM rate_buckets WHERE ts < ?", (now - 86400,))
+        return bool(ok), 0.0 if ok else (1 - tokens) / limit.rate
+
+
+class RedisBackend:
+    """Buckets as Redis hashes updated by one Lua script (atomic across instances, server clock)."""
+
+    _LUA = """
+local cap = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local s = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(s[1]) or cap
+local ts = tonumber(s[2]) or now
+tokens = math.min(cap, tokens + math.max(0, now - ts) * rate)
+local ok = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  ok = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(cap / rate * 1000) + 1000)
+return {ok, tostring(tokens)}
+"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis  # optional dependency, only for RATE_LIMIT_STORAGE=redis://
+
+        self._redis = redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._script = self._redis.register_script(self._LUA)
+
+    async def acquire(self, key: str, limit: Limit) -> Tuple[bool, float]:
+        ok, tokens = await self._script(keys=[f"rl:{key}"], args=[limit.capacity, limit.rate])
+        tokens = float(tokens)
+        return bool(int(ok)), 0.0 if int(ok) else (1 - tokens) / limit.rate
+
+
+def make_backend(url: str):
+    if url.startswith("memory://"):
+        return MemoryBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"unsupported RATE_LIMIT_STORAGE {url!r}")
+
+
+# -----------------------------
+# Limiter
+# -----------------------------
+
+class Limiter:
+    """
+    Drop-in for the slowapi decorator used by the router:
+
+        @router.post("/ask")
+        @limiter.limit("10/minute")
+        async def ask(request: Request): ...
+
+    Buckets are keyed by route + client IP. RATE_LIMITS can override the limit per route and
+    per Origin; the most specific match wins (route@origin, then route, then the decorator).
+    """
+
+    def __init__(
+        self,
+        key_func: Callable[[Request], str] = real_ip,
+        storage: str = RATE_LIMIT_STORAGE,
+        overrides: str = RATE_LIMITS,
+        enabled: bool = RATE_LIMIT_ENABLED,
+    ):
+        self.key_func = key_func
+        self.storage = storage
+        self.overrides = parse_overrides(overrides)
+        self.enabled = enabled
+        self._backend = None
+        self._backend_lock = threading.Lock()
+
+    @property
+    def backend(self):
+        # created on first use: the SQLite file / Redis pool belong to the worker, not the parent
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = make_backend(self.storage)
+        return self._backend
+
+    def limit_for(self, route: str, origin: Optional[str], default: Limit) -> Limit:
+        origin = (origin or "").rstrip("/")
+        if origin and (route, origin) in self.overrides:
+            return self.overrides[(route, origin)]
+        return self.overrides.get((route, ""), default)
+
+    async def check(self, request: Request, route: str, default: Limit) -> None:
+        """Raises RateLimitExceeded when the client's bucket for this route is empty."""
+        if not self.enabled:
+            return
+        limit = self.limit_for(route, request.headers.get("origin"), default)
+        try:
+            allowed, retry_after = await self.backend.acquire(f"{route}:{self.key_func(request)}", limit)
+        except Exception as e:
+            RATE_LIMIT_ERRORS.inc()
+            log.warning("rate limiter backend failed, allowing request: %r", e)
+            return
+        if not allowed:
+            RATE_LIMITED.inc(route=route)
+            raise RateLimitExceeded(limit, retry_after)
+
+    def limit(self, limit_text: str):
+        default = Limit.parse(limit_text)
+
+        def decorator(fn):
+            if "request" not in inspect.signature(fn).parameters:
+                raise TypeError(f"{fn.__name__} needs a `request: Request` parameter to be rate limited")
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                request = kwargs.get("request") or next(a for a in args if isinstance(a, Request))
+                route = request.scope.get("route").path if request.scope.get("route") else request.url.path
+                await self.check(request, route, default)
+                result = fn(*args, **kwargs)
+                return await result if asyncio.iscoroutine(result) else result
+
+            return wrapper
+
+        return decorator
+
+
+def retry_after_header(exc: RateLimitExceeded) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+
+
+limiter = Limiter()
@@ -1,22 +1,24 @@
 from __future__ import annotations
 
-import json
+import hashlib
+import logging
+import os
 import re
 from rag.followups import generate_followups
-from typing import Any, Dict, List, Tuple, Optional
+from typing import Any, AsyncIterator, Dict, List, Tuple, Optional
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
-client = OpenAI()
+from rag.budget import add_usage
+from rag.context import CONTEXT_TOKENS, pack_context
+from rag.metrics import record_usage
+
+log = logging.getLogger("rag.llm")
 
-# Try to use your existing markdown sanitizer if it's in the repo.
-# If it doesn't exist, we fall back to returning the raw text.
-try:
-    from rag.formatting.markdown import format_markdown_safe  # type: ignore
-except Exception:
-    def format_markdown_safe(text: str) -> str:  # type: ignore
-        return text
+client = OpenAI()
+aclient = AsyncOpenAI()
 
+CHAT_MODEL = "gpt-4o-mini"
 
 # Restored system message from llm-old.py (keep this as the main policy layer)
 system_msg = """You are an admissions assistant for the MSc in Engineering Design & Innovation (MSc EDI or EDI).
@@ -104,45 +106,7 @@ INLINE CONTINUATION RULE (NON-NEGOTIABLE):
 - No text is allowed on the same line as a section heading.
 """
 
-# converts chunk into plain text
-def _chunk_to_text(chunk: Dict[str, Any]) -> str:
-    """
-    Keep compatibility with multiple chunk shapes.
-    Your current pipeline stores chunk['text'] as str or dict; this handles both.
-    """
-    v = chunk.get("text", "")
-    if isinstance(v, str):
-        return v
-    if isinstance(v, dict):
-        for k in ("text", "content", "chunk", "page_content"):
-            vv = v.get(k)
-            if isinstance(vv, str):
-                return vv
-        return json.dumps(v, ensure_ascii=False)
-    return str(v)
-
-def ask_llm(question: str, context_chunks: List[Dict[str, Any]]) -> Tuple[str, Optional[List[str]], bool]:
-    """
-    Uses a system message (policy/rules) + user message containing context and question.
-    """
-    
-    parts: List[str] = []
-    MAX_CHUNK_CHARS = 600
-    for c in context_chunks or []:
-        t = _chunk_to_text(c).strip()
-        if t and t.strip():
-            parts.append(t[:MAX_CHUNK_CHARS])
-
-    context_text = "\n\n".join(parts)
-
-    print(f"[LLMDBG] context_len={len(context_text)} parts={len(parts)}", flush=True)
-
-    if not context_text.strip():
-        return "The answer is not in the provided documents."
-        followups = None
-        answerable = False
-
-    user_prompt = f"""You must answer in well-formatted paragraphs.
+USER_PROMPT_TEMPLATE = """You must answer in well-formatted paragraphs.
     
     Rules:
     - Use ONLY the information in the Context.
@@ -157,10 +121,31 @@ def ask_llm(question: str, context_chunks: List[Dict[str, Any]]) -> Tuple[str, O
     {question}
     """
 
-# final completion step where LLM synthesizes response to user question
-# temperature parameter below allows control over the balance between strict adherence to retrieved context (low temp) and creative human-like generation (high temp)
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini",
+# Part of the answer-cache key: editing the prompts or switching model invalidates cached answers.
+PROMPT_VERSION = os.getenv("PROMPT_VERSION") or hashlib.sha256(
+    f"{CHAT_MODEL}\n{CONTEXT_TOKENS}\n{system_msg}\n{USER_PROMPT_TEMPLATE}".encode("utf-8")
+).hexdigest()[:12]
+
+def _build_user_prompt(question: str, context_chunks: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Builds the user message (context + question).
+    Returns None when no usable context is available.
+    """
+    # merged, deduplicated and cut to CONTEXT_TOKENS (rag/context.py)
+    context_text, stats = pack_context(context_chunks)
+
+    log.debug("context packed: %s", stats)
+
+    if not context_text.strip():
+        return None
+
+    return USER_PROMPT_TEMPLATE.format(context_text=context_text, question=question)
+
+
+def _completion_kwargs(user_prompt: str) -> Dict[str, Any]:
+    # temperature parameter below allows control over the balance between strict adherence to retrieved context (low temp) and creative human-like generation (high temp)
+    return dict(
+        model=CHAT_MODEL,
         temperature=0.3,
         max_tokens=400,
         messages=[
@@ -169,13 +154,79 @@ def ask_llm(question: str, context_chunks: List[Dict[str, Any]]) -> Tuple[str, O
         ],
     )
 
+
+def _finish(question: str, context_chunks: List[Dict[str, Any]], completion: Any) -> Tuple[str, Optional[List[str]], bool]:
     raw = completion.choices[0].message.content or ""
+    record_usage(CHAT_MODEL, getattr(completion, "usage", None))
+    add_usage(getattr(completion, "usage", None))
 
     followups = generate_followups(question, context_chunks)
 
-    raw = (raw or "").strip()
-    answer = format_markdown_safe(raw)
+    # raw text: the router formats the final answer once (rag/formatting/answer.py)
+    answer = (raw or "").strip()
     answerable = True
     return answer, followups, answerable
 
 
+def ask_llm(question: str, context_chunks: List[Dict[str, Any]]) -> Tuple[str, Optional[List[str]], bool]:
+    """
+    Uses a system message (policy/rules) + user message containing context and question.
+    """
+    user_prompt = _build_user_prompt(question, context_chunks)
+    if user_prompt is None:
+        return "The answer is not in the provided documents.", None, False
+
+    # final completion step where LLM synthesizes response to user question
+    completion = client.chat.completions.create(**_completion_kwargs(user_prompt))
+    return _finish(question, context_chunks, completion)
+
+
+async def ask_llm_async(
+    question: str,
+    context_chunks: List[Dict[str, Any]],
+) -> Tuple[str, Optional[List[str]], bool]:
+    """
+    Async twin of ask_llm: awaits the chat completion on the shared AsyncOpenAI
+    client so a slow completion does not block other requests on the worker.
+    """
+    user_prompt = _build_user_prompt(question, context_chunks)
+    if user_prompt is None:
+        return "The answer is not in the provided documents.", None, False
+
+    completion = await aclient.chat.completions.create(**_completion_kwargs(user_prompt))
+    return _finish(question, context_chunks, completion)
+
+
+async def stream_llm_async(
+    question: str,
+    context_chunks: List[Dict[str, Any]],
+) -> Optional[AsyncIterator[str]]:
+    """
+    Opens a streaming chat completion and returns an async iterator of raw text deltas.
+    Returns None when there is no usable context (caller answers "not in the documents").
+    Formatting is left to the caller (see rag.formatting.stream).
+    """
+    user_prompt = _build_user_prompt(question, context_chunks)
+    if user_prompt is None:
+        return None
+
+    stream = await aclient.chat.completions.create(
+        **_completion_kwargs(user_prompt),
+        stream=True,
+        stream_options={"include_usage": True},  # final chunk carries token usage
+    )
+
+    async def deltas() -> AsyncIterator[str]:
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    record_usage(CHAT_MODEL, chunk.usage)
+                    add_usage(chunk.usage)
+                for choice in chunk.choices or []:
+                    text = getattr(choice.delta, "content", None)
+                    if text:
+                        yield text
+        finally:
+            await stream.close()
+
+    return deltas()
@@ -0,0 +1,153 @@
+# rag/logs.py
+# structured logging for the API: JSON lines written by a background thread, sampled debug flow logs
+#
+#   request path --(QueueHandler: enqueue only, never blocks)--> queue --(listener thread)--> stdout
+#
+# Every /ask or /ask/stream request gets a request_id (contextvar) that is stamped on all of its
+# records. DEBUG records (route checks, raw scores, chunk previews) are kept for a sampled
+# fraction of requests only, so the flow of a request is either logged whole or not at all.
+# The final "request" record carries the path, stage timings and retrieval summary.
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json", or "text" for reading locally
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # records beyond this are dropped, not waited on
+# fraction of requests whose DEBUG flow is logged; DEBUG_RAG=1 (the old switch) logs all of them
+LOG_DEBUG_SAMPLE = 1.0 if os.getenv("DEBUG_RAG", "0") == "1" else float(os.getenv("LOG_DEBUG_SAMPLE", "0.01"))
+LOG_QUESTIONS = os.getenv("LOG_QUESTIONS", "0") == "1"  # raw question text in the request record
+
+_request_id: ContextVar[str] = ContextVar("request_id", default="")
+_sampled: ContextVar[bool] = ContextVar("log_sampled", default=False)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional["_DroppingQueueHandler"] = None
+
+
+def start_request() -> str:
+    """New request id + sampling decision for the current request (contextvars follow tasks/threads)."""
+    rid = uuid.uuid4().hex[:12]
+    _request_id.set(rid)
+    _sampled.set(random.random() < LOG_DEBUG_SAMPLE)
+    return rid
+
+
+def debug_sampled() -> bool:
+    """True when this request's DEBUG records are kept (guard for building expensive debug output)."""
+    return _sampled.get() or LOG_LEVEL == "DEBUG"
+
+
+def fields(**kw: Any) -> dict:
+    """extra= for a structured record: log.info("request", extra=fields(path=..., ms=...))."""
+    return {"fields": kw}
+
+
+class _RequestFilter(logging.Filter):
+    """Stamps the request id; drops records below LOG_LEVEL unless this request was sampled."""
+
+    def __init__(self, level: int):
+        super().__init__()
+        self.level = level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return record.levelno >= self.level or _sampled.get()
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue without formatting or blocking; formatting happens on the listener thread."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # tracebacks hold frames: render them now, everything else is formatted by the writer
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        rid = getattr(record, "request_id", "")
+        if rid:
+            out["request_id"] = rid
+        out.update(getattr(record, "fields", None) or {})
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        rid = getattr(record, "request_id", "")
+        kv = " ".join(f"{k}={v}" for k, v in (getattr(record, "fields", None) or {}).items())
+        line = f"{self.formatTime(record)} {record.levelname:<5} {record.name} {rid + ' ' if rid else ''}{record.getMessage()}"
+        line = f"{line} {kv}" if kv else line
+        return f"{line}\n{record.exc_text}" if record.exc_text else line
+
+
+def setup_logging() -> None:
+    """Routes the "rag" logger tree through the queue. Idempotent; uvicorn's own loggers are untouched."""
+    global _listener, _handler
+    if _listener is not None:
+        return
+    level = getattr(logging, LOG_LEVEL, logging.INFO)
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+
+    q: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    _handler = _DroppingQueueHandler(q)
+    _handler.addFilter(_RequestFilter(level))
+
+    logger = logging.getLogger("rag")
+    logger.handlers[:] = [_handler]
+    # let sampled DEBUG records reach the filter; unsampled ones stop there
+    logger.setLevel(logging.DEBUG if LOG_DEBUG_SAMPLE > 0 else level)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(q, stream)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Flushes whatever is queued (lifespan shutdown / atexit)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def stats() -> dict:
+    return {
+        "queued": _handler.queue.qsize() if _handler else 0,
+        "dropped": _handler.dropped if _handler else 0,
+    }
@@ -0,0 +1,240 @@
+# rag/metrics.py
+# in-process counters + latency histograms, rendered in Prometheus text format for GET /metrics
+#
+# Values live in this worker process; with several uvicorn workers each one is its own
+# scrape target (or scrape through a single-worker sidecar). Latencies are in milliseconds,
+# like the "request" log record. Cache / chat-log counters are read from their stats() at scrape time.
+from __future__ import annotations
+
+import bisect
+import logging
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labels, k)} {_fmt(v)}" for k, v in items]
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics) with a quantile estimate for /metrics?format=json."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS_MS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[LabelKey, List[float]] = {}  # per-bucket counts (not cumulative), then sum
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0.0] * (len(self.buckets) + 1)
+            s[i] += 1
+            s[-1] += value
+
+    def series(self) -> Dict[LabelKey, List[float]]:
+        with self._lock:
+            return {k: list(v) for k, v in self._series.items()}
+
+    def quantile(self, q: float, counts: List[float]) -> Optional[float]:
+        """Linear interpolation inside the bucket holding the q-th observation (histogram_quantile)."""
+        total = sum(counts[:-1])
+        if not total:
+            return None
+        rank = q * total
+        seen = 0.0
+        for i, n in enumerate(counts[:-1]):
+            if seen + n >= rank and n:
+                hi = self.buckets[i]
+                lo = self.buckets[i - 1] if i else 0.0
+                if hi == math.inf:
+                    return lo  # beyond the last finite bucket: report its bound
+                return round(lo + (hi - lo) * (rank - seen) / n, 1)
+            seen += n
+        return None
+
+    def summary(self) -> Dict[str, Dict[str, Optional[float]]]:
+        out = {}
+        for key, counts in sorted(self.series().items()):
+            total = sum(counts[:-1])
+            out["/".join(key) or "all"] = {
+                "count": int(total),
+                "mean": round(counts[-1] / total, 1) if total else None,
+                "p50": self.quantile(0.50, counts),
+                "p95": self.quantile(0.95, counts),
+                "p99": self.quantile(0.99, counts),
+            }
+        return out
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, counts in sorted(self.series().items()):
+            acc = 0.0
+            for bound, n in zip(self.buckets, counts):
+                acc += n
+                le = 'le="%s"' % _fmt(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {_fmt(acc)}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_fmt(counts[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {_fmt(acc)}")
+        return lines
+
+
+# (name, type, help, [(labels dict, value)]) produced at scrape time
+Sample = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List = []
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        m = Counter(name, help, labels)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS_MS) -> Histogram:
+        m = Histogram(name, help, labels, buckets)
+        self._metrics.append(m)
+        return m
+
+    def collector(self, fn: Callable[[], Iterable[Sample]]) -> Callable[[], Iterable[Sample]]:
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines += m.render()
+        for fn in self._collectors:
+            try:
+                samples = list(fn())
+            except Exception as e:
+                logging.getLogger("rag.metrics").error("collector %s failed: %r", fn.__name__, e)
+                continue
+            for name, kind, help, values in samples:
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                for labels, v in values:
+                    lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {_fmt(v)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.counter(
+    "rag_requests_total", "Answered /ask and /ask/stream requests by route path and status.",
+    ("endpoint", "path", "status"),
+)
+REQUEST_MS = registry.histogram(
+    "rag_request_latency_ms", "End-to-end request latency by route path.", ("path",),
+)
+STAGE_MS = registry.histogram(
+    "rag_stage_latency_ms", "Latency of one pipeline stage (retrieval, llm, llm_first_token, db).", ("stage",),
+)
+RETRIEVALS = registry.counter(
+    "rag_retrievals_total", "Retrievals by mode (hybrid, vector, or lexical when embeddings failed).", ("mode",),
+)
+TOKENS = registry.counter(
+    "rag_tokens_total", "OpenAI tokens reported in API usage.", ("model", "kind"),
+)
+
+
+def record_usage(model: str, usage) -> None:
+    """Adds an OpenAI `usage` object (chat or embeddings) to rag_tokens_total."""
+    if usage is None:
+        return
+    completion = getattr(usage, "completion_tokens", None)
+    prompt = getattr(usage, "prompt_tokens", None)
+    if completion is None:
+        TOKENS.inc(prompt or 0, model=model, kind="embedding")
+        return
+    TOKENS.inc(prompt or 0, model=model, kind="prompt")
+    TOKENS.inc(completion, model=model, kind="completion")
+
+
+def stage_summary() -> Dict[str, Dict]:
+    """Percentiles per stage and per path, for capacity planning (GET /metrics?format=json)."""
+    return {"stages": STAGE_MS.summary(), "paths": REQUEST_MS.summary()}
+
+
+@registry.collector
+def _cache_metrics() -> Iterable[Sample]:
+    # imported here: these modules import the router/retriever graph, which imports this module
+    from rag.answer_cache import answer_cache
+    from rag.chatlog import chat_logger
+    from rag import logs, retriever
+    from rag.semantic_cache import semantic_cache
+
+    a, s, e, c = answer_cache.stats(), semantic_cache.stats(), retriever.embed_cache.stats(), chat_logger.stats()
+    yield ("rag_cache_lookups_total", "counter", "Cache lookups by cache and result.", [
+        ({"cache": "answer", "result": "hit"}, a["hits"]),
+        ({"cache": "answer", "result": "miss"}, a["misses"]),
+        ({"cache": "semantic", "result": "hit"}, s["near_hits"]),
+        ({"cache": "semantic", "result": "miss"}, s["lookups"] - s["near_hits"]),
+        ({"cache": "embedding", "result": "hit"}, e["hits"] + e["disk_hits"]),
+        ({"cache": "embedding", "result": "miss"}, e["misses"]),
+    ])
+    yield ("rag_cache_entries", "gauge", "Entries currently held per cache.", [
+        ({"cache": "answer"}, a["entries"]),
+        ({"cache": "semantic"}, s["entries"]),
+        ({"cache": "embedding"}, e["entries"]),
+    ])
+    yield ("rag_chatlog_rows_total", "counter", "chat_logs rows by outcome.", [
+        ({"outcome": k}, c[k]) for k in ("written", "dropped", "failed")
+    ])
+    yield ("rag_chatlog_queue", "gauge", "chat_logs rows waiting for the writer thread.", [({}, c["queued"])])
+    yield ("rag_log_records_dropped_total", "counter", "Log records dropped because the log queue was full.", [
+        ({}, logs.stats()["dropped"])
+    ])
+    snap = retriever._snapshot  # not index_version(): a scrape must not trigger the index load
+    if snap is not None:
+        yield ("rag_index_info", "gauge", "Live index version.", [({"version": snap.version}, 1)])
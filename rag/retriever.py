@@ -1,28 +1,64 @@
 # rag/retriever.py
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import logging
 import os, re
 import pickle
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
 import faiss
 import numpy as np
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+
+from rag.embed_cache import EMBED_CACHE_PATH, EmbeddingCache
+from rag.store import ChunkStore, offsets_path_for
+from rag import index_versions
+from rag.lexical import LEXICAL_NAME, LexicalIndex, rrf
+from rag.metrics import record_usage
+from rag.logs import fields
+
+log = logging.getLogger("rag.retriever")
 
 MIN_SCORE = float(os.getenv("MIN_SIMILARITY", "0.2"))
 
 _BASE = Path(__file__).resolve().parent
 ROOT = _BASE.parent
-DOCS_PATH = Path(os.getenv("DOCS_PATH", str(ROOT / "docs.pkl")))
+# versioned layout (see rag/index_versions.py); used whenever INDEX_DIR/CURRENT exists
+INDEX_DIR = Path(os.getenv("INDEX_DIR", str(ROOT / "index")))
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "10"))  # seconds; 0 disables the watcher
+# flat layout in the repo root (older deployments)
+CHUNKS_PATH = Path(os.getenv("CHUNKS_PATH", str(ROOT / "chunks.bin")))  # + chunks.offsets.npy
+DOCS_PATH = Path(os.getenv("DOCS_PATH", str(ROOT / "docs.pkl")))  # legacy pickle, used only if no chunk store
 FAISS_PATH = Path(os.getenv("FAISS_PATH", str(ROOT / "faiss.index")))
+FAISS_MMAP = os.getenv("FAISS_MMAP", "1") == "1"
+
+# hybrid retrieval: BM25 (rag/lexical.py) fused with the vector ranking by reciprocal rank fusion
+HYBRID = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+LEXICAL_FALLBACK = os.getenv("LEXICAL_FALLBACK", "1") == "1"  # answer lexically when embeddings fail
+LEXICAL_MIN_RATIO = float(os.getenv("LEXICAL_MIN_RATIO", "0.3"))  # drop lexical hits below this x best bm25
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "5"))  # seconds; leaves room for the lexical fallback
 
 EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")  # 1536 dims by default :contentReference[oaicite:1]{index=1}
 
-_docs: List[Any] | None = None
-_index: faiss.Index | None = None
+# the live (docs, index) pair; replaced as a whole on reload, never mutated in place
+_snapshot: "IndexSnapshot | None" = None
+_reload_lock = threading.Lock()
 
 _client = OpenAI()
+_aclient = AsyncOpenAI()
+# query embeddings: one attempt bounded by EMBED_TIMEOUT, so a hanging API falls back to lexical
+# search well inside the router's RETRIEVAL_TIMEOUT (the SDK default retries twice, each with the timeout)
+_embed_client = _client.with_options(max_retries=0, timeout=EMBED_TIMEOUT)
+_embed_aclient = _aclient.with_options(max_retries=0, timeout=EMBED_TIMEOUT)
+
+# normalized query -> vector; chat traffic is dominated by a few hundred repeated questions
+embed_cache = EmbeddingCache(path=EMBED_CACHE_PATH or None)
 
 VALUE_ANCHORS = [
     ("value", "value proposition benefits outcomes why choose highlights"),
@@ -42,20 +78,189 @@ def _normalize_query_for_retrieval(q: str) -> str:
     return q2
 
 
+class IndexSnapshot:
+    """
+    One immutable version of the chunk texts + FAISS index.
+
+    Requests pin the snapshot they started on (acquire/release), so a hot reload swaps
+    the module-level pointer atomically while in-flight searches finish on the old
+    version; the old snapshot closes its mmaps once the last of them is released.
+    """
+
+    def __init__(
+        self,
+        version: str,
+        docs: Sequence[Any],
+        index: faiss.Index,
+        paths: List[Path],
+        lexical: Optional[LexicalIndex] = None,
+    ):
+        self.version = version
+        self.docs = docs
+        self.index = index
+        self.paths = paths
+        self.lexical = lexical
+        self.loaded_at = time.time()
+        self._refs = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    def acquire(self) -> "Optional[IndexSnapshot]":
+        """Pins this snapshot; None once it is retired (its mmaps may already be closed)."""
+        with self._lock:
+            if self._retired:
+                return None
+            self._refs += 1
+        return self
+
+    def release(self) -> None:
+        with self._lock:
+            self._refs -= 1
+            close = self._retired and self._refs == 0
+        if close:
+            self._close()
+
+    def retire(self) -> None:
+        with self._lock:
+            self._retired = True
+            close = self._refs == 0
+        if close:
+            self._close()
+
+    @property
+    def in_flight(self) -> int:
+        return self._refs
+
+    def lexical_index(self) -> LexicalIndex:
+        """BM25 index written by the builder, or built from the chunk texts on first use (older builds)."""
+        if self.lexical is None:
+            with self._lock:
+                if self.lexical is None:
+                    t0 = time.time()
+                    self.lexical = LexicalIndex.build(_to_text(d) for d in self.docs)
+                    log.info("built lexical index", extra=fields(chunks=len(self.lexical), ms=int((time.time() - t0) * 1000)))
+        return self.lexical
+
+    def _close(self) -> None:
+        if isinstance(self.docs, ChunkStore):
+            self.docs.close()
+
+
+def _hash_files(paths: List[Path]) -> str:
+    h = hashlib.sha256()
+    for p in paths:
+        with open(p, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()[:16]
+
+def _read_index(path: Path) -> faiss.Index:
+    if not FAISS_MMAP:
+        return faiss.read_index(str(path))
+    # IO_FLAG_MMAP_IFC maps flat-index vectors straight from the file (shared page cache
+    # across workers); older faiss builds only have IO_FLAG_MMAP
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return faiss.read_index(str(path), flag)
+
+def _load_snapshot() -> IndexSnapshot:
+    """Loads whatever INDEX_DIR/CURRENT points at, else the flat layout in the repo root."""
+    vdir = index_versions.current_dir(INDEX_DIR)
+    if vdir is not None:
+        faiss_path = vdir / index_versions.FAISS_NAME
+        chunks_path = vdir / index_versions.CHUNKS_NAME
+        docs: Sequence[Any] = ChunkStore(chunks_path)
+        paths = [faiss_path, chunks_path, offsets_path_for(chunks_path)]
+        lexical_path = vdir / LEXICAL_NAME
+        lexical = LexicalIndex.load(lexical_path) if lexical_path.exists() else None
+        return IndexSnapshot(vdir.name, docs, _read_index(faiss_path), paths, lexical)
+
+    if not FAISS_PATH.exists():
+        raise FileNotFoundError(f"FAISS index not found: {FAISS_PATH} (and no {INDEX_DIR / index_versions.POINTER_NAME})")
+
+    if CHUNKS_PATH.exists():
+        docs = ChunkStore(CHUNKS_PATH)
+        paths = [FAISS_PATH, CHUNKS_PATH, offsets_path_for(CHUNKS_PATH)]
+    elif DOCS_PATH.exists():
+        with open(DOCS_PATH, "rb") as f:
+            docs = pickle.load(f)
+        paths = [FAISS_PATH, DOCS_PATH]
+    else:
+        raise FileNotFoundError(f"Chunk store not found: {CHUNKS_PATH} (or legacy {DOCS_PATH})")
+
+    # flat layout has no version name: use a content hash
+    return IndexSnapshot(_hash_files(paths), docs, _read_index(FAISS_PATH), paths)
+
 def _load_resources() -> None:
-    global _docs, _index
-    if _docs is not None and _index is not None:
+    global _snapshot
+    if _snapshot is not None:
         return
+    with _reload_lock:
+        if _snapshot is None:
+            _snapshot = _load_snapshot()
 
-    if not DOCS_PATH.exists():
-        raise FileNotFoundError(f"Docs file not found: {DOCS_PATH}")
-    if not FAISS_PATH.exists():
-        raise FileNotFoundError(f"FAISS index not found: {FAISS_PATH}")
+def reload_index(force: bool = False) -> Dict[str, Any]:
+    """
+    Picks up a newly published version (or any version when force=True).
+    The new snapshot is fully loaded before the swap, so requests never see a half-loaded pair.
+    """
+    global _snapshot
+    with _reload_lock:
+        old = _snapshot
+        if old is not None and not force and index_versions.read_current(INDEX_DIR) in (None, old.version):
+            return {"reloaded": False, "version": old.version}
+
+        new = _load_snapshot()
+        if old is not None and new.version == old.version and not force:
+            new._close()
+            return {"reloaded": False, "version": old.version}
 
-    with open(DOCS_PATH, "rb") as f:
-        _docs = pickle.load(f)
+        _snapshot = new
+
+    if old is not None:
+        old.retire()
+    log.info("index reloaded", extra=fields(
+        version=new.version,
+        previous=old.version if old else None,
+        draining=old.in_flight if old else 0,
+        chunks=len(new.docs),
+    ))
+    return {"reloaded": True, "version": new.version, "previous": old.version if old else None}
+
+async def watch_index(interval: float = INDEX_WATCH_INTERVAL) -> None:
+    """Background task: polls INDEX_DIR/CURRENT and hot-reloads when it points somewhere new."""
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            current = index_versions.read_current(INDEX_DIR)
+            if current and _snapshot is not None and current != _snapshot.version:
+                await asyncio.to_thread(reload_index)
+        except Exception as e:
+            # keep serving the old version; try again on the next tick
+            log.error("index reload failed: %r", e)
 
-    _index = faiss.read_index(str(FAISS_PATH))
+@contextmanager
+def _pinned() -> Iterator[IndexSnapshot]:
+    _load_resources()
+    # a reload can swap and retire the snapshot between reading _snapshot and pinning it;
+    # retire() runs after the swap, so the retry reads the new one
+    snap = _snapshot.acquire()
+    while snap is None:
+        snap = _snapshot.acquire()
+    try:
+        yield snap
+    finally:
+        snap.release()
+
+def index_version() -> str:
+    """
+    Version of the index being served: the version directory name, or a content hash of
+    faiss.index + chunk store for the flat layout. Anything keyed on it (answer cache,
+    semantic cache) is invalidated when a new index is loaded.
+    """
+    _load_resources()
+    return _snapshot.version
 
 def _to_text(doc: Any) -> str:
     # supports either str docs OR dict docs from older pipelines
@@ -69,34 +274,128 @@ def _to_text(doc: Any) -> str:
         return str(doc)
     return str(doc)
 
+def _to_vector(resp: Any) -> np.ndarray:
+    vec = np.array(resp.data[0].embedding, dtype="float32")
+    # If you built the index with normalized vectors, normalize queries too
+    faiss.normalize_L2(vec.reshape(1, -1))
+    return vec
+
 # embed the user question into a vector
 def _embed_query(text: str) -> np.ndarray:
-    # OpenAI Embeddings API :contentReference[oaicite:2]{index=2}
     text = text[:4000]  # safety cap
-    resp = _client.embeddings.create(
+    cached = embed_cache.get(EMBED_MODEL, text)
+    if cached is not None:
+        return cached
+    # OpenAI Embeddings API :contentReference[oaicite:2]{index=2}
+    resp = _embed_client.embeddings.create(
         model=EMBED_MODEL,
-        input=text
+        input=text,
     )
-    vec = np.array(resp.data[0].embedding, dtype="float32")
-    # If you built the index with normalized vectors, normalize queries too
-    faiss.normalize_L2(vec.reshape(1, -1))
-    return vec
+    record_usage(EMBED_MODEL, getattr(resp, "usage", None))
+    return embed_cache.put(EMBED_MODEL, text, _to_vector(resp))
+
+# same as _embed_query, but awaits the HTTP call instead of blocking the event loop
+async def _embed_query_async(text: str) -> np.ndarray:
+    text = text[:4000]  # safety cap
+    cached = await embed_cache.get_async(EMBED_MODEL, text)
+    if cached is not None:
+        return cached
+    # wait_for also bounds a response that trickles in (the HTTP timeout is per read)
+    resp = await asyncio.wait_for(
+        _embed_aclient.embeddings.create(model=EMBED_MODEL, input=text),
+        EMBED_TIMEOUT,
+    )
+    record_usage(EMBED_MODEL, getattr(resp, "usage", None))
+    return await embed_cache.put_async(EMBED_MODEL, text, _to_vector(resp))
 
 # Finds the top_k closest chunk
 def retrieve_context(query: str, top_k: int = 6) -> List[Dict[str, Any]]:
-    _load_resources()    #loads docs.pkl and faiss.index
-    assert _docs is not None and _index is not None   # confirms that the two resources are available, else crash
-    query = _normalize_query_for_retrieval(query)
-    q = _embed_query(query).reshape(1, -1)
-    scores, idxs = _index.search(q, top_k)
-
-    # for debugging
-    print("[RAG] raw scores:", scores[0][:5], flush=True)
-
-    results: List[Dict[str, Any]] = []
-    for score, idx in zip(scores[0], idxs[0]):
-        if idx < 0 or score < MIN_SCORE:
-            continue
-        doc = _docs[int(idx)]
-        results.append({"text": _to_text(doc), "score": float(score)})
+    _load_resources()    #loads chunk store and faiss.index
+    normalized = _normalize_query_for_retrieval(query)
+    try:
+        vec = _embed_query(normalized)
+    except Exception as e:
+        if not LEXICAL_FALLBACK:
+            raise
+        log.warning("embeddings unavailable (%s); lexical-only retrieval", type(e).__name__)
+        return _search_lexical(query, top_k)
+    return _search(vec, top_k, query)
+
+async def retrieve_context_async(query: str, top_k: int = 6) -> List[Dict[str, Any]]:
+    """
+    Async twin of retrieve_context for the /ask endpoint.
+    The first call loads docs.pkl / faiss.index in a worker thread so the
+    event loop keeps serving other requests while the files are read.
+    """
+    results, _ = await retrieve_context_with_vector_async(query, top_k)
+    return results
+
+async def retrieve_context_with_vector_async(
+    query: str, top_k: int = 6
+) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+    """
+    Same as retrieve_context_async, but also returns the (normalized) query vector.
+    The vector is None when the embeddings API failed and the results are lexical-only.
+    """
+    if _snapshot is None:
+        await asyncio.to_thread(_load_resources)
+    normalized = _normalize_query_for_retrieval(query)
+    try:
+        vec = await _embed_query_async(normalized)
+    except Exception as e:  # includes TimeoutError from EMBED_TIMEOUT
+        if not LEXICAL_FALLBACK:
+            raise
+        log.warning("embeddings unavailable (%s); lexical-only retrieval", type(e).__name__)
+        return _search_lexical(query, top_k), None
+    return _search(vec, top_k, query), vec
+
+def _hit(snap: IndexSnapshot, idx: int, score: Optional[float], **extra: Any) -> Dict[str, Any]:
+    hit = {"id": idx, "text": _to_text(snap.docs[idx]), "score": score, **extra}
+    if isinstance(snap.docs, ChunkStore):
+        hit["meta"] = snap.docs.meta(idx)  # source, section, offsets (if the build wrote them)
+    return hit
+
+def _lexical_candidates(snap: IndexSnapshot, query: str, n: int) -> List[Tuple[int, float]]:
+    hits = snap.lexical_index().search(query, n)
+    if not hits:
+        return []
+    floor = hits[0][1] * LEXICAL_MIN_RATIO
+    return [(i, s) for i, s in hits if s >= floor]
+
+def _search_lexical(query: str, top_k: int) -> List[Dict[str, Any]]:
+    """BM25 only (embeddings API down). "score" is None: there is no cosine similarity."""
+    with _pinned() as snap:
+        return [_hit(snap, i, None, lexical=s) for i, s in _lexical_candidates(snap, query, top_k)]
+
+def _search(vec: np.ndarray, top_k: int, query: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Vector top_k (cosine >= MIN_SCORE). With HYBRID_RETRIEVAL and a query, the vector and
+    BM25 candidate lists are fused by reciprocal rank; "score" stays the cosine similarity,
+    and every fused hit (lexical-only ones included) must reach MIN_SCORE too.
+    """
+    q = vec.reshape(1, -1)
+    hybrid = HYBRID and bool(query)
+    n_candidates = max(top_k * 3, 20) if hybrid else top_k
+    # pin one snapshot for the whole search so a concurrent reload cannot mix versions
+    with _pinned() as snap:
+        scores, idxs = snap.index.search(q, n_candidates)
+
+        # for debugging
+        log.debug("raw scores: %s", scores[0][:5])
+
+        dense = [(int(i), float(s)) for s, i in zip(scores[0], idxs[0]) if i >= 0 and s >= MIN_SCORE]
+        if not hybrid:
+            return [_hit(snap, i, s) for i, s in dense[:top_k]]
+
+        lexical = _lexical_candidates(snap, query, n_candidates)
+        cosine, bm25 = dict(dense), dict(lexical)
+        results: List[Dict[str, Any]] = []
+        for i, fused in rrf([[i for i, _ in dense], [i for i, _ in lexical]]):
+            # lexical-only hits were not in the dense candidate list: score them directly
+            score = cosine[i] if i in cosine else float(np.dot(snap.index.reconstruct(i), vec))
+            if score < MIN_SCORE:
+                continue  # a keyword match the question is not about: don't fill top_k with it
+            results.append(_hit(snap, i, score, lexical=bm25.get(i, 0.0), rrf=round(fused, 5)))
+            if len(results) == top_k:
+                break
     return results
@@ -1,29 +1,46 @@
 from fastapi import APIRouter, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from rag.llm import ask_llm
-from rag.retriever import retrieve_context
-from rag.formatting.markdown import format_markdown_safe
+from rag.llm import PROMPT_VERSION, ask_llm_async, stream_llm_async
+from rag.retriever import HYBRID, index_version, retrieve_context_with_vector_async
+from rag.answer_cache import answer_cache
+from rag.semantic_cache import semantic_cache
+from rag.formatting.answer import format_answer, format_markdown, format_static
 from rag.limits import limiter, real_ip
-from rag.formatting.text import format_answer_text
-from rag.followups import clean_followups, followups_when_unanswerable
+from rag.formatting.stream import StreamFormatter
+from rag.followups import clean_followups, followups_when_unanswerable, generate_followups
 from rag.conversion import get_conversion_nudge
+from rag.chatlog import chat_logger
+from rag.metrics import REQUEST_MS, REQUESTS, RETRIEVALS, STAGE_MS
+from rag.logs import LOG_QUESTIONS, debug_sampled, fields, start_request
+from rag.budget import DEGRADED as BUDGET_DEGRADED, budget, start_request as new_usage
+from rag.context import start_request as new_context_stats
+from rag.extractive import FASTPATH, extractive_answer
+from rag.sessions import last_answers
 
 
+from rag.routing.intents import Intents, classify
 from rag.routing.policy import (
+    is_suitability_question,
     route_early,
     route_intake,
-    route_policy_logistics,
+    route_policy_static,
+    route_arrival,
     route_requirement_or_suitability,
+    route_fact,
     pick_rag_fallback,
+    requirement_support,
 )
 
+import asyncio
+import json
 import re
 import time
 import hashlib
+import logging
 import os
-from typing import Optional
-import psycopg2
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
 
 # codes for traceability if anything goes wrong
 def _safe_origin(origin: str | None) -> str:
@@ -39,244 +56,505 @@ def _safe_origin(origin: str | None) -> str:
 
 
 router = APIRouter()
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-
-def log_to_postgres(
-    *,
-    origin: Optional[str],
-    session_id: Optional[str],
-    ip_hash: str,
-    user_agent: Optional[str],
-    question: str,
-    status: int,
-    latency_ms: int,
-) -> None:
-    if not DATABASE_URL:
-        print("[LOGGING] DATABASE_URL missing; skipping DB log", flush=True)
-        return
+log = logging.getLogger("rag.router")
 
-    try:
-        with psycopg2.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    INSERT INTO chat_logs
-                    (origin, session_id, ip_hash, user_agent, question, status, latency_ms)
-                    VALUES (%s,%s,%s,%s,%s,%s,%s)
-                    """,
-                    (origin, session_id, ip_hash, user_agent, question, status, latency_ms),
-                )
-    except Exception as e:
-        print(f"[LOGGING ERROR] {e}", flush=True)
+# per-stage timeouts (seconds) for the OpenAI round-trips in /ask
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", "10"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
 
 
 # -----------------------------
 # Helpers
 # -----------------------------
 
-def is_suitability_question(q: str) -> bool:
-    q = (q or "").lower()
-    return any(p in q for p in [
-        "am i suitable",
-        "will i be suitable",
-        "would i be suitable",
-        "is edi suitable",
-        "suitable for me",
-        "fit for edi",
-        "good fit",
-        "good candidate",
-        "do i stand a chance",
-        "chance of admission",
-        "should i apply",
-    ])
-
-
+# Pipeline stages in execution order; the "request" log record lists the ones a request never reached.
+# early/intake/policy_static answer from the question alone, so they run before retrieval;
+# answer_cache then short-circuits repeated questions for the current index + prompt version.
+PIPELINE_STAGES = (
+    "early",
+    "intake",
+    "policy_static",
+    "answer_cache",
+    "retrieval",
+    "arrival",
+    "requirement",
+    "fastpath",
+    "semantic_cache",
+    "budget",
+    "llm",
+)
 
-# -----------------------------
-# Main endpoint
-# -----------------------------
+RETRIEVAL_FAILED_MSG = "Sorry — retrieval failed. Please try again."
+LLM_TIMEOUT_MSG = "Sorry — the AI service is taking too long to respond. Please try again."
+LLM_UNAVAILABLE_MSG = "Sorry — the AI service is temporarily unavailable. Please try again."
+INTERNAL_ERROR_MSG = "Sorry — something went wrong. Please try again."
+
+
+@dataclass
+class AskContext:
+    """Per-request state shared by /ask and /ask/stream: routing results, timings and trace fields."""
+    q: str
+    origin: Optional[str]
+    user_agent: Optional[str]
+    session_id: Optional[str]
+    ip: str
+    ip_hash: str
+    endpoint: str = "/ask"
+    request_id: str = ""
+    t0: float = field(default_factory=time.time)
+    path: str = "unknown"
+    chunks_count: int = 0
+    top_score: Optional[float] = None
+    retr_ms: int = 0
+    llm_ms: int = 0
+    llm_first_ms: Optional[int] = None  # /ask/stream: time to the first model token
+    db_ms: float = 0.0
+    usage: Dict[str, int] = field(default_factory=new_usage)  # chat tokens of this request
+    context: Dict[str, int] = field(default_factory=new_context_stats)  # prompt packing (rag/context.py)
+    stages_run: List[str] = field(default_factory=list)
+    intents: Intents = frozenset()  # routing intents of q (rag/routing/intents.py), classified once
+    idx_version: str = ""
+    context_chunks: List[Dict[str, Any]] = field(default_factory=list)
+    chunk_ids: List[int] = field(default_factory=list)
+    support_id: Optional[int] = None  # requirement_direct / extractive_fastpath: the chunk the answer rests on
+    followup_of: Optional[str] = None  # path that answered this session's previous question (rag/sessions.py)
+    query_vec: Any = None
+    retr_mode: str = "-"  # "hybrid" / "vector", or "lexical" when the embeddings API was down
+
+    @classmethod
+    async def from_request(cls, request: Request) -> "AskContext":
+        payload = await request.json()
+        ip = real_ip(request)
+        return cls(
+            q=(payload.get("question") or payload.get("query") or "").strip(),
+            origin=request.headers.get("origin"),
+            user_agent=request.headers.get("user-agent"),
+            session_id=payload.get("session_id"),  # optional
+            ip=ip,
+            ip_hash=hashlib.sha256(ip.encode("utf-8")).hexdigest()[:16],
+            endpoint=request.url.path,
+            request_id=start_request(),
+        )
 
-@router.post("/ask")
-@limiter.limit("10/minute")
-async def ask(request: Request):
-    t0 = time.time()
-    path = "unknown"
-    chunks_count = 0
-    top_score = None
-    retr_ms = 0
-    llm_ms = 0
-    db_ms = 0
-
-
-    payload = await request.json()
-    q = (payload.get("question") or payload.get("query") or "").strip()
-
-    origin = request.headers.get("origin")
-    user_agent = request.headers.get("user-agent")
-    session_id = payload.get("session_id")  # optional
-    ip = real_ip(request)
-    ip_hash = hashlib.sha256(ip.encode("utf-8")).hexdigest()[:16]
-
-    def respond(answer_text: str, status_code: int = 200, retr_ms=0, llm_ms=0, followups=None):
-        t_db_start = time.time()
-        latency_ms = int((time.time() - t0) * 1000)
-        origin_short = _safe_origin(origin)
-        log_to_postgres(
-            origin=origin,
-            session_id=session_id,
-            ip_hash=ip_hash,
-            user_agent=user_agent,
-            question=q,
+    def finish(self, status_code: int) -> None:
+        """Queues the chat_logs row, records metrics and logs the one "request" record for this request."""
+        latency_ms = int((time.time() - self.t0) * 1000)
+        t_db_start = time.perf_counter()
+        # enqueue only; the chatlog writer thread batches the INSERTs after the response is sent
+        chat_logger.log(
+            origin=self.origin,
+            session_id=self.session_id,
+            ip_hash=self.ip_hash,
+            user_agent=self.user_agent,
+            question=self.q,
             status=status_code,
             latency_ms=latency_ms,
         )
-        
-        t_db_end = time.time()
-        db_ms = int((t_db_end - t_db_start) * 1000)
-
-        print(
-            f"[TRACE] path={path} ip_hash={ip_hash} origin={origin_short} "
-            f"qlen={len(q)} chunks={chunks_count} top={top_score} "
-            f"retr_ms={retr_ms} llm_ms={llm_ms} db_ms={db_ms} "
-            f"latency_ms={latency_ms} status={status_code}",
-            flush=True
+        # sub-millisecond since the queue replaced the inline INSERT; int() would always log 0
+        self.db_ms = round((time.perf_counter() - t_db_start) * 1000, 2)
+        self._record_metrics(status_code, latency_ms)
+        self.followup_of = last_answers.record(
+            self.session_id or self.ip_hash, self.path if status_code == 200 else None
         )
 
+        skipped = [s for s in PIPELINE_STAGES if s not in self.stages_run]
 
-        # TEMP DEBUG: remove after first successful row appears
-        # print(f"[DBLOG] inserting ip_hash={ip_hash} status={status_code}", flush=True)
-
-        
-        payload = {"answer": answer_text}
-        if followups:
-           payload["followups"] = followups
-        return JSONResponse(payload, status_code=status_code)
-
-
+        record = dict(
+            endpoint=self.endpoint,
+            path=self.path,
+            status=status_code,
+            ip_hash=self.ip_hash,
+            origin=_safe_origin(self.origin),
+            qlen=len(self.q),
+            q_hash=hashlib.sha256(self.q.encode("utf-8")).hexdigest()[:12],
+            chunks=self.chunks_count,
+            chunk_ids=self.chunk_ids,
+            support=self.support_id,
+            followup_of=self.followup_of,
+            top=round(self.top_score, 4) if self.top_score is not None else None,
+            tokens=self.usage,
+            context=self.context or None,
+            retr=self.retr_mode,
+            index=self.idx_version,
+            ms=dict(
+                retrieval=self.retr_ms,
+                llm=self.llm_ms,
+                llm_first_token=self.llm_first_ms,
+                db=self.db_ms,
+                total=latency_ms,
+            ),
+            stages=self.stages_run,
+            skipped=skipped,
+        )
+        if LOG_QUESTIONS:
+            record["q"] = self.q
+        log.info("request", extra=fields(**record))
+
+    def _record_metrics(self, status_code: int, latency_ms: int) -> None:
+        REQUESTS.inc(endpoint=self.endpoint, path=self.path, status=str(status_code))
+        REQUEST_MS.observe(latency_ms, path=self.path)
+        STAGE_MS.observe(self.db_ms, stage="db")
+        # stage latencies only for stages that completed; timeouts/errors show up per path
+        if "retrieval" in self.stages_run and self.path not in ("retrieval_timeout", "retrieval_error"):
+            STAGE_MS.observe(self.retr_ms, stage="retrieval")
+        if self.path == "llm":
+            STAGE_MS.observe(self.llm_ms, stage="llm")
+            if self.llm_first_ms is not None:
+                STAGE_MS.observe(self.llm_first_ms, stage="llm_first_token")
+
+
+@dataclass
+class Routed:
+    """An answer produced before (or instead of) the chat model."""
+    answer: str
+    followups: Optional[List[str]] = None
+    status_code: int = 200
+
+
+async def _route(ctx: AskContext) -> Optional[Routed]:
+    """
+    Runs every stage up to the chat model.
+    Returns a Routed answer, or None when the question needs the LLM
+    (ctx then carries the retrieved chunks, query vector and index version).
+    """
+    q = ctx.q
     if not q:
-        path = "empty"
-        return respond(pick_rag_fallback(""))
+        ctx.path = "empty"
+        return Routed(pick_rag_fallback(""))
 
-    print(f"[ASK] ip={ip} q={q}", flush=True)
+    # one pattern pass; every route below reads the same intent set
+    ctx.intents = intents = classify(q)
 
-    # Retrieve once; reuse everywhere
+    # 0) Early exits (no retrieval needed)
+    ctx.stages_run.append("early")
+    r = route_early(q, intents)
+    if r:
+        ctx.path = "early"
+        log.debug("route %s triggered", "early")
+        return Routed(format_static(r, markdown_only=True))
+    
+    ctx.stages_run.append("intake")
+    r = route_intake(q, intents)
+    if r:
+        ctx.path = "intake"
+        log.debug("route %s triggered", "intake")
+        return Routed(format_static(r, markdown_only=True))
+
+    # 1) Policy hard stop (offer / reapply / visa): canned answers, no retrieval needed
+    ctx.stages_run.append("policy_static")
+    r = route_policy_static(q, intents)
+    if r:
+        ctx.path = "policy_logistics"
+        log.debug("route %s triggered", "policy_static")
+        return Routed(format_static(r, markdown_only=True))
+
+    # 1a) Whole-answer cache (canonical question + index version + prompt version)
+    ctx.stages_run.append("answer_cache")
+    ctx.idx_version = index_version()
+    cached = answer_cache.get(q, ctx.idx_version, PROMPT_VERSION)
+    if cached:
+        ctx.path = "answer_cache"
+        log.debug("answer_cache hit (from %s)", cached.path)
+        return Routed(cached.answer, cached.followups)
+
+    # Retrieve once; reuse everywhere (only reached when a route needs context)
+    ctx.stages_run.append("retrieval")
     try: 
         t_retr_start = time.time()
-        context_chunks = retrieve_context(q, top_k=6)
+        context_chunks, ctx.query_vec = await asyncio.wait_for(
+            retrieve_context_with_vector_async(q, top_k=6), timeout=RETRIEVAL_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        ctx.path = "retrieval_timeout"
+        log.error("retrieval timed out after %ss", RETRIEVAL_TIMEOUT, extra=fields(stage="retrieval"))
+        return Routed(RETRIEVAL_FAILED_MSG, status_code=504)
     except Exception as e:
-        path = "retrieval_error"
-        print(f"[ERROR] stage=retrieval ip={ip_hash} origin={_safe_origin(origin)} err={repr(e)}", flush=True)
-        return respond("Sorry — retrieval failed. Please try again.", status_code=500)    
+        ctx.path = "retrieval_error"
+        log.error("retrieval failed: %r", e, extra=fields(stage="retrieval"))
+        return Routed(RETRIEVAL_FAILED_MSG, status_code=500)
     
     # calculates time for retrieval
     t_retr_end = time.time()
-    retr_ms = int((t_retr_end - t_retr_start) * 1000)
+    ctx.retr_ms = int((t_retr_end - t_retr_start) * 1000)
 
-    chunks_count = len(context_chunks or [])
-    top_score = (context_chunks[0].get("score") if chunks_count else None)
+    ctx.context_chunks = context_chunks or []
+    ctx.chunk_ids = [c["id"] for c in ctx.context_chunks if "id" in c]
+    ctx.chunks_count = len(ctx.context_chunks)
+    ctx.top_score = (context_chunks[0].get("score") if ctx.chunks_count else None)
+    ctx.retr_mode = "lexical" if ctx.query_vec is None else ("hybrid" if HYBRID else "vector")
+    RETRIEVALS.inc(mode=ctx.retr_mode)
 
-
-    # just for debugging and learning, if debugging required, set DEBUG_RAG=1 in Render environment variable
-    DEBUG_RAG = os.getenv("DEBUG_RAG", "0") == "1"
-
-    if DEBUG_RAG:
-        print("[RAG] top chunks preview:", flush=True)
+    # chunk previews for sampled requests (LOG_DEBUG_SAMPLE; DEBUG_RAG=1 samples every request)
+    if debug_sampled():
         for i, c in enumerate(context_chunks[:3]):
             preview = (c.get("text","") if isinstance(c, dict) else str(c))[:120].replace("\n"," ")
-            print(f"  - {i+1}: {preview}...", flush=True)
-
-
-
-    # print(f"[RAG] chunks={len(context_chunks)}", flush=True)
+            log.debug("top chunk %d: %s...", i + 1, preview)
 
-
-    # 0) Early exits
-    print("[FLOW] checking route_early", flush=True)
-    r = route_early(q)
-    if r:
-        path = "early"
-        print("[FLOW] route_early triggered", flush=True)
-        return respond(format_markdown_safe(r))
-    
-    print("[FLOW] checking route_intake", flush=True)
-    r = route_intake(q)
+    # 1b) Arrival/logistics: depends on whether retrieval found anything
+    ctx.stages_run.append("arrival")
+    r = route_arrival(q, context_chunks, intents)
     if r:
-        path = "intake"
-        print("[FLOW] route_intake triggered", flush=True)
-        return respond(format_markdown_safe(r))
-
-    # 1) Policy/logistics hard stop
-    print("[FLOW] checking route_policy_logistics", flush=True)
-    r = route_policy_logistics(q, context_chunks)
-    if r:
-        path = "policy_logistics"
-        print("[FLOW] route_policy_logistics triggered", flush=True)
-        return respond(format_markdown_safe(r))
+        ctx.path = "policy_logistics"
+        log.debug("route %s triggered", "arrival")
+        return Routed(format_static(r, markdown_only=True))
 
     # 2) Requirement vs suitability
-    print("[FLOW] checking route_requirement", flush=True)
-    rs = route_requirement_or_suitability(q, context_chunks)
+    ctx.stages_run.append("requirement")
+    rs = route_requirement_or_suitability(q, context_chunks, intents)
     if rs:
-        print("[FLOW] route_requirement", flush=True)
+        log.debug("route requirement -> %s", rs[0])
         kind, payload2 = rs
-        if kind == "direct" and not is_suitability_question(q):
-            path = "requirement_direct"
-            return respond(format_markdown_safe(payload2))
+        if kind == "direct" and not is_suitability_question(q, intents):
+            ctx.path = "requirement_direct"
+            _, support = requirement_support(context_chunks)
+            ctx.support_id = support.get("id") if isinstance(support, dict) else None
+            answer = format_markdown(payload2)
+            if ctx.query_vec is not None:
+                answer_cache.put(q, ctx.idx_version, PROMPT_VERSION, answer=answer, followups=None, path=ctx.path)
+            return Routed(answer)
+
+    # 2a) Extractive fast path: a fact (fee, date, score) stated in a top chunk, quoted without the chat model
+    ctx.stages_run.append("fastpath")
+    fact = route_fact(q, context_chunks, intents)
+    if "fact" in intents:
+        FASTPATH.inc(outcome="fired" if fact else "declined")
+    if fact:
+        ctx.path = "extractive_fastpath"
+        payload2, support = fact
+        ctx.support_id = support.get("id")
+        answer = format_answer(payload2)
+        if ctx.query_vec is not None:
+            answer_cache.put(q, ctx.idx_version, PROMPT_VERSION, answer=answer, followups=None, path=ctx.path)
+        return Routed(answer)
+
+    # 2b) Semantic cache: a paraphrase of an answered question that retrieves the same top chunks
+    ctx.stages_run.append("semantic_cache")
+    near = None
+    if ctx.query_vec is not None:
+        near = semantic_cache.lookup(ctx.query_vec, ctx.chunk_ids, ctx.idx_version, PROMPT_VERSION)
+    if near:
+        ctx.path = "semantic_cache"
+        log.debug("semantic_cache near-hit")
+        # the cached body answers the paraphrase; followups and nudge are for this question
+        followups = generate_followups(q, context_chunks) if near.answerable else None
+        answer, followups, _ = _add_followups_and_nudge(q, near.answer, followups, near.answerable)
+        answer_cache.put(q, ctx.idx_version, PROMPT_VERSION, answer=answer, followups=followups, path=ctx.path)
+        return Routed(answer, followups)
+
+    # 2c) Token budget: once a quota is spent, answer from the retrieved text without the chat model
+    ctx.stages_run.append("budget")
+    over = await budget.exhausted_async(ctx.session_id, ctx.ip_hash)
+    if over:
+        ctx.path = "budget_extractive"
+        BUDGET_DEGRADED.inc(scope=over)
+        log.warning("%s token budget spent; extractive answer", over, extra=fields(scope=over))
+        answer = extractive_answer(q, context_chunks)
+        return Routed(format_answer(answer) if answer else format_static(pick_rag_fallback(q, intents)))
 
     # 3) LLM
-    try:
-        path = "llm"
+    ctx.path = "llm"
+    ctx.stages_run.append("llm")
+
+    if context_chunks and debug_sampled():
+        preview = context_chunks[0]["text"][:120].replace("\n", " ")
+        log.debug("first chunk len=%d preview=%s", len(context_chunks[0]["text"]), preview)
+    return None
+
+
+def _finish_llm_answer(
+    q: str, answer: str, followups: Optional[List[str]], answerable: bool, intents: Optional[Intents] = None
+) -> Tuple[str, Optional[List[str]], str]:
+    """
+    Fallbacks, followups, nudge and final formatting of the raw model answer.
+    Returns (answer, followups, nudge).
+    """
+    body = _format_llm_answer(q, answer, intents)
+    return _add_followups_and_nudge(q, body, followups, answerable)
+
+
+def _format_llm_answer(q: str, answer: str, intents: Optional[Intents] = None) -> str:
+    """The answer body: the formatted model answer, or the fallback when it is empty."""
+    intents = classify(q) if intents is None else intents
+    # 4) Suitability fallback / 5) Final fallback (pick_rag_fallback covers both)
+    if not (answer or "").strip():
+        return format_static(pick_rag_fallback(q, intents))
+    # 3) final answer formatting (markdown cleanup, bullets/numbering), one pass
+    return format_answer(answer)
+
+
+def _add_followups_and_nudge(
+    q: str, answer: str, followups: Optional[List[str]], answerable: bool
+) -> Tuple[str, Optional[List[str]], str]:
+    """
+    The parts that depend on the exact question, around an answer body (from the model or
+    a semantic-cache near-hit). Returns (answer, followups, nudge).
+    """
+    # 1) followups: if unanswerable, show safe followups
+    if not answerable:
+        followups = followups_when_unanswerable(q)
+    else:
+        followups = clean_followups(followups, q) if followups else None
+
+    # 2) nudge: capability-aware
+    nudge = get_conversion_nudge(q, answerable)
+    if nudge:
+        # nudges are plain sentences: formatting them apart gives the same text as formatting the whole
+        answer = f"{answer}\n\n{format_static(nudge)}"
+    return answer, followups, nudge
 
-        if context_chunks:
-            preview = context_chunks[0]["text"][:120].replace("\n", " ")
-            print(
-                f"[CHK] first_chunk_len={len(context_chunks[0]['text'])} "
-                f"first_chunk_preview={preview}",
-                flush=True,
-            )
 
-        t_llm_start = time.time()
+def _remember(ctx: AskContext, answer: str, followups: Optional[List[str]], body: str, answerable: bool) -> None:
+    """answer/followups as sent (exact cache, same question); body without them (semantic cache, paraphrases)."""
+    if ctx.query_vec is None:
+        return  # lexical-only (degraded) retrieval: don't keep this answer around
+    answer_cache.put(ctx.q, ctx.idx_version, PROMPT_VERSION, answer=answer, followups=followups, path=ctx.path)
+    semantic_cache.put(ctx.query_vec, ctx.chunk_ids, ctx.idx_version, PROMPT_VERSION, answer=body, answerable=answerable)
+
+
+# -----------------------------
+# Main endpoint
+# -----------------------------
 
-        answer, followups, answerable = ask_llm(q, context_chunks)
-        
+@router.post("/ask")
+@limiter.limit("10/minute")
+async def ask(request: Request):
+    ctx = await AskContext.from_request(request)
+
+    def respond(answer_text: str, status_code: int = 200, followups=None):
+        ctx.finish(status_code)
+        payload = {"answer": answer_text}
+        if followups:
+           payload["followups"] = followups
+        return JSONResponse(payload, status_code=status_code)
+
+    try:
+        routed = await _route(ctx)
     except Exception as e:
-        path = "llm_error"
-        print(
-            f"[ERROR] stage=llm ip={ip_hash} origin={_safe_origin(origin)} err={repr(e)}",
-            flush=True,
-        )
-        return respond(
-            "Sorry — the AI service is temporarily unavailable. Please try again.",
-            status_code=503,
+        ctx.path = "error"
+        log.exception("routing failed: %r", e, extra=fields(stage="route"))
+        return respond(INTERNAL_ERROR_MSG, status_code=500)
+    if routed:
+        return respond(routed.answer, routed.status_code, routed.followups)
+
+    try:
+        t_llm_start = time.time()
+
+        answer, followups, answerable = await asyncio.wait_for(
+            ask_llm_async(ctx.q, ctx.context_chunks), timeout=LLM_TIMEOUT
         )
 
+    except asyncio.TimeoutError:
+        ctx.path = "llm_timeout"
+        log.error("llm timed out after %ss", LLM_TIMEOUT, extra=fields(stage="llm"))
+        return respond(LLM_TIMEOUT_MSG, status_code=504)
+    except Exception as e:
+        ctx.path = "llm_error"
+        log.error("llm failed: %r", e, extra=fields(stage="llm"))
+        return respond(LLM_UNAVAILABLE_MSG, status_code=503)
+
     t_llm_end = time.time()
-    llm_ms = int((t_llm_end - t_llm_start) * 1000)
+    ctx.llm_ms = int((t_llm_end - t_llm_start) * 1000)
+    await budget.charge_async(ctx.session_id, ctx.ip_hash, ctx.usage)
 
-    # 4) Suitability fallback
-    if is_suitability_question(q) and not (answer or "").strip():
-        answer = pick_rag_fallback(q)
+    body = _format_llm_answer(ctx.q, answer, ctx.intents)
+    answer, followups, _ = _add_followups_and_nudge(ctx.q, body, followups, answerable)
 
-    # 5) Final fallback
-    if not (answer or "").strip():
-        answer = pick_rag_fallback(q)
+    _remember(ctx, answer, followups, body, answerable)
+    return respond(answer, followups=followups)
 
-    #answer = format_answer_text(answer)
-    #followups = clean_followups(followups,q) if followups else None
 
-    # 1) followups: if unanswerable, show safe followups
-    if not answerable:
-        followups = followups_when_unanswerable(q)
-    else:
-        followups = clean_followups(followups, q) if followups else None
+# -----------------------------
+# Streaming endpoint (Server-Sent Events)
+# -----------------------------
 
-    # 2) nudge: capability-aware
-    nudge = get_conversion_nudge(q, answerable)
-    if nudge:
-        answer = f"{answer}\n\n{nudge}"
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-    # 3) final answer formatting (bullets/numbering)
-    answer = format_answer_text(answer)
-    
-    return respond(answer, retr_ms=retr_ms, llm_ms=llm_ms, followups=followups)
+
+@router.post("/ask/stream")
+@limiter.limit("10/minute")
+async def ask_stream(request: Request):
+    """
+    Same pipeline as /ask, streamed as SSE:
+    - `delta` events carry formatted answer text as it is generated
+    - one final `done` event carries the canonical answer (identical to /ask),
+      the cleaned followups and the conversion nudge
+    - `error` replaces `done` if the chat model fails (or anything else does: status 500)
+    Routed/cached answers are sent as a single delta followed by `done`.
+    """
+    ctx = await AskContext.from_request(request)
+
+    async def events():
+        status_code = 200
+        try:
+            routed = await _route(ctx)
+            if routed:
+                status_code = routed.status_code
+                if status_code != 200:
+                    yield _sse("error", {"error": routed.answer, "status": status_code})
+                    return
+                yield _sse("delta", {"text": routed.answer})
+                yield _sse("done", {"answer": routed.answer, "followups": routed.followups, "nudge": None})
+                return
+
+            fmt = StreamFormatter()
+            parts: List[str] = []
+            t_llm_start = time.time()
+            deadline = t_llm_start + LLM_TIMEOUT
+            try:
+                stream = await asyncio.wait_for(
+                    stream_llm_async(ctx.q, ctx.context_chunks), timeout=LLM_TIMEOUT
+                )
+                it = stream.__aiter__() if stream is not None else None
+                while it is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError
+                    try:
+                        delta = await asyncio.wait_for(it.__anext__(), timeout=remaining)
+                    except StopAsyncIteration:
+                        break
+                    if ctx.llm_first_ms is None:
+                        ctx.llm_first_ms = int((time.time() - t_llm_start) * 1000)
+                    parts.append(delta)
+                    out = fmt.feed(delta)
+                    if out:
+                        yield _sse("delta", {"text": out})
+            except asyncio.TimeoutError:
+                ctx.path = "llm_timeout"
+                status_code = 504
+                log.error("llm stream timed out after %ss", LLM_TIMEOUT, extra=fields(stage="llm_stream"))
+                yield _sse("error", {"error": LLM_TIMEOUT_MSG, "status": status_code})
+                return
+            except Exception as e:
+                ctx.path = "llm_error"
+                status_code = 503
+                log.error("llm stream failed: %r", e, extra=fields(stage="llm_stream"))
+                yield _sse("error", {"error": LLM_UNAVAILABLE_MSG, "status": status_code})
+                return
+            ctx.llm_ms = int((time.time() - t_llm_start) * 1000)
+            await budget.charge_async(ctx.session_id, ctx.ip_hash, ctx.usage)
+
+            answerable = stream is not None
+            raw = "".join(parts).strip()
+            if not answerable:
+                raw = "The answer is not in the provided documents."
+            followups = generate_followups(ctx.q, ctx.context_chunks) if answerable else None
+            body = _format_llm_answer(ctx.q, raw, ctx.intents)
+            answer, followups, nudge = _add_followups_and_nudge(ctx.q, body, followups, answerable)
+            _remember(ctx, answer, followups, body, answerable)
+            yield _sse("done", {"answer": answer, "followups": followups, "nudge": nudge or None})
+        except Exception as e:
+            # anything unexpected (routing, formatting, the budget store): recorded as a 500, not a 200
+            ctx.path = "error"
+            status_code = 500
+            log.exception("stream failed: %r", e, extra=fields(stage="stream"))
+            yield _sse("error", {"error": INTERNAL_ERROR_MSG, "status": status_code})
+        finally:
+            ctx.finish(status_code)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
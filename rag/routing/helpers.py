@@ -1,7 +1,9 @@
 # rag/routing/helpers.py
 # sanitizer + chunk parsing + requirements extraction stay here
+import hashlib
+import json
 import re
-from typing import Any, Optional
+from typing import Any, List, Optional, Set
 
 LEAK_PHRASES = [
     "not in the provided documents",
@@ -24,6 +26,32 @@ HARD_REQUIREMENT_SIGNALS = [
     r"\bapplicants must\b",
 ]
 
+# Per-chunk signals: the index build stores the names of the signals a chunk carries in its
+# meta ("signals"), so requirement routing only reads the flags of the retrieved chunks. Chunks
+# without the field (indexes built before it, plain strings) are scanned with the same patterns.
+SIGNALS = {
+    "hard_requirement": HARD_REQUIREMENT_SIGNALS,
+    "positioning": POSITIONING_SIGNALS,
+}
+_SIGNAL_RES = {name: [re.compile(p, re.IGNORECASE) for p in pats] for name, pats in SIGNALS.items()}
+
+
+def signals_fingerprint() -> str:
+    """Changes whenever a signal pattern does; the build folds it into the index content hash."""
+    return hashlib.sha256(json.dumps(SIGNALS, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+def text_signals(text: str) -> List[str]:
+    return [name for name, res in _SIGNAL_RES.items() if any(r.search(text) for r in res)]
+
+
+def chunk_signals(chunk: Any) -> Set[str]:
+    meta = chunk.get("meta") if isinstance(chunk, dict) else None
+    if meta and "signals" in meta:
+        return set(meta["signals"])
+    return set(text_signals(chunks_to_text([chunk])))
+
+
 def chunks_to_text(chunks: Any) -> str:
     if not chunks:
         return ""
@@ -0,0 +1,79 @@
+# rag/routing/intents.py
+# one intent pass per question: every route reads the resulting set instead of searching its own patterns
+#
+# Each intent is a pattern from patterns.py plus `triggers`: lowercase strings at least one of which
+# occurs in any text the pattern matches. classify() lowercases the question once, checks the
+# triggers (plain substring tests), and runs a pattern only when one of its triggers is present,
+# so most patterns are never searched. The result is the same set as searching every pattern
+# (bench/bench_routing.py checks that on the golden questions).
+#
+# A combined regex (named-group alternation, or one lookahead per intent) was measured slower:
+# `re` tries every branch at every position, so one big automaton costs more than the separate
+# searches it replaces. Patterns anchored at the start have no triggers: they fail on the first
+# character anyway.
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Tuple
+
+from . import patterns as P
+
+Intents = FrozenSet[str]
+
+
+@dataclass(frozen=True)
+class Intent:
+    name: str
+    pattern: re.Pattern
+    triggers: Tuple[str, ...] = ()  # () = always search (anchored patterns)
+
+
+INTENTS: Tuple[Intent, ...] = (
+    Intent("greeting", P.GREETING_PATTERN),
+    Intent("thanks", P.THANKS_PATTERN),
+    Intent("praise", P.PRAISE_PATTERN),
+    Intent("wh_prefix", P.WH_PREFIX_PATTERN),
+    Intent("mdes", P.MDES_PATTERN, ("mdes", "master", "integrated")),
+    Intent("requirement", P.REQUIREMENT_PATTERN, ("required", "requirement", "mandatory")),
+    Intent("suitability", P.SUITABILITY_PATTERN, ("fit", "suitable", "eligible", "background")),
+    Intent("suitability_profile", P.SUITABILITY_PROFILE_PATTERN, ("candidate", "thrive", "suited", "should apply", "profile")),
+    Intent("suitability_self", P.SUITABILITY_SELF_PATTERN, ("suitable", "fit", "candidate", "chance", "should")),
+    Intent("intake", P.INTAKE_PATTERN, ("intake", "matriculat", "cohort")),
+    Intent("programme_start", P.PROGRAMME_START_PATTERN, ("start", "classes")),
+    Intent("application_period", P.APPLICATION_PERIOD_PATTERN, ("applic", "apply", "deadline")),
+    Intent("reapplication", P.REAPPLICATION_PATTERN, ("apply", "again", "second attempt")),
+    Intent("offer_outcome", P.OFFER_OUTCOME_PATTERN, ("accept", "decline", "reject", "lapse", "expire")),
+    Intent("arrival", P.ARRIVAL_PATTERN, ("arriv", "reach", "come to nus", "on campus", "move to singapore")),
+    Intent("visa", P.VISA_PATTERN, ("visa", "student", "immigration")),
+    Intent("visa_process", P.VISA_PROCESS_PATTERN, ("visa", "student", "immigration")),
+    Intent(
+        "fact", P.FACT_PATTERN,
+        ("how much", "how many", "how long", "fee", "cost", "tuition", "price", "deadline", "closing date",
+         "application window", "when", "date", "ielts", "toefl", "score", "duration", "credit", "unit"),
+    ),
+    Intent(
+        "logistics", P.LOGISTICS_PATTERN,
+        ("visa", "student pass", "immigration", "ipa", "entry permit", "arriv", "on campus", "move to singapore"),
+    ),
+)
+
+
+# trigger -> intents it can start; each distinct trigger is tested once per question
+_BY_TRIGGER: Dict[str, List[Intent]] = {}
+for _i in INTENTS:
+    for _t in _i.triggers:
+        _BY_TRIGGER.setdefault(_t, []).append(_i)
+_ALWAYS = [i for i in INTENTS if not i.triggers]
+
+
+def classify(q: str) -> Intents:
+    """Names of every intent whose pattern matches the question."""
+    q = q or ""
+    low = q.lower()
+    candidates = {i.name: i for i in _ALWAYS}
+    for t, intents in _BY_TRIGGER.items():
+        if t in low:
+            for i in intents:
+                candidates[i.name] = i
+    return frozenset(name for name, i in candidates.items() if i.pattern.search(q))
@@ -48,11 +48,6 @@ OFFER_OUTCOME_PATTERN = re.compile(
 
 # Logistics
 ARRIVAL_PATTERN = re.compile(r"\b(arrive|arrival|reach|come to nus|on campus|move to singapore)\b", re.IGNORECASE)
-VISA_PATTERN    = re.compile(r"\b(visa|student pass|student visa|immigration|ipa|entry permit)\b", re.IGNORECASE)
-VISA_PROCESS_PATTERN = re.compile(
-    r"\b(how do i apply|how to apply|application process|apply for a visa|visa application)\b",
-    re.IGNORECASE,
-)
 
 LOGISTICS_PATTERN = re.compile(
     r"\b(visa|student pass|immigration|ipa|entry permit|arrive|arrival|on campus|move to singapore)\b",
@@ -73,4 +68,25 @@ VISA_PROCESS_PATTERN = re.compile(
     re.I
 )
 
+# First-person suitability ("am I suitable?"): plain phrases, matched anywhere in the question
+SUITABILITY_SELF_PHRASES = (
+    "am i suitable",
+    "will i be suitable",
+    "would i be suitable",
+    "is edi suitable",
+    "suitable for me",
+    "fit for edi",
+    "good fit",
+    "good candidate",
+    "do i stand a chance",
+    "chance of admission",
+    "should i apply",
+)
+SUITABILITY_SELF_PATTERN = re.compile("|".join(map(re.escape, SUITABILITY_SELF_PHRASES)), re.IGNORECASE)
 
+# short literal facts (fees, dates, scores, durations): the extractive fast path may answer these
+FACT_PATTERN = re.compile(
+    r"\b(how much|how many|how long|fees?|costs?|tuition|price|deadline|closing date|application window|"
+    r"when|dates?|ielts|toefl|score|duration|credits?|units)\b",
+    re.IGNORECASE,
+)
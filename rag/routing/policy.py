@@ -1,25 +1,32 @@
 # rag/routing/policy.py
 # keep this ordering
 
-from typing import Any, Optional, Tuple
-from . import patterns as P
+from typing import Any, Dict, Optional, Tuple
+from rag.extractive import fact_answer
 from . import fallbacks as F
-from .helpers import (
-    chunks_to_text,
-    has_any_signal,
-    extract_requirement_thing,
-    POSITIONING_SIGNALS,
-    HARD_REQUIREMENT_SIGNALS,
-)
+from .intents import Intents, classify
+from .helpers import chunk_signals, extract_requirement_thing
+
+
+def requirement_support(context_chunks: Any) -> Tuple[Optional[str], Optional[Any]]:
+    """(signal, chunk) answer_requirement bases its answer on: the first chunk stating a hard
+    requirement, else the first positioning one; (None, None) means the generic fallback."""
+    flagged = [(c, chunk_signals(c)) for c in context_chunks or ()]
+    for signal in ("hard_requirement", "positioning"):
+        for c, signals in flagged:
+            if signal in signals:
+                return signal, c
+    return None, None
+
 
 def answer_requirement(q: str, context_chunks: Any) -> str:
     thing = extract_requirement_thing(q) or "that"
-    ctx = chunks_to_text(context_chunks)
+    signal, _ = requirement_support(context_chunks)
 
-    if ctx and has_any_signal(ctx, HARD_REQUIREMENT_SIGNALS):
+    if signal == "hard_requirement":
         return f"Yes — {thing} is required for admission to MSc Engineering Design & Innovation (EDI)."
 
-    if ctx and has_any_signal(ctx, POSITIONING_SIGNALS):
+    if signal == "positioning":
         return (
             f"No — {thing} is not a formal requirement for admission to MSc Engineering Design & Innovation (EDI). "
             "Admissions are usually assessed holistically."
@@ -28,35 +35,50 @@ def answer_requirement(q: str, context_chunks: Any) -> str:
     return F.REQUIREMENT_FALLBACK_GENERIC
 
 
-def route_early(q: str) -> Optional[str]:
-    if P.GREETING_PATTERN.match(q):
+# Every route takes the question's intent set (intents.classify); /ask classifies once and
+# passes it to each route. Without it, a route classifies the question itself.
+
+def _is_requirement(i: Intents) -> bool:
+    return "requirement" in i and "wh_prefix" not in i and "logistics" not in i
+
+
+def _is_suitability(i: Intents) -> bool:
+    return "suitability" in i or "suitability_profile" in i
+
+
+def is_suitability_question(q: str, intents: Optional[Intents] = None) -> bool:
+    """First-person suitability ("am I suitable", "should I apply")."""
+    i = classify(q) if intents is None else intents
+    return "suitability_self" in i
+
+
+def route_early(q: str, intents: Optional[Intents] = None) -> Optional[str]:
+    i = classify(q) if intents is None else intents
+    if "greeting" in i:
         return "Hello! I can help you with MSc EDI programme related questions."
-    if P.THANKS_PATTERN.match(q):
+    if "thanks" in i:
         return "You’re welcome!"
-    if P.PRAISE_PATTERN.match(q):
+    if "praise" in i:
         return "Glad it helped!"
-    if P.MDES_PATTERN.search(q):
+    if "mdes" in i:
         return F.MDES_REDIRECT_MSG
     return None
 
 
-def route_intake(q: str) -> Optional[str]:
+def route_intake(q: str, intents: Optional[Intents] = None) -> Optional[str]:
+    i = classify(q) if intents is None else intents
     # Suitability must always win
-    if P.SUITABILITY_PATTERN.search(q):
+    if "suitability" in i:
         return None
 
     # Not an intake-related question
-    if not (
-        P.INTAKE_PATTERN.search(q)
-        or P.PROGRAMME_START_PATTERN.search(q)
-        or P.APPLICATION_PERIOD_PATTERN.search(q)
-    ):
+    if not ("intake" in i or "programme_start" in i or "application_period" in i):
         return None
 
-    if P.PROGRAMME_START_PATTERN.search(q):
+    if "programme_start" in i:
         return F.PROGRAMME_START_FALLBACK
 
-    if P.APPLICATION_PERIOD_PATTERN.search(q):
+    if "application_period" in i:
         return None  # let RAG handle exact dates
 
     return (
@@ -68,52 +90,68 @@ def route_intake(q: str) -> Optional[str]:
 
 
 
-def route_policy_logistics(q: str, context_chunks: Any) -> Optional[str]:
-    if P.OFFER_OUTCOME_PATTERN.search(q):
+def route_policy_static(q: str, intents: Optional[Intents] = None) -> Optional[str]:
+    """Policy answers that never look at retrieved chunks (safe to run before retrieval)."""
+    i = classify(q) if intents is None else intents
+    if "offer_outcome" in i:
         return F.OFFER_OUTCOME_FALLBACK
 
-    if P.REAPPLICATION_PATTERN.search(q):
+    if "reapplication" in i:
         return F.REAPPLICATION_FALLBACK
 
-    if P.VISA_PROCESS_PATTERN.search(q):
+    if "visa_process" in i:
         return F.VISA_PROCESS_FALLBACK
 
-    if P.VISA_PATTERN.search(q):
+    if "visa" in i:
         return F.VISA_FALLBACK
 
-    if P.ARRIVAL_PATTERN.search(q):
-        return None if context_chunks else F.NOT_FOUND_FALLBACK
+    return None
+
 
+def route_arrival(q: str, context_chunks: Any, intents: Optional[Intents] = None) -> Optional[str]:
+    """Arrival/logistics questions: only answerable if retrieval found something."""
+    i = classify(q) if intents is None else intents
+    if "arrival" in i:
+        return None if context_chunks else F.NOT_FOUND_FALLBACK
     return None
 
 
+def route_policy_logistics(q: str, context_chunks: Any, intents: Optional[Intents] = None) -> Optional[str]:
+    i = classify(q) if intents is None else intents
+    return route_policy_static(q, i) or route_arrival(q, context_chunks, i)
+
+
 def route_requirement_or_suitability(
-    q: str, context_chunks: Any
+    q: str, context_chunks: Any, intents: Optional[Intents] = None
 ) -> Optional[Tuple[str, str]]:
+    i = classify(q) if intents is None else intents
     # Requirements: can be answered directly
-    if (
-        P.REQUIREMENT_PATTERN.search(q)
-        and not P.WH_PREFIX_PATTERN.search(q)
-        and not P.LOGISTICS_PATTERN.search(q)
-    ):
+    if _is_requirement(i):
         return ("direct", answer_requirement(q, context_chunks))
 
     # Suitability: DETECT ONLY — never answer here
-    if P.SUITABILITY_PATTERN.search(q) or P.SUITABILITY_PROFILE_PATTERN.search(q):
+    if _is_suitability(i):
         return ("suitability", "")
 
     return None
 
 
-def pick_rag_fallback(q: str) -> str:
-    if (
-        P.REQUIREMENT_PATTERN.search(q)
-        and not P.WH_PREFIX_PATTERN.search(q)
-        and not P.LOGISTICS_PATTERN.search(q)
-    ):
+def route_fact(
+    q: str, context_chunks: Any, intents: Optional[Intents] = None
+) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """(answer, chunk) for a fact question (fee, date, score) a top chunk states outright; None = ask the model."""
+    i = classify(q) if intents is None else intents
+    if "fact" not in i or _is_suitability(i):
+        return None
+    return fact_answer(q, context_chunks or [])
+
+
+def pick_rag_fallback(q: str, intents: Optional[Intents] = None) -> str:
+    i = classify(q) if intents is None else intents
+    if _is_requirement(i):
         return F.REQUIREMENT_FALLBACK_GENERIC
 
-    if P.SUITABILITY_PATTERN.search(q) or P.SUITABILITY_PROFILE_PATTERN.search(q):
+    if _is_suitability(i):
         return F.SUITABILITY_FALLBACK
 
     return F.NOT_FOUND_FALLBACK
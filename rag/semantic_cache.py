@@ -0,0 +1,166 @@
+# rag/semantic_cache.py
+# near-duplicate answer cache: nearest neighbour over the vectors of previously answered questions
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1024"))  # 0 disables the cache
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))  # seconds
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))  # min cosine similarity
+SEMANTIC_CACHE_MATCH_TOP = int(os.getenv("SEMANTIC_CACHE_MATCH_TOP", "3"))  # top chunk ids that must agree
+_CANDIDATES = 4  # neighbours inspected per lookup
+
+
+@dataclass(frozen=True)
+class SemanticEntry:
+    answer: str  # formatted answer body: no nudge, no followups (both depend on the exact question)
+    answerable: bool
+    top_ids: Tuple[int, ...]
+    index_version: str
+    prompt_version: str
+    created: float
+
+
+class SemanticAnswerCache:
+    """
+    Second, small FAISS index (IndexIDMap2 over IndexFlatIP) of question vectors
+    whose answers came from the chat model.
+
+    A lookup is a near-hit only when all of these hold:
+    - cosine(query, cached question) >= threshold
+    - both retrievals agree on the top `match_top` chunk ids
+    - the entry was produced for the same index version and prompt version
+    - the entry is younger than the TTL
+    Oldest entries are evicted first once `max_entries` is exceeded.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = SEMANTIC_CACHE_SIZE,
+        ttl: float = SEMANTIC_CACHE_TTL,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        match_top: int = SEMANTIC_CACHE_MATCH_TOP,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.match_top = match_top
+        self._index: Optional[faiss.IndexIDMap2] = None
+        self._entries: "OrderedDict[int, SemanticEntry]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.near_hits = 0
+        self.rejected_chunks = 0  # similar question, but retrieval disagreed
+        self.rejected_stale = 0  # similar question, but expired / other index or prompt version
+
+    def _top(self, chunk_ids: Sequence[int]) -> Tuple[int, ...]:
+        return tuple(int(i) for i in list(chunk_ids)[: self.match_top])
+
+    def _remove(self, ids: List[int]) -> None:
+        for i in ids:
+            self._entries.pop(i, None)
+        if self._index is not None and ids:
+            self._index.remove_ids(np.array(ids, dtype="int64"))
+
+    def lookup(
+        self,
+        vec: np.ndarray,
+        chunk_ids: Sequence[int],
+        index_version: str,
+        prompt_version: str,
+    ) -> Optional[SemanticEntry]:
+        top = self._top(chunk_ids)
+        if self.max_entries <= 0 or not top:
+            return None
+        q = np.asarray(vec, dtype="float32").reshape(1, -1)
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            if self._index is None or self._index.ntotal == 0:
+                return None
+            scores, ids = self._index.search(q, min(_CANDIDATES, self._index.ntotal))
+
+            stale: List[int] = []
+            hit: Optional[SemanticEntry] = None
+            for score, i in zip(scores[0], ids[0]):
+                if i < 0 or score < self.threshold:
+                    break
+                e = self._entries.get(int(i))
+                if e is None:
+                    continue
+                if (
+                    now - e.created > self.ttl
+                    or e.index_version != index_version
+                    or e.prompt_version != prompt_version
+                ):
+                    stale.append(int(i))
+                    self.rejected_stale += 1
+                    continue
+                if e.top_ids != top:
+                    self.rejected_chunks += 1
+                    continue
+                hit = e
+                self._entries.move_to_end(int(i))
+                break
+
+            self._remove(stale)
+            if hit is not None:
+                self.near_hits += 1
+            return hit
+
+    def put(
+        self,
+        vec: np.ndarray,
+        chunk_ids: Sequence[int],
+        index_version: str,
+        prompt_version: str,
+        *,
+        answer: str,
+        answerable: bool = True,
+    ) -> None:
+        top = self._top(chunk_ids)
+        if self.max_entries <= 0 or not top:
+            return
+        v = np.array(vec, dtype="float32").reshape(1, -1)
+        entry = SemanticEntry(
+            answer=answer,
+            answerable=answerable,
+            top_ids=top,
+            index_version=index_version,
+            prompt_version=prompt_version,
+            created=time.time(),
+        )
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(v.shape[1]))
+            i = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(v, np.array([i], dtype="int64"))
+            self._entries[i] = entry
+
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                self._remove(list(self._entries.keys())[:overflow])
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "near_hits": self.near_hits,
+                "rejected_chunks": self.rejected_chunks,
+                "rejected_stale": self.rejected_stale,
+                "near_hit_rate": (self.near_hits / self.lookups) if self.lookups else 0.0,
+            }
+
+
+semantic_cache = SemanticAnswerCache()
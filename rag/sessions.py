@@ -0,0 +1,63 @@
+# rag/sessions.py
+# follow-up tracking: which route path answered a session's previous question, if it was recent
+#
+#   FOLLOWUP_WINDOW_S=300        a question this soon after an answer to the same session is a follow-up
+#   FOLLOWUP_MAX_SESSIONS=10000  sessions remembered per worker (least recently active dropped first)
+#
+# A follow-up is a rough sign that the answer was not enough on its own. The router records the
+# path of every answered request under its session (session_id, else ip_hash) and counts the next
+# question inside the window against the previous answer's path:
+#   follow-up rate of a path = rag_followups_total{after=path} / rag_requests_total{path=path,status="200"}
+# e.g. extractive_fastpath vs llm. The store is in memory per worker: with several workers a
+# session's questions can land on different ones, so the counts are a lower bound.
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from rag.metrics import registry
+
+FOLLOWUP_WINDOW_S = float(os.getenv("FOLLOWUP_WINDOW_S", "300"))
+FOLLOWUP_MAX_SESSIONS = int(os.getenv("FOLLOWUP_MAX_SESSIONS", "10000"))
+
+FOLLOWUPS = registry.counter(
+    "rag_followups_total",
+    "Questions asked within FOLLOWUP_WINDOW_S of an answer to the same session, by the path that answered it.",
+    ("after",),
+)
+
+
+class LastAnswers:
+    """session -> (time, path) of its last answered question; bounded LRU."""
+
+    def __init__(self, window_s: float = FOLLOWUP_WINDOW_S, max_sessions: int = FOLLOWUP_MAX_SESSIONS):
+        self.window_s = window_s
+        self.max_sessions = max_sessions
+        self._last: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, session: Optional[str], path: Optional[str], now: Optional[float] = None) -> Optional[str]:
+        """
+        Path that answered this session's previous question if it is within the window (this
+        question follows up on it), else None. path (None: not answered) becomes the last answer.
+        """
+        if not session:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            prev = self._last.get(session)
+            if path:
+                self._last[session] = (now, path)
+                self._last.move_to_end(session)
+                while len(self._last) > self.max_sessions:
+                    self._last.popitem(last=False)
+        if prev is None or now - prev[0] > self.window_s:
+            return None
+        FOLLOWUPS.inc(after=prev[1])
+        return prev[1]
+
+
+last_answers = LastAnswers()
@@ -0,0 +1,138 @@
+# rag/store.py
+# compact, memory-mapped chunk store (replaces docs.pkl)
+#
+# Layout:
+#   chunks.bin          all chunk texts, UTF-8, back to back
+#   chunks.offsets.npy  uint64[n + 1]; chunk i is chunks.bin[offsets[i]:offsets[i + 1]]
+#   chunks.meta.jsonl   optional, one JSON object per chunk (source, section, offsets, ...)
+#
+# Both files are opened with mmap, so every uvicorn worker on a box shares the same
+# page-cache pages instead of unpickling its own list of strings.
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import pickle
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+
+def offsets_path_for(blob_path: Path) -> Path:
+    return blob_path.with_suffix(".offsets.npy")
+
+
+def meta_path_for(blob_path: Path) -> Path:
+    return blob_path.with_suffix(".meta.jsonl")
+
+
+class ChunkStore:
+    """Read-only, zero-copy sequence of chunk texts (supports len() and indexing)."""
+
+    def __init__(self, blob_path: Path, offsets_path: Optional[Path] = None):
+        self.blob_path = Path(blob_path)
+        self.offsets_path = Path(offsets_path or offsets_path_for(self.blob_path))
+        self._offsets = np.load(self.offsets_path, mmap_mode="r")
+        self._file = open(self.blob_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap of an empty file is not allowed
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._meta: Optional[List[Dict]] = None
+
+    def __len__(self) -> int:
+        return max(0, int(self._offsets.shape[0]) - 1)
+
+    def __getitem__(self, i: int) -> str:
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(i)
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._blob[start:end].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def meta(self, i: int) -> Dict:
+        """Metadata written with chunk i ({} for stores built without it)."""
+        if self._meta is None:
+            path = meta_path_for(self.blob_path)
+            if path.exists():
+                with open(path, encoding="utf-8") as f:
+                    self._meta = [json.loads(line) for line in f]
+            else:
+                self._meta = []
+        return self._meta[i] if 0 <= i < len(self._meta) else {}
+
+    def close(self) -> None:
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._file.close()
+
+
+class ChunkStoreWriter:
+    """
+    Appends chunks to chunks.bin as they are produced; offsets are written on close().
+    Metadata, if given for any chunk, goes to chunks.meta.jsonl line by line.
+    """
+
+    def __init__(self, blob_path: Path, offsets_path: Optional[Path] = None):
+        self.blob_path = Path(blob_path)
+        self.offsets_path = Path(offsets_path or offsets_path_for(self.blob_path))
+        self.blob_path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = open(self.blob_path, "wb")
+        self._offsets: List[int] = [0]
+        self._meta_f = None
+
+    def append(self, text: str, meta: Optional[Dict] = None) -> int:
+        data = text.encode("utf-8")
+        self._f.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+        if meta is not None and self._meta_f is None:
+            self._meta_f = open(meta_path_for(self.blob_path), "w", encoding="utf-8")
+            self._meta_f.write("{}\n" * (len(self._offsets) - 2))  # earlier chunks had none
+        if self._meta_f is not None:
+            self._meta_f.write(json.dumps(meta or {}, ensure_ascii=False) + "\n")
+        return len(self._offsets) - 2
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def close(self) -> None:
+        self._f.close()
+        if self._meta_f is not None:
+            self._meta_f.close()
+        np.save(self.offsets_path, np.asarray(self._offsets, dtype=np.uint64))
+
+    def __enter__(self) -> "ChunkStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def write_chunk_store(texts: Iterable[str], blob_path: Path) -> int:
+    with ChunkStoreWriter(blob_path) as w:
+        for t in texts:
+            w.append(t)
+        return len(w)
+
+
+def convert_docs_pkl(docs_path: Path, blob_path: Path) -> int:
+    """One-off migration of a legacy docs.pkl (list of str) into the chunk store format."""
+    with open(docs_path, "rb") as f:
+        docs = pickle.load(f)
+    return write_chunk_store((d if isinstance(d, str) else str(d) for d in docs), blob_path)
+
+
+if __name__ == "__main__":
+    # python -m rag.store docs.pkl chunks.bin
+    src = Path(sys.argv[1] if len(sys.argv) > 1 else "docs.pkl")
+    dst = Path(sys.argv[2] if len(sys.argv) > 2 else "chunks.bin")
+    n = convert_docs_pkl(src, dst)
+    print(f"Wrote {n} chunks to {dst} and {offsets_path_for(dst)}")
@@ -0,0 +1,24 @@
+# rag/tokens.py
+# token counting shared by the chunker, the embedding pipeline and the prompt builder
+from __future__ import annotations
+
+try:  # optional: exact counts for OpenAI models; otherwise ~4 characters per token
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("cl100k_base")  # embedding models (text-embedding-3-*)
+    try:
+        _CHAT_ENCODING = tiktoken.get_encoding("o200k_base")  # gpt-4o family (prompt budgets)
+    except Exception:  # tiktoken before o200k_base
+        _CHAT_ENCODING = _ENCODING
+except Exception:
+    _ENCODING = _CHAT_ENCODING = None
+
+
+def count_tokens(text: str, chat: bool = False) -> int:
+    """Tokens of text for the embedding model, or for the chat model with chat=True."""
+    if not text:
+        return 0
+    enc = _CHAT_ENCODING if chat else _ENCODING
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
@@ -0,0 +1,276 @@
+# rag/vector_store.py
+# persistent chunk-id -> vector store for incremental index builds, kept on disk
+#
+#   index/vectors/
+#     vectors.bin   int32 dim, int64 n, int64[n] ids, float32[n, dim] vectors;
+#                   id = chunk_id(model, chunk text)
+#     files.json    embedding model, dim, and per source file: sha256 + chunk count
+#     journal.bin   vectors added since the last save(): int32 dim, then (int64 id, float32[dim])
+#                   records; replayed by load(), so an interrupted build resumes where it stopped
+#
+# The builder only embeds chunks whose id is not in the store yet and removes ids whose
+# chunk no longer exists, so a rebuild costs as much as the change, not the corpus.
+#
+# Vectors are never held in memory as a whole: both files are memory-mapped and only the ids
+# are read (id -> row). New vectors are appended to the journal (fsynced per batch by
+# checkpoint()), save() rewrites vectors.bin from the live rows block by block, and the serving
+# index (one IndexFlatIP per published version) is streamed to its file the same way by
+# write_flat_index(). Peak memory is one block of vectors plus the id map.
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+VECTORS_NAME = "vectors.bin"
+FILES_NAME = "files.json"
+JOURNAL_NAME = "journal.bin"
+LEGACY_VECTORS_NAME = "vectors.faiss"  # in-memory IndexIDMap2 of earlier builds; dropped, re-seeded
+BLOCK_ROWS = 4096  # vectors per read/write block
+
+
+def chunk_id(model: str, text: str) -> int:
+    """Stable 63-bit id of (embedding model, chunk text); FAISS ids are signed int64."""
+    digest = hashlib.sha256(f"{model}\n{text}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & 0x7FFF_FFFF_FFFF_FFFF
+
+
+def file_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _record(dim: int) -> np.dtype:
+    return np.dtype([("id", "<i8"), ("vec", "<f4", (dim,))])
+
+
+def _map_vectors(path: Path) -> Tuple[Optional[int], Optional[np.memmap], Optional[np.memmap]]:
+    """(dim, ids, vectors) of vectors.bin, read-only; (None, None, None) if there is none."""
+    if not path.exists() or path.stat().st_size < 12:
+        return None, None, None
+    with open(path, "rb") as f:
+        dim = int(np.frombuffer(f.read(4), dtype="<i4")[0])
+        n = int(np.frombuffer(f.read(8), dtype="<i8")[0])
+    if n == 0:
+        return dim, None, None
+    ids = np.memmap(path, dtype="<i8", mode="r", offset=12, shape=(n,))
+    vecs = np.memmap(path, dtype="<f4", mode="r", offset=12 + 8 * n, shape=(n, dim))
+    return dim, ids, vecs
+
+
+def _map_records(path: Path) -> Tuple[Optional[int], Optional[np.memmap]]:
+    """(dim, read-only records) of journal.bin; a torn last record is ignored."""
+    if not path.exists() or path.stat().st_size < 4:
+        return None, None
+    with open(path, "rb") as f:
+        dim = int(np.frombuffer(f.read(4), dtype="<i4")[0])
+    n = (path.stat().st_size - 4) // _record(dim).itemsize
+    if n == 0:
+        return dim, None
+    return dim, np.memmap(path, dtype=_record(dim), mode="r", offset=4, shape=(n,))
+
+
+def _flat_index_header(dim: int, ntotal: int) -> bytes:
+    """
+    Bytes faiss.write_index() puts before the vectors of an IndexFlatIP with ntotal rows: taken
+    from an empty index ("IxFI", int32 d, int64 ntotal, ..., uint64 float count), counts patched in.
+    """
+    empty = faiss.serialize_index(faiss.IndexFlatIP(dim)).tobytes()
+    if empty[:4] != b"IxFI" or empty[8:16] != bytes(8) or empty[-8:] != bytes(8):
+        raise RuntimeError("unexpected IndexFlatIP serialization; cannot stream the serving index")
+    return empty[:8] + struct.pack("<q", ntotal) + empty[16:-8] + struct.pack("<Q", ntotal * dim)
+
+
+class VectorStore:
+    """Memory-mapped vectors.bin + journal.bin keyed by chunk id, plus the per-file manifest of the last build."""
+
+    def __init__(self, path: Path, model: str):
+        self.path = Path(path)
+        self.model = model
+        self.dim: Optional[int] = None
+        self.files: Dict[str, Dict] = {}
+        self._base: Optional[np.memmap] = None  # vectors of vectors.bin
+        self._rows: Dict[int, int] = {}  # id -> row; rows past len(_base) are journal rows
+        self._journal = None
+        self._journal_rows = 0
+        self._journal_map: Optional[np.memmap] = None
+        self.replayed = 0  # vectors recovered from the journal of an interrupted build
+
+    @classmethod
+    def load(cls, path: Path, model: str, reuse: bool = True) -> "VectorStore":
+        """
+        Opens the store at `path`; starts empty if it is missing or was built with another model.
+        reuse=False (full rebuild) ignores the saved vectors but keeps them on disk until save()
+        replaces them, and still replays the journal, so an interrupted full rebuild resumes too.
+        """
+        store = cls(path, model)
+        files = store.path / FILES_NAME
+        if files.exists():
+            meta = json.loads(files.read_text(encoding="utf-8"))
+            if meta.get("embed_model") != model:
+                print(f"Vector store was built with {meta.get('embed_model')}, starting fresh for {model}")
+            else:
+                store.files = meta.get("files", {})
+            if reuse and meta.get("embed_model") == model:
+                store._map_base()
+        # journal ids are (model, text) hashes: another model's vectors never match a chunk, and
+        # the builder drops them with the other stale ids
+        store.replayed = store._replay_journal()
+        return store
+
+    def _map_base(self) -> None:
+        dim, ids, self._base = _map_vectors(self.path / VECTORS_NAME)
+        self.dim = dim if dim is not None else self.dim
+        self._rows = {cid: row for row, cid in enumerate(ids.tolist())} if ids is not None else {}
+
+    def _replay_journal(self) -> int:
+        path = self.path / JOURNAL_NAME
+        dim, rows = _map_records(path)
+        if dim is None:
+            return 0
+        if self.dim is not None and dim != self.dim:
+            path.unlink()
+            return 0
+        self.dim = dim
+        self._journal_rows = len(rows) if rows is not None else 0
+        if rows is None:
+            return 0
+        offset = len(self._base) if self._base is not None else 0
+        replayed = 0
+        for k, cid in enumerate(rows["id"].tolist()):
+            if cid not in self._rows:
+                self._rows[cid] = offset + k
+                replayed += 1
+        return replayed
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, cid: int) -> bool:
+        return cid in self._rows
+
+    def add(self, ids: List[int], vecs: np.ndarray) -> None:
+        """Appends to journal.bin (see checkpoint()); ids already stored are skipped."""
+        vecs = np.ascontiguousarray(vecs, dtype="float32")
+        if self.dim is not None and vecs.shape[1] != self.dim:
+            # another model's dimension: nothing stored is reusable
+            self.discard_journal()
+            self._base, self._rows, self.dim = None, {}, None
+        if self.dim is None:
+            self.dim = vecs.shape[1]
+        if self._journal is None:
+            self._journal = self._open_journal(self.dim)
+        keep = [k for k, cid in enumerate(ids) if int(cid) not in self._rows]
+        if not keep:
+            return
+        record = np.empty(len(keep), dtype=_record(self.dim))
+        record["id"] = [ids[k] for k in keep]
+        record["vec"] = vecs[keep]
+        self._journal.write(record.tobytes())
+        offset = len(self._base) if self._base is not None else 0
+        for j, cid in enumerate(record["id"].tolist()):
+            self._rows[cid] = offset + self._journal_rows + j
+        self._journal_rows += len(keep)
+        self._journal_map = None
+
+    def _open_journal(self, dim: int):
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self.path / JOURNAL_NAME
+        if path.exists() and path.stat().st_size >= 4:
+            # drop a torn record from an earlier crash so appends stay aligned
+            f = open(path, "r+b")
+            f.truncate(4 + self._journal_rows * _record(dim).itemsize)
+            f.seek(0, os.SEEK_END)
+            return f
+        f = open(path, "wb")
+        f.write(np.array([dim], dtype="<i4").tobytes())
+        return f
+
+    def checkpoint(self) -> None:
+        """Makes everything added so far survive a crash (the builder calls this per batch)."""
+        if self._journal is not None:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+    def discard_journal(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        self._journal_rows = 0
+        self._journal_map = None
+        (self.path / JOURNAL_NAME).unlink(missing_ok=True)
+
+    def remove(self, ids: Iterable[int]) -> int:
+        """Forgets ids; their rows are left out of vectors.bin at the next save()."""
+        removed = 0
+        for cid in ids:
+            if self._rows.pop(cid, None) is not None:
+                removed += 1
+        return removed
+
+    def ids(self) -> set[int]:
+        return set(self._rows)
+
+    def _journal_view(self) -> np.memmap:
+        if self._journal_map is None:
+            if self._journal is not None:
+                self._journal.flush()
+            _, self._journal_map = _map_records(self.path / JOURNAL_NAME)
+        return self._journal_map
+
+    def vectors(self, ids: Sequence[int]) -> np.ndarray:
+        """Vectors for `ids`, in that order (read from the mapped files)."""
+        rows = np.fromiter((self._rows[int(cid)] for cid in ids), dtype=np.int64, count=len(ids))
+        out = np.empty((len(ids), self.dim), dtype="float32")
+        n_base = len(self._base) if self._base is not None else 0
+        in_base = rows < n_base
+        if in_base.any():
+            out[in_base] = self._base[rows[in_base]]
+        if not in_base.all():
+            out[~in_base] = self._journal_view()["vec"][rows[~in_base] - n_base]
+        return out
+
+    def write_flat_index(self, ids: Sequence[int], path: Path, block: int = BLOCK_ROWS) -> int:
+        """
+        Writes the serving index (an IndexFlatIP with row i = vector of ids[i]) straight to `path`,
+        block by block, in faiss.write_index's format; returns the dimension.
+        """
+        with open(path, "wb") as f:
+            f.write(_flat_index_header(self.dim, len(ids)))
+            for start in range(0, len(ids), block):
+                f.write(self.vectors(ids[start:start + block]).tobytes())
+        return self.dim
+
+    def save(self) -> None:
+        """
+        Rewrites vectors.bin with the live rows (temp file + os.replace, so an interrupted build
+        keeps the old store), then files.json, then drops the journal (its vectors are now in
+        vectors.bin) and maps the new file.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        if self.dim is not None:
+            self.checkpoint()
+            ids = list(self._rows)
+            tmp = self.path / f".{VECTORS_NAME}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(np.array([self.dim], dtype="<i4").tobytes() + np.array([len(ids)], dtype="<i8").tobytes())
+                f.write(np.asarray(ids, dtype="<i8").tobytes())
+                for start in range(0, len(ids), BLOCK_ROWS):
+                    f.write(self.vectors(ids[start:start + BLOCK_ROWS]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path / VECTORS_NAME)
+        tmp = self.path / f".{FILES_NAME}.tmp"
+        tmp.write_text(
+            json.dumps({"embed_model": self.model, "dim": self.dim, "files": self.files}, indent=2),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.path / FILES_NAME)
+        self.discard_journal()
+        (self.path / LEGACY_VECTORS_NAME).unlink(missing_ok=True)
+        self._map_base()
@@ -0,0 +1,75 @@
+# rag/warmup.py
+# startup warm-up (index + OpenAI connections) and readiness state for /ready
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict
+
+from rag import llm, retriever
+from rag.logs import fields
+
+log = logging.getLogger("rag.warmup")
+
+WARMUP_CONNECT = os.getenv("WARMUP_CONNECT", "1") == "1"  # open TLS connections to OpenAI at startup
+WARMUP_EMBED = os.getenv("WARMUP_EMBED", "0") == "1"  # also embed one query (fills the embedding cache)
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "15"))  # seconds for the network part of warm-up
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "What is the MSc EDI programme?")
+
+_PROCESS_T0 = time.time()  # ~ when the app module graph was imported
+
+# readiness is separate from liveness: /health answers as soon as the process is up,
+# /ready only once the index is loaded
+state: Dict[str, Any] = {
+    "ready": False,
+    "startup_ms": None,
+    "index_version": None,
+    "errors": [],
+}
+
+
+async def _open_connections() -> None:
+    # a cheap authenticated request per client; keeps the pooled HTTPS connection open
+    await asyncio.gather(
+        retriever._aclient.models.list(),
+        llm.aclient.models.list(),
+    )
+
+
+async def warm_up() -> Dict[str, Any]:
+    """Loads docs/index eagerly and pre-opens OpenAI connections. Never raises."""
+    t0 = time.time()
+    state["errors"] = []
+
+    try:
+        await asyncio.to_thread(retriever._load_resources)
+        state["index_version"] = retriever.index_version()
+        state["ready"] = True
+    except Exception as e:
+        state["errors"].append(f"index: {e!r}")
+    t_index = time.time()
+
+    network = []
+    if WARMUP_CONNECT:
+        network.append(_open_connections())
+    if WARMUP_EMBED:
+        network.append(retriever._embed_query_async(retriever._normalize_query_for_retrieval(WARMUP_QUERY)))
+    if network:
+        try:
+            await asyncio.wait_for(asyncio.gather(*network), timeout=WARMUP_TIMEOUT)
+        except Exception as e:
+            # the API being slow/unreachable at boot should not keep the worker out of rotation
+            state["errors"].append(f"openai: {e!r}")
+
+    state["startup_ms"] = int((time.time() - t0) * 1000)
+    log.info("startup", extra=fields(
+        ready=state["ready"],
+        index_ms=int((t_index - t0) * 1000),
+        startup_ms=state["startup_ms"],
+        since_boot_ms=int((time.time() - _PROCESS_T0) * 1000),
+        index_version=state["index_version"],
+        errors=state["errors"],
+    ))
+    return state
@@ -3,37 +3,41 @@ $ErrorActionPreference = "Stop"
 Write-Host "Rebuilding FAISS index..."
 
 # Step 1: Run index builder
-python rag/build_index_openai.py
+python -m rag.build_index_openai
 
 if ($LASTEXITCODE -ne 0) {
     Write-Host "Index build failed."
     exit 1
 }
 
-# Step 2: Verify artefacts exist in repo root
-if (!(Test-Path "docs.pkl")) {
-    Write-Host "docs.pkl not found in repo root."
+# Step 2: Verify the builder published a complete version (index/CURRENT -> index/<version>/)
+if (!(Test-Path "index/CURRENT")) {
+    Write-Host "index/CURRENT not found."
     exit 1
 }
 
-if (!(Test-Path "faiss.index")) {
-    Write-Host "faiss.index not found in repo root."
-    exit 1
+$version = (Get-Content "index/CURRENT" -Raw).Trim()
+foreach ($f in @("faiss.index", "chunks.bin", "chunks.offsets.npy")) {
+    if (!(Test-Path "index/$version/$f")) {
+        Write-Host "index/$version/$f not found."
+        exit 1
+    }
 }
 
-Write-Host "Index artefacts generated successfully."
+Write-Host "Index version $version generated successfully."
 
-# Step 3: Stage artefacts
-git add docs.pkl faiss.index
+# Step 3: Stage artefacts (new version, CURRENT pointer, pruned old versions)
+git add -A index
 
 # Step 4: Commit only if there are changes
 $changes = git status --porcelain
 
 if ($changes) {
-    git commit -m "Rebuild FAISS index after updating knowledge sources"
+    git commit -m "Rebuild FAISS index ($version) after updating knowledge sources"
     Write-Host "Index committed locally."
 } else {
     Write-Host "No index changes detected. Nothing to commit."
 }
 
 Write-Host "If ready, run: git push"
+Write-Host "Running servers pick up index/CURRENT on their own (INDEX_WATCH_INTERVAL) or via POST /admin/reload-index."